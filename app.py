@@ -1,9 +1,282 @@
 import streamlit as st
 import os
+import shutil
 import tempfile
-from your_script import process_two_pdfs
+import zipfile
+from your_script import (DIAGRAM_CACHE_MB, DOCUMENT_CACHE_MB, MemoryBudgetExceeded, pair_documents,
+                         process_two_pdfs)
+from disk_cache import DEFAULT_CACHE_DIR
+from flight_store import FlightStore
+from job_queue import JobCancelled, JobQueue, QueueFull, publish_partial
+from isolation import process_two_pdfs_isolated
+from metrics import METRICS_PORT, start_http_server
 from datetime import datetime
-import time
+
+# История разобранных планов (SQLite); не задана — планы не сохраняются
+FLIGHTLOG_DB = os.environ.get("FLIGHTLOG_DB")
+
+# Отчёт больше этого размера держится во временном файле на диске, а не в памяти
+REPORT_SPOOL_BYTES = 4 * 1024 * 1024
+
+# Обработка в отдельном процессе с таймаутом и лимитами (isolation.py); 0 — в потоке сервера
+FLIGHTLOG_ISOLATION = os.environ.get("FLIGHTLOG_ISOLATION", "1") != "0"
+
+# Форматы отчёта: подпись кнопки скачивания и MIME
+REPORT_FORMATS = {
+    "xlsx": ("Excel Report", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "pdf": ("Print-ready PDF Flight Log", "application/pdf"),
+}
+
+# Подписи состояний пар в таблице обработки
+STATUS_LABELS = {
+    "queued": "⏳ Queued",
+    "running": "⚙️ Running",
+    "done": "✅ Done",
+    "failed": "❌ Failed",
+    "expired": "⚠️ Expired",
+    "rejected": "⏳ Server busy",
+    "cancelled": "🚫 Cancelled",
+}
+
+
+def pair_uploads(uploads):
+    """Пары загруженных файлов (pair_documents)
+
+    Скрипт перезапускается при каждом действии (скачивание, отмена, опрос
+    очереди), поэтому подбор запоминается в session_state для набора
+    загрузок (file_id, имя, размер): PDF открываются только при новом наборе.
+    Источники (буферы загрузок) в запомненном результате не хранятся.
+    """
+    key = tuple((upload.file_id, name, upload.size) for name, upload in uploads.items())
+    cached = st.session_state.get("pairing")
+    if cached is None or cached[0] != key:
+        pairing = pair_documents([(name, upload.getbuffer()) for name, upload in uploads.items()])
+        pairing["pairs"] = [
+            {k: v for k, v in pair.items() if k not in ("main", "takeoff")} for pair in pairing["pairs"]
+        ]
+        cached = (key, pairing)
+        st.session_state["pairing"] = cached
+    return cached[1]
+
+
+def spool_upload(uploaded_file):
+    """Сохраняет загруженный файл во временный файл по частям, без копии в памяти"""
+    uploaded_file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        shutil.copyfileobj(uploaded_file, tmp, length=1024 * 1024)
+    return tmp.name
+
+
+@st.cache_resource
+def get_job_queue():
+    """Общая очередь обработки для всех сессий сервера (FLIGHTLOG_WORKERS воркеров)"""
+    return JobQueue()
+
+
+@st.cache_resource
+def get_metrics_server():
+    """Эндпоинт /metrics, один на сервер; FLIGHTLOG_METRICS_PORT не задан — не запускается"""
+    if not METRICS_PORT:
+        return None
+    return start_http_server()
+
+
+def run_processing_job(file1_path, file2_path, name1, name2, profile="full", formats=("xlsx",)):
+    """Задача очереди: обрабатывает пару временных файлов и удаляет их
+
+    Возвращает ({формат: файл с отчётом}, метрики запуска). С FLIGHTLOG_ISOLATION
+    обработка идёт в дочернем процессе, который пишет отчёты во временные
+    файлы; иначе отчёты пишутся прямо в SpooledTemporaryFile, без копии bytes.
+    """
+    if FLIGHTLOG_ISOLATION:
+        return run_isolated_job(file1_path, file2_path, name1, name2, profile, formats)
+    
+    reports = {
+        fmt: tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_BYTES, suffix=f".{fmt}")
+        for fmt in formats
+    }
+    main_format = "xlsx" if "xlsx" in reports else "pdf"
+    metrics = {}
+    try:
+        process_two_pdfs(
+            file1_path,
+            file2_path,
+            name1,
+            name2,
+            metrics=metrics,
+            store=FlightStore(FLIGHTLOG_DB) if FLIGHTLOG_DB else None,
+            output=reports[main_format],
+            profile=profile,
+            output_format=main_format,
+            pdf_output=reports.get("pdf") if main_format == "xlsx" else None,
+            on_parsed=publish_partial
+        )
+    except Exception:
+        for report in reports.values():
+            report.close()
+        raise
+    finally:
+        os.unlink(file1_path)
+        os.unlink(file2_path)
+    return reports, metrics
+
+
+def run_isolated_job(file1_path, file2_path, name1, name2, profile, formats):
+    """run_processing_job в дочернем процессе: отчёты через временные файлы на диске"""
+    paths = {}
+    for fmt in formats:
+        fd, paths[fmt] = tempfile.mkstemp(suffix=f".{fmt}")
+        os.close(fd)
+    main_format = "xlsx" if "xlsx" in paths else "pdf"
+    try:
+        metrics = process_two_pdfs_isolated(
+            file1_path,
+            file2_path,
+            name1,
+            name2,
+            output=paths[main_format],
+            pdf_output=paths.get("pdf") if main_format == "xlsx" else None,
+            store=FlightStore(FLIGHTLOG_DB) if FLIGHTLOG_DB else None,
+            profile=profile,
+            output_format=main_format,
+            on_parsed=publish_partial
+        )
+        # Открытый файл остаётся доступен и после удаления имени
+        reports = {fmt: open(path, "rb") for fmt, path in paths.items()}
+    finally:
+        for path in paths.values():
+            os.unlink(path)
+        os.unlink(file1_path)
+        os.unlink(file2_path)
+    return reports, metrics
+
+
+def read_report(report):
+    """Источник данных для кнопки скачивания: файл отчёта с начала"""
+    report.seek(0)
+    return report
+
+
+def poll_batch(job_queue, batch):
+    """Обновляет состояние пар пакета по задачам очереди
+
+    Завершённые задачи забираются из очереди (отчёты и метрики переходят в
+    запись пары). Предпросмотр отчёта (Job.partial) переходит в запись, как
+    только задача его опубликует. Возвращает задачи, которые ещё ждут или выполняются.
+    """
+    waiting = []
+    for entry in batch:
+        if entry["status"] not in ("queued", "running"):
+            continue
+        job = job_queue.get(entry["job_id"])
+        if job is None:
+            entry["status"] = "expired"
+            entry["error"] = "The processing job has expired. Please start it again."
+        elif job.done.is_set():
+            entry["seconds"] = job.run_seconds
+            entry["preview"] = job.partial
+            try:
+                entry["reports"], entry["metrics"] = job_queue.result(entry["job_id"])
+                entry["status"] = "done"
+            except JobCancelled as e:
+                entry["status"] = "cancelled"
+                entry["error"] = str(e)
+            except Exception as e:
+                entry["status"] = "failed"
+                entry["error"] = str(e)
+                entry["memory_budget"] = isinstance(e, MemoryBudgetExceeded)
+            finally:
+                job_queue.forget(entry["job_id"])
+        else:
+            entry["status"] = "running" if job.started_at else "queued"
+            entry["position"] = job_queue.position(entry["job_id"])
+            entry["seconds"] = job.run_seconds if job.started_at else job.wait_seconds
+            entry["preview"] = job.partial
+            waiting.append(job)
+    return waiting
+
+
+def batch_table(batch):
+    """Таблица состояния пар: файлы, статус (с местом в очереди), время"""
+    statuses = []
+    for entry in batch:
+        label = STATUS_LABELS[entry["status"]]
+        if entry["status"] == "queued" and entry.get("position"):
+            label += f" (#{entry['position']})"
+        statuses.append(label)
+    return {
+        "Navlog": [entry["main_name"] for entry in batch],
+        "Takeoff": [entry["takeoff_name"] for entry in batch],
+        "Status": statuses,
+        "Time, s": [None if entry["seconds"] is None else round(entry["seconds"], 1) for entry in batch],
+    }
+
+
+def show_preview(batch):
+    """Предпросмотр листов Main_Route_Grid и Generated_Sheet пар, для которых он уже готов"""
+    for entry in batch:
+        for leg in entry.get("preview") or ():
+            sheets = f"Main_Route_Grid{leg['title']}, Generated_Sheet{leg['title']}"
+            with st.expander(f"👁️ Preview ({entry['main_name']}): {sheets}"):
+                st.dataframe(leg["route_grid"], hide_index=True, use_container_width=True)
+                st.markdown(leg["generated_sheet"], unsafe_allow_html=True)
+
+
+def storage_notes():
+    """Что остаётся на диске после обработки - по текущим настройкам кэшей и истории"""
+    notes = []
+    if DOCUMENT_CACHE_MB > 0:
+        notes.append(f"- Parsed plans (route, airports, Takeoff data, header snapshot) are cached in "
+                     f"`{DEFAULT_CACHE_DIR}` (owner-only folder), up to {DOCUMENT_CACHE_MB:g} MB, oldest evicted first")
+    if DIAGRAM_CACHE_MB > 0:
+        notes.append(f"- Resized airport diagrams are cached in `{DEFAULT_CACHE_DIR}`, up to {DIAGRAM_CACHE_MB:g} MB")
+    if FLIGHTLOG_DB:
+        notes.append("- Parsed plans are saved to the flight history database (FlightStore)")
+    if not notes:
+        notes.append("- Nothing is kept after processing")
+    return "\n".join(notes)
+
+
+def batch_zip(batch):
+    """Архив отчётов пакета во временном файле: <имя навлога>.<формат> для каждой пары"""
+    archive = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_BYTES, suffix=".zip")
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+        for entry in batch:
+            stem = os.path.splitext(entry["main_name"])[0]
+            for fmt, report in entry["reports"].items():
+                with zf.open(f"{stem}.{fmt}", "w") as member:
+                    shutil.copyfileobj(read_report(report), member, length=1024 * 1024)
+    archive.seek(0)
+    return archive
+
+
+def close_batch(batch):
+    """Закрывает временные файлы отчётов прошлого пакета"""
+    for entry in batch:
+        for report in entry["reports"].values():
+            report.close()
+
+
+def download_report(report):
+    """Данные кнопки скачивания: отчёт читается из временного файла по нажатию, файл затем закрывается"""
+    def data():
+        try:
+            return read_report(report).read()
+        finally:
+            report.close()
+    return data
+
+
+def download_batch(batch):
+    """Данные кнопки скачивания архива: архив собирается по нажатию, файлы отчётов затем закрываются"""
+    def data():
+        try:
+            with batch_zip(batch) as archive:
+                return archive.read()
+        finally:
+            close_batch(batch)
+    return data
+
 
 # Настройки страницы
 st.set_page_config(
@@ -12,6 +285,9 @@ st.set_page_config(
     layout="wide"
 )
 
+# Метрики обработки для Prometheus (FLIGHTLOG_METRICS_PORT)
+get_metrics_server()
+
 # Стили
 st.markdown("""
 <style>
@@ -77,15 +353,15 @@ st.markdown("""
 
 # Заголовок
 st.markdown('<h1 class="main-title">✈️ Advanced Flight Log Processor</h1>', unsafe_allow_html=True)
-st.markdown('<p class="subtitle">Upload two PDF files to generate a comprehensive 6-sheet flight log report</p>', unsafe_allow_html=True)
+st.markdown('<p class="subtitle">Upload navlogs with their Takeoff files to generate comprehensive 6-sheet flight log reports</p>', unsafe_allow_html=True)
 
 # Информация о системе
 st.markdown("""
 <div class="info-card">
 <h4>📋 What this advanced tool does:</h4>
 <ul>
-<li><b>1. Takes two PDF files</b> - one with Takeoff data and one with main route</li>
-<li><b>2. Automatically detects</b> which file contains Takeoff information</li>
+<li><b>1. Takes PDF files in pairs</b> - one with Takeoff data and one with main route per flight</li>
+<li><b>2. Automatically detects</b> which files contain Takeoff information and pairs them</li>
 <li><b>3. Creates a comprehensive Excel report</b> with <b>6 sheets</b>:</li>
 <div style="margin-left: 20px;">
 <div><span class="sheet-badge">Основное</span> - Basic flight information</div>
@@ -103,125 +379,195 @@ st.markdown("""
 st.markdown("---")
 st.subheader("📤 Upload PDF Files")
 
-col1, col2 = st.columns(2)
-
-with col1:
-    uploaded_file1 = st.file_uploader(
-        "First PDF file",
-        type=['pdf'],
-        help="PDF file (either Takeoff or main route)",
-        key="file1"
-    )
-
-with col2:
-    uploaded_file2 = st.file_uploader(
-        "Second PDF file", 
-        type=['pdf'],
-        help="PDF file (the other one of the pair)",
-        key="file2"
-    )
-
-# Отображение информации о файлах
-if uploaded_file1 and uploaded_file2:
+uploaded_files = st.file_uploader(
+    "PDF files",
+    type=['pdf'],
+    accept_multiple_files=True,
+    help="Navlogs and their Takeoff files, any number of flights at once",
+    key="files"
+)
+
+# Отображение информации о файлах и найденных парах
+if uploaded_files:
     st.markdown("---")
     st.subheader("📋 Uploaded Files")
     
-    # Создаем карточки для файлов
-    file_col1, file_col2 = st.columns(2)
+    names = [uploaded_file.name for uploaded_file in uploaded_files]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    uploads = {uploaded_file.name: uploaded_file for uploaded_file in uploaded_files}
+    pairing = pair_uploads(uploads)
     
-    with file_col1:
-        st.markdown(f"""
-        <div class="file-card">
-        <h4>📄 File 1</h4>
-        <p><b>Name:</b> {uploaded_file1.name}</p>
-        <p><b>Size:</b> {uploaded_file1.size / 1024:.1f} KB</p>
-        <p><b>Type:</b> PDF</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with file_col2:
-        st.markdown(f"""
-        <div class="file-card">
-        <h4>📄 File 2</h4>
-        <p><b>Name:</b> {uploaded_file2.name}</p>
-        <p><b>Size:</b> {uploaded_file2.size / 1024:.1f} KB</p>
-        <p><b>Type:</b> PDF</p>
-        </div>
-        """, unsafe_allow_html=True)
+    if pairing["pairs"]:
+        st.table({
+            "Navlog": [pair["main_name"] for pair in pairing["pairs"]],
+            "Takeoff": [pair["takeoff_name"] for pair in pairing["pairs"]],
+            "Matched by": [
+                f"airports {', '.join(pair['airports'])}" if pair["airports"] else pair["matched_by"]
+                for pair in pairing["pairs"]
+            ],
+            "Size, KB": [
+                round((uploads[pair["main_name"]].size + uploads[pair["takeoff_name"]].size) / 1024, 1)
+                for pair in pairing["pairs"]
+            ],
+        })
+    for unpaired in pairing["unpaired"]:
+        st.warning(f"⚠️ {unpaired['name']}: {unpaired['reason']}")
     
     # Проверка на одинаковые имена
-    if uploaded_file1.name == uploaded_file2.name:
-        st.error("❌ Error: Files have the same name. Please upload different files.")
+    if duplicates:
+        st.error(f"❌ Error: Files have the same name: {', '.join(duplicates)}. Please upload different files.")
+    elif not pairing["pairs"]:
+        st.error("❌ Error: No navlog + Takeoff pairs found. Upload each navlog together with its Takeoff file.")
     else:
         # Дополнительная информация
-        st.info("💡 The system will automatically detect which file contains 'Takeoff' information.")
+        st.info("💡 Files are paired automatically: Takeoff files are detected by content, "
+                "pairs are matched by airport codes in the headers, then by file name.")
         
         # Кнопка обработки
         st.markdown("---")
         st.subheader("🚀 Processing")
         
-        if st.button("Start Advanced Processing", type="primary", use_container_width=True):
-            try:
-                # Контейнер для прогресса
-                progress_container = st.container()
-                
-                with progress_container:
-                    st.markdown("### Processing Progress")
-                    
-                    # Показываем прогресс
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    # Шаг 1: Анализ файлов
-                    status_text.text("Step 1/6: Analyzing files and detecting Takeoff...")
-                    progress_bar.progress(15)
-                    time.sleep(0.5)
-                    
-                    # Шаг 2: Чтение PDF
-                    status_text.text("Step 2/6: Reading and parsing PDF files...")
-                    progress_bar.progress(30)
-                    
-                    # Получаем байты файлов
-                    file1_bytes = uploaded_file1.getvalue()
-                    file2_bytes = uploaded_file2.getvalue()
-                    
-                    # Шаг 3: Обработка
-                    status_text.text("Step 3/6: Processing main route data...")
-                    progress_bar.progress(45)
-                    
-                    # Обрабатываем файлы
-                    excel_bytes = process_two_pdfs(
-                        file1_bytes, 
-                        file2_bytes,
-                        uploaded_file1.name,
-                        uploaded_file2.name
+        output_choice = st.radio(
+            "Output",
+            ["Excel workbook", "Print-ready PDF flight log", "Both"],
+            horizontal=True,
+            help="The PDF contains the Generated_Sheet flight log laid out for A4 printing"
+        )
+        output_formats = {
+            "Excel workbook": ("xlsx",),
+            "Print-ready PDF flight log": ("pdf",),
+            "Both": ("xlsx", "pdf"),
+        }[output_choice]
+        
+        compact_output = st.checkbox(
+            "Compact output (smaller images, maximum compression)",
+            help="Useful on slow connections: diagrams and the header clip are re-encoded"
+        )
+        
+        n_pairs = len(pairing["pairs"])
+        button_label = "Start Advanced Processing" + (f" ({n_pairs} flights)" if n_pairs > 1 else "")
+        if st.button(button_label, type="primary", use_container_width=True):
+            close_batch(st.session_state.pop("batch", []))
+            
+            # Каждая пара — отдельная задача общей очереди; файлы удалит сама задача
+            batch = []
+            for pair in pairing["pairs"]:
+                entry = {
+                    "main_name": pair["main_name"],
+                    "takeoff_name": pair["takeoff_name"],
+                    "job_id": None,
+                    "status": "queued",
+                    "seconds": None,
+                    "error": None,
+                    "reports": {},
+                    "metrics": {},
+                    "preview": None,
+                }
+                main_path = spool_upload(uploads[pair["main_name"]])
+                takeoff_path = spool_upload(uploads[pair["takeoff_name"]])
+                try:
+                    entry["job_id"] = get_job_queue().submit(
+                        run_processing_job,
+                        main_path,
+                        takeoff_path,
+                        pair["main_name"],
+                        pair["takeoff_name"],
+                        profile="compact" if compact_output else "full",
+                        formats=output_formats
                     )
-                    
-                    # Шаг 4: Создание дополнительных листов
-                    status_text.text("Step 4/6: Creating Airport and Takeoff sheets...")
-                    progress_bar.progress(60)
-                    time.sleep(0.5)
-                    
-                    # Шаг 5: Генерация итогового листа
-                    status_text.text("Step 5/6: Generating final formatted sheet...")
-                    progress_bar.progress(75)
-                    time.sleep(0.5)
-                    
-                    # Шаг 6: Завершение
-                    status_text.text("Step 6/6: Finalizing and preparing download...")
-                    progress_bar.progress(100)
-                    time.sleep(0.5)
+                except QueueFull:
+                    os.unlink(main_path)
+                    os.unlink(takeoff_path)
+                    entry["status"] = "rejected"
+                    entry["error"] = "The server is busy right now. Please try again in a minute."
+                batch.append(entry)
+            st.session_state["batch"] = batch
+        
+        job_queue = get_job_queue()
+        batch = st.session_state.get("batch", [])
+        
+        if any(entry["status"] in ("queued", "running") for entry in batch):
+            # Контейнер для прогресса
+            progress_container = st.container()
+            
+            with progress_container:
+                st.markdown("### Processing Progress")
+                
+                # Отмена: нажатие перезапускает скрипт, и задачи пакета отменяются
+                if st.button("⏹️ Cancel processing", key="cancel_batch"):
+                    for entry in batch:
+                        if entry["job_id"]:
+                            job_queue.cancel(entry["job_id"])
                 
-                # Успешное завершение
-                st.markdown('<div class="success-card">', unsafe_allow_html=True)
-                st.success("✅ Advanced processing completed successfully!")
-                st.markdown("</div>", unsafe_allow_html=True)
+                # Состояние пар обновляется по мере завершения задач
+                progress_bar = st.progress(0)
+                status_table = st.empty()
                 
-                # Генерируем имя выходного файла
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                output_filename = f"Flight_Log_Report_Advanced_{timestamp}.xlsx"
+                # Предпросмотр появляется после разбора, до сборки книги и PDF
+                preview_area = st.empty()
+                shown = []
                 
-                # Информация о созданном файле
+                while True:
+                    waiting = poll_batch(job_queue, batch)
+                    finished = len(batch) - len(waiting)
+                    progress_bar.progress(int(100 * finished / len(batch)))
+                    status_table.table(batch_table(batch))
+                    previews = [id(entry["preview"]) if entry["preview"] else None for entry in batch]
+                    if previews != shown:
+                        with preview_area.container():
+                            show_preview(batch)
+                        shown = previews
+                    if not waiting:
+                        break
+                    waiting[0].done.wait(0.5)
+                
+                # Готовые предпросмотры дальше показываются вместе с результатами
+                preview_area.empty()
+            
+            st.session_state["report_time"] = datetime.now()
+            if any(entry["status"] == "done" for entry in batch):
+                st.balloons()
+        elif batch:
+            st.table(batch_table(batch))
+        
+        succeeded = [entry for entry in batch if entry["status"] == "done"]
+        failed = [entry for entry in batch if entry["status"] != "done"]
+        
+        if failed:
+            st.markdown('<div class="error-card">', unsafe_allow_html=True)
+            for entry in failed:
+                st.error(f"❌ Processing Error ({entry['main_name']}): {entry['error']}")
+            st.markdown("</div>", unsafe_allow_html=True)
+            
+            # Отказ по бюджету памяти: подсказки про битые файлы тут не помогут
+            if any(entry.get("memory_budget") for entry in failed):
+                st.info("Try a smaller export of the plan, e.g. without scanned pages or with lower-resolution diagrams.")
+            else:
+                # Дополнительная информация
+                st.warning("""
+                **Troubleshooting tips:**
+                1. Ensure the PDF files are valid and not corrupted
+                2. Make sure each navlog is uploaded with its Takeoff file
+                3. Check that files are not password protected
+                4. Try with smaller files if possible
+                """)
+            
+            # Кнопка для повторной попытки
+            if not succeeded and st.button("🔄 Try Again", type="secondary"):
+                close_batch(st.session_state.pop("batch", []))
+                st.rerun()
+        
+        if succeeded:
+            # Успешное завершение
+            st.markdown('<div class="success-card">', unsafe_allow_html=True)
+            st.success(f"✅ Advanced processing completed successfully! ({len(succeeded)} of {len(batch)} flights)")
+            st.markdown("</div>", unsafe_allow_html=True)
+            
+            # Генерируем имя выходного файла
+            timestamp = st.session_state["report_time"].strftime('%Y%m%d_%H%M%S')
+            
+            # Информация о содержимом файла
+            if "xlsx" in succeeded[0]["reports"]:
                 st.markdown("""
                 <div class="info-card">
                 <h4>📊 Generated Advanced Report Contains 6 Sheets:</h4>
@@ -235,46 +581,81 @@ if uploaded_file1 and uploaded_file2:
                 </div>
                 </div>
                 """, unsafe_allow_html=True)
+            
+            # Кнопки скачивания: отчёт читается из временного файла только по нажатию
+            # (отложенный data), после скачивания временный файл закрывается
+            downloaded_note = "✅ Downloaded: the temporary report file is released. Process the files again to download it once more."
+            if len(batch) == 1:
+                output_basename = f"Flight_Log_Report_Advanced_{timestamp}"
+                for fmt, report in succeeded[0]["reports"].items():
+                    label, mime = REPORT_FORMATS[fmt]
+                    output_filename = f"{output_basename}.{fmt}"
+                    if report.closed:
+                        st.caption(f"{output_filename} - {downloaded_note}")
+                        continue
+                    st.download_button(
+                        label=f"⬇️ Download {label}: {output_filename}",
+                        data=download_report(report),
+                        file_name=output_filename,
+                        mime=mime,
+                        type="primary",
+                        use_container_width=True,
+                        key=f"download_{fmt}"
+                    )
+            else:
+                # Все отчёты одним архивом, по отчёту на пару
+                output_filename = f"Flight_Log_Reports_Advanced_{timestamp}.zip"
+                if all(report.closed for entry in succeeded for report in entry["reports"].values()):
+                    st.caption(f"{output_filename} - {downloaded_note}")
+                else:
+                    st.download_button(
+                        label=f"⬇️ Download all reports: {output_filename}",
+                        data=download_batch(succeeded),
+                        file_name=output_filename,
+                        mime="application/zip",
+                        type="primary",
+                        use_container_width=True,
+                        key="download_zip"
+                    )
+            
+            for entry in succeeded:
+                title = f" ({entry['main_name']})" if len(batch) > 1 else ""
+                metrics = entry["metrics"]
                 
-                # Кнопка скачивания
-                st.download_button(
-                    label=f"⬇️ Download Advanced Excel Report: {output_filename}",
-                    data=excel_bytes,
-                    file_name=output_filename,
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    type="primary",
-                    use_container_width=True
-                )
-                
-                # Дополнительная информация
-                st.info("""
-                **Advanced Features:**
-                - **Takeoff Data Analysis**: Extracts and processes Takeoff performance data
-                - **Airport Maps**: Extracts airport diagrams from PDF
-                - **Formatted Flight Log**: Creates professional flight log with proper formatting
-                - **Data Integration**: Combines data from both PDF files intelligently
-                """)
-                
-                # Анимация успеха
-                st.balloons()
-                
-            except Exception as e:
-                st.markdown('<div class="error-card">', unsafe_allow_html=True)
-                st.error(f"❌ Processing Error: {str(e)}")
-                st.markdown("</div>", unsafe_allow_html=True)
-                
-                # Дополнительная информация об ошибке
-                st.warning("""
-                **Troubleshooting tips:**
-                1. Ensure both PDF files are valid and not corrupted
-                2. Make sure one file contains 'Takeoff' information
-                3. Check that files are not password protected
-                4. Try with smaller files if possible
-                """)
+                # Размер отчёта по листам
+                size_breakdown = metrics.get("size_breakdown")
+                if size_breakdown:
+                    total_kb = metrics["output_bytes"] / 1024
+                    with st.expander(f"📦 Report size{title}: {total_kb:.1f} KB"):
+                        st.table({
+                            "Part": list(size_breakdown["sheets"]) + ["Styles and shared data"],
+                            "KB": [round(size / 1024, 1) for size in size_breakdown["sheets"].values()]
+                                  + [round(size_breakdown["shared"] / 1024, 1)],
+                        })
                 
-                # Кнопка для повторной попытки
-                if st.button("🔄 Try Again", type="secondary"):
-                    st.rerun()
+                # Отчёт о запуске: время и память по этапам
+                stages = metrics.get("stages")
+                if stages:
+                    peak_mb = max(stage.get("rss_peak_mb", 0) for stage in stages.values())
+                    with st.expander(f"⏱️ Run report{title}: peak memory {peak_mb:.0f} MB"):
+                        st.table({
+                            "Stage": list(stages),
+                            "Seconds": [round(stage["seconds"], 3) for stage in stages.values()],
+                            "RSS, MB": [stage.get("rss_mb") for stage in stages.values()],
+                            "Peak RSS, MB": [stage.get("rss_peak_mb") for stage in stages.values()],
+                        })
+            
+            # Предпросмотр листов отчёта
+            show_preview(succeeded)
+            
+            # Дополнительная информация
+            st.info("""
+            **Advanced Features:**
+            - **Takeoff Data Analysis**: Extracts and processes Takeoff performance data
+            - **Airport Maps**: Extracts airport diagrams from PDF
+            - **Formatted Flight Log**: Creates professional flight log with proper formatting
+            - **Data Integration**: Combines data from both PDF files intelligently
+            """)
 
 # Боковая панель
 with st.sidebar:
@@ -285,7 +666,8 @@ with st.sidebar:
     This advanced tool processes flight log PDF files and creates comprehensive Excel reports with 6 sheets.
     
     ### 📁 Input Requirements:
-    - **Two PDF files** (one with Takeoff, one with main route)
+    - **Two PDF files per flight** (one with Takeoff, one with main route)
+    - **Several flights at once** - pairs are matched automatically, reports come as a zip
     - **PDF format** from flight planning systems
     - **Maximum size**: 50MB per file
     
@@ -304,13 +686,17 @@ with st.sidebar:
     - **Pillow** - Image processing
     - **Streamlit** - Web interface
     
-    ### 🔒 Privacy & Security:
-    - Files processed in memory only
-    - No permanent storage
-    - All data deleted after processing
-    - Secure HTTPS connection
     """)
     
+    # Кэши и история включаются настройками сервера - текст собирается по ним
+    st.markdown(f"""
+### 🔒 Privacy & Security:
+- Uploads spooled to temporary files, removed after processing
+{storage_notes()}
+- The parsed-plan cache is off unless FLIGHTLOG_DOCUMENT_CACHE_MB is set; FLIGHTLOG_DIAGRAM_CACHE_MB=0 disables the diagram cache
+- Secure HTTPS connection
+""")
+    
     # Проверка скрипта
     st.markdown("---")
     if os.path.exists("your_script.py"):
@@ -0,0 +1,173 @@
+# bench_legs.py
+"""
+Замер разбора многоучасткового навлога: участки по очереди против пула
+процессов (parse_legs).
+
+Синтетический план из --legs участков разбирается parse_main_document
+с workers=1 и с --workers процессами. Параллельный разбор должен занимать
+примерно столько же, сколько самый долгий участок: отношение ко времени
+самого долгого участка при последовательном разборе не больше --max-ratio.
+Проверка пропускается, если ядер меньше, чем процессов.
+
+--app замеряет конфигурацию приложения по умолчанию: --plans таких планов
+обрабатываются изолированно (process_two_pdfs_isolated) в JobQueue на
+--queue-workers воркерах (по умолчанию FLIGHTLOG_WORKERS). Сравниваются
+процессы разбора страниц по умолчанию (default_page_workers), 1 на обработку
+и по числу ядер на каждую обработку; по умолчанию пакет должен обрабатываться
+не дольше лучшего из двух других вариантов, умноженного на --max-slowdown.
+
+Запуск:
+    python bench_legs.py
+    python bench_legs.py --legs 6 --waypoints 40 --workers 6 --json legs.json
+    python bench_legs.py --app --plans 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def timed_parse(source, workers, repeat):
+    """Лучшее время parse_main_document и время участков последнего прогона"""
+    import fitz
+    import your_script
+
+    best, legs = None, None
+    for _ in range(repeat):
+        doc = fitz.open(stream=source, filetype="pdf")
+        metrics = {}
+        your_script.PAGE_WORKERS = workers
+        started = time.perf_counter()
+        your_script.parse_main_document(doc, metrics=metrics, source=source)
+        elapsed = time.perf_counter() - started
+        doc.close()
+        if best is None or elapsed < best:
+            best, legs = elapsed, metrics["legs"]
+    return best, legs
+
+
+def timed_batch(main_path, takeoff_path, plans, queue_workers, page_workers, directory):
+    """Время пакета из plans изолированных обработок в JobQueue и время первой из них"""
+    from isolation import process_two_pdfs_isolated
+    from job_queue import JobQueue
+
+    queue = JobQueue(max_workers=queue_workers, max_pending=0)
+    try:
+        started = time.perf_counter()
+        job_ids = [
+            queue.submit(process_two_pdfs_isolated, main_path, takeoff_path, "main.pdf", "takeoff.pdf",
+                         os.path.join(directory, f"report-{k}.xlsx"), page_workers=page_workers)
+            for k in range(plans)
+        ]
+        seconds = [queue.result(job_id)["isolation"]["seconds"] for job_id in job_ids]
+        return time.perf_counter() - started, seconds[0]
+    finally:
+        queue.shutdown()
+
+
+def app_benchmark(args):
+    """Пакет многоучастковых планов в конфигурации приложения (--app)"""
+    from job_queue import MAX_WORKERS
+    from synthetic_plans import make_navlog_pdf, make_takeoff_pdf
+
+    queue_workers = args.queue_workers or MAX_WORKERS
+    cpus = os.cpu_count() or 1
+    variants = {"default": None, "sequential": 1, "per-core": cpus}
+    # Процессов по умолчанию в потоке-воркере очереди (default_page_workers без FLIGHTLOG_PAGE_WORKERS)
+    default_workers = int(os.environ.get("FLIGHTLOG_PAGE_WORKERS", "0")) or max(1, cpus // queue_workers)
+
+    with tempfile.TemporaryDirectory() as directory:
+        main_path = os.path.join(directory, "main.pdf")
+        takeoff_path = os.path.join(directory, "takeoff.pdf")
+        with open(main_path, "wb") as f:
+            f.write(make_navlog_pdf(n_waypoints=args.waypoints, legs=args.legs))
+        with open(takeoff_path, "wb") as f:
+            f.write(make_takeoff_pdf())
+
+        # Прогрев: запуск forkserver не входит в замер
+        timed_batch(main_path, takeoff_path, 1, 1, 1, directory)
+        results = {}
+        for name, page_workers in variants.items():
+            results[name] = min(
+                timed_batch(main_path, takeoff_path, args.plans, queue_workers, page_workers, directory)
+                for _ in range(args.repeat)
+            )
+            print(f"{name:>10} (page workers {page_workers or default_workers}): batch of {args.plans} "
+                  f"{results[name][0]:.2f} s, one plan {results[name][1]:.2f} s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cpus": cpus, "queue_workers": queue_workers, "plans": args.plans,
+                       "batch_s": {name: r[0] for name, r in results.items()},
+                       "plan_s": {name: r[1] for name, r in results.items()}}, f, indent=2)
+
+    if cpus == 1:
+        print("SKIP: 1 CPU, all variants use one process per plan")
+        return 0
+    best = min(results["sequential"][0], results["per-core"][0])
+    if results["default"][0] > best * args.max_slowdown:
+        print(f"FAIL: default page workers {results['default'][0] / best:.2f}x the best variant "
+              f"(limit {args.max_slowdown:.2f}x)")
+        return 1
+    print("OK")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sequential vs pooled multi-leg navlog parsing")
+    parser.add_argument("--legs", type=int, default=6)
+    parser.add_argument("--waypoints", type=int, default=30, help="строк маршрута на участок")
+    parser.add_argument("--workers", type=int, default=None, help="процессов пула (по умолчанию --legs)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-ratio", type=float, default=2.0,
+                        help="допустимое отношение параллельного разбора к самому долгому участку")
+    parser.add_argument("--json", help="записать результаты в JSON")
+    parser.add_argument("--app", action="store_true",
+                        help="пакет планов в конфигурации приложения (isolation + JobQueue)")
+    parser.add_argument("--plans", type=int, default=8, help="планов в пакете --app")
+    parser.add_argument("--queue-workers", type=int, default=None,
+                        help="воркеров JobQueue для --app (по умолчанию FLIGHTLOG_WORKERS)")
+    parser.add_argument("--max-slowdown", type=float, default=1.2,
+                        help="допустимое отношение пакета по умолчанию к лучшему варианту (--app)")
+    args = parser.parse_args(argv)
+    args.workers = args.workers or args.legs
+
+    os.environ["FLIGHTLOG_DIAGRAM_CACHE_MB"] = "0"
+    os.environ["FLIGHTLOG_DOCUMENT_CACHE_MB"] = "0"
+    if args.app:
+        return app_benchmark(args)
+    from synthetic_plans import make_navlog_pdf
+
+    source = make_navlog_pdf(n_waypoints=args.waypoints, legs=args.legs)
+
+    # Прогрев: импорты и запуск forkserver не входят в замер
+    timed_parse(source, args.workers, 1)
+    sequential, legs = timed_parse(source, 1, args.repeat)
+    pooled, _ = timed_parse(source, args.workers, args.repeat)
+    slowest = max(leg["seconds"] for leg in legs)
+
+    for leg in legs:
+        print(f"leg page {leg['page']:3}: {leg['rows']:4} rows {leg['seconds'] * 1000:9.1f} ms")
+    print(f"sequential: {sequential * 1000:.1f} ms, pooled ({args.workers} workers): {pooled * 1000:.1f} ms, "
+          f"slowest leg: {slowest * 1000:.1f} ms, pooled / slowest: {pooled / slowest:.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"legs": legs, "sequential_s": sequential, "pooled_s": pooled,
+                       "workers": args.workers, "slowest_leg_s": slowest}, f, indent=2)
+
+    cpus = os.cpu_count() or 1
+    if cpus < args.workers:
+        print(f"SKIP: {cpus} CPU for {args.workers} workers, ratio not checked")
+        return 0
+    if pooled > slowest * args.max_ratio:
+        print(f"FAIL: pooled parse {pooled / slowest:.2f}x the slowest leg (limit {args.max_ratio:.2f}x)")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# bench_scaling.py
+"""
+Масштабный тест разбора: время этапов process_two_pdfs в зависимости от
+числа слов на разбираемых страницах.
+
+Синтетические планы (synthetic_plans) размером --sizes слов:
+  dense   - таблица маршрута из N/16 строк на одной странице (шрифт и шаг
+            строк уменьшаются, чтобы страница не превысила предельную высоту);
+  hostile - таблица на N/2 слов и страница-ловушка на N/2 слов-ориентиров:
+            ACT левее WAYPOINT в тех же строках, заголовок таблицы
+            не складывается, и наивный поиск перебирает все пары.
+
+Для каждого этапа по точкам, где этап занял не меньше --min-seconds,
+оценивается показатель степени t ~ N^k (наклон в логарифмическом масштабе).
+Проверка не проходит, если k больше --max-exponent (квадратичный этап даёт
+k около 2). Абсолютное время только печатается: оно зависит от машины.
+Та же проверка входит в pytest как test_scaling.py (отмечена slow).
+
+Запуск:
+    python bench_scaling.py
+    python bench_scaling.py --sizes 1000 10000 --scenarios dense --json scaling.json
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+DEFAULT_SIZES = (1000, 3000, 10000, 30000, 100000)
+SCENARIOS = ("dense", "hostile")
+
+# Слов на строку таблицы маршрута synthetic_plans
+WORDS_PER_ROW = 16
+
+
+def make_plan(scenario, words):
+    """Основной документ сценария на words слов"""
+    from synthetic_plans import MAX_PAGE_HEIGHT, make_navlog_pdf
+
+    table_words, decoy_words = (words, 0) if scenario == "dense" else (words - words // 2, words // 2)
+    n_waypoints = max(2, table_words // WORDS_PER_ROW)
+    row_pitch = min(14.0, (MAX_PAGE_HEIGHT - 200) / (n_waypoints + 3))
+    return make_navlog_pdf(n_waypoints=n_waypoints, row_pitch=row_pitch,
+                           font_size=min(6.0, row_pitch * 0.6), decoy_words=decoy_words)
+
+
+def run_stages(main_pdf, takeoff_pdf, repeat):
+    """Лучшее время каждого этапа process_two_pdfs за repeat запусков"""
+    from your_script import process_two_pdfs
+
+    best = {}
+    for _ in range(repeat):
+        metrics = {}
+        process_two_pdfs(main_pdf, takeoff_pdf, "plan.pdf", "plan_takeoff.pdf",
+                         metrics=metrics, record_metrics=False)
+        for stage, values in metrics["stages"].items():
+            best[stage] = min(best.get(stage, math.inf), values["seconds"])
+    return best
+
+
+def exponent(points, min_seconds):
+    """Наклон log t по log N (наименьшие квадраты) по точкам не короче min_seconds"""
+    points = [(n, t) for n, t in points if t >= min_seconds]
+    if len(points) < 2:
+        return None
+    xs = [math.log(n) for n, _ in points]
+    ys = [math.log(t) for _, t in points]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    spread = sum((x - mean_x) ** 2 for x in xs)
+    if not spread:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage scaling of process_two_pdfs with word count")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="слов на план")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--max-exponent", type=float, default=1.5,
+                        help="допустимый показатель степени t ~ N^k")
+    parser.add_argument("--min-seconds", type=float, default=0.02,
+                        help="точки короче этого не входят в оценку показателя (шум, постоянные затраты)")
+    parser.add_argument("--json", help="записать результаты в JSON")
+    args = parser.parse_args(argv)
+
+    os.environ["FLIGHTLOG_DIAGRAM_CACHE_MB"] = "0"
+    os.environ["FLIGHTLOG_DOCUMENT_CACHE_MB"] = "0"
+    from synthetic_plans import make_takeoff_pdf
+
+    takeoff_pdf = make_takeoff_pdf()
+    sizes = sorted(args.sizes)
+
+    # Прогрев: импорты pandas, openpyxl и PyMuPDF не входят в замер
+    run_stages(make_plan("dense", 200), takeoff_pdf, 1)
+
+    results = {}
+    failures = []
+    for scenario in args.scenarios:
+        timings = {}
+        for words in sizes:
+            started = time.perf_counter()
+            main_pdf = make_plan(scenario, words)
+            generated = time.perf_counter() - started
+            stages = run_stages(main_pdf, takeoff_pdf, args.repeat)
+            timings[words] = stages
+            slowest = max(stages, key=stages.get)
+            print(f"{scenario:8} {words:7} words: total {sum(stages.values()):8.3f} s, "
+                  f"slowest {slowest} {stages[slowest]:.3f} s (generated in {generated:.1f} s)")
+
+        stage_names = list(dict.fromkeys(name for stages in timings.values() for name in stages))
+        report = {}
+        print(f"{'stage':14} " + " ".join(f"{n:>9}" for n in sizes) + f" {'k':>6}")
+        for stage in stage_names:
+            points = [(n, timings[n][stage]) for n in sizes if stage in timings[n]]
+            k = exponent(points, args.min_seconds)
+            report[stage] = {"seconds": dict(points), "exponent": k}
+            print(f"{stage:14} " + " ".join(f"{t:9.3f}" for _, t in points)
+                  + f" {'-' if k is None else f'{k:.2f}':>6}")
+
+            if k is not None and k > args.max_exponent:
+                failures.append(f"{scenario}/{stage}: t ~ N^{k:.2f} (limit {args.max_exponent:.2f})")
+        results[scenario] = report
+        print()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"sizes": sizes, "max_exponent": args.max_exponent, "scenarios": results}, f, indent=2)
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# bench_startup.py
+"""
+Замер времени импорта your_script (аналог python -X importtime) с бюджетом.
+
+Запуск:
+    python bench_startup.py                  # 5 холодных запусков, бюджет 50 мс
+    python bench_startup.py --runs 10 --budget-ms 30 --top 15
+
+Код выхода 1, если медиана превышает бюджет или при импорте загружается
+тяжёлый модуль (fitz, pandas, numpy, openpyxl, PIL, docx).
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ["fitz", "pymupdf", "pandas", "numpy", "openpyxl", "PIL", "docx"]
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import(module):
+    """Один холодный импорт в новом интерпретаторе: (итог, мкс; {модуль: мкс})"""
+    code = (
+        f"import {module}, sys; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True,
+    )
+    # Поддерево импорта модуля: строки до его собственной строки верхнего уровня
+    subtree = {}
+    cumulative = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        subtree[name] = int(match.group(2))
+        if len(match.group(3)) <= 1:
+            if name == module:
+                total = int(match.group(2))
+                cumulative = subtree
+            subtree = {}
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return total, cumulative, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Startup budget for your_script")
+    parser.add_argument("--module", default="your_script")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=50.0)
+    parser.add_argument("--top", type=int, default=10, help="показать N самых тяжёлых импортов")
+    args = parser.parse_args(argv)
+
+    totals = []
+    cumulative = {}
+    loaded = []
+    for _ in range(args.runs):
+        total, cumulative, loaded = measure_import(args.module)
+        totals.append(total / 1000)
+
+    median_ms = statistics.median(totals)
+    print(f"import {args.module}: median {median_ms:.1f} ms, "
+          f"min {min(totals):.1f} ms, max {max(totals):.1f} ms ({args.runs} runs)")
+    print(f"budget: {args.budget_ms:.1f} ms")
+
+    print("heaviest imports (cumulative, last run):")
+    for name, us in sorted(cumulative.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    ok = True
+    if loaded:
+        print(f"FAIL: heavy modules loaded at import: {', '.join(loaded)}")
+        ok = False
+    if median_ms > args.budget_ms:
+        print(f"FAIL: startup {median_ms:.1f} ms exceeds budget {args.budget_ms:.1f} ms")
+        ok = False
+    if ok:
+        print("OK")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# bench_text_extraction.py
+"""
+Замер извлечения текста по этапам: полный get_text("dict") против лёгких
+режимов your_script (blocks/words, флаги без изображений, clip).
+
+Для каждого этапа сравнивается только извлечение, которое этап делал раньше
+(полные словари спанов с блоками изображений), и то, что он делает теперь;
+разбор таблиц в замер не входит. Время - минимум из --repeat повторов
+по --number вызовов.
+
+Запуск:
+    python bench_text_extraction.py                      # синтетическая пара
+    python bench_text_extraction.py --main plan.pdf --takeoff takeoff.pdf
+    python bench_text_extraction.py --waypoints 60 --number 50 --json report.json
+
+Код выхода 1, если лёгкое извлечение какого-либо этапа медленнее полного
+больше чем на --noise (на страницах без изображений флаги почти ничего
+не меняют, и время совпадает с точностью до шума).
+"""
+import argparse
+import json
+import sys
+import timeit
+
+
+def full_first_lines(doc, n=32):
+    blocks = doc[0].get_text("dict")["blocks"]
+    blocks.sort(key=lambda b: (b["bbox"][1], b["bbox"][0]))
+    lines = []
+    for block in blocks:
+        for line in block.get("lines", ()):
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                lines.append(text)
+                if len(lines) >= n:
+                    return lines
+    return lines
+
+
+def full_takeoff_split(doc):
+    # Прежний вариант: search_for по странице и отдельно полный dict
+    page = doc[0]
+    found = page.search_for("All Engines Operating")
+    if not found:
+        return [], []
+    mid_x = page.rect.x0 + page.rect.width / 2
+    left, right = [], []
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", ()):
+            if line["bbox"][1] < found[0].y0:
+                text = "".join(span["text"] for span in line["spans"]).strip()
+                if text:
+                    max_x = max(span["bbox"][2] for span in line["spans"])
+                    (left if max_x < mid_x else right).append(text)
+    return left, right
+
+
+def full_maps_titles(doc):
+    lines = []
+    for block in doc[-1].get_text("dict")["blocks"]:
+        for line in block.get("lines", ()):
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                lines.append(text)
+    return lines[:4]
+
+
+def full_header_spans(doc):
+    return doc[0].get_text("dict")["blocks"]
+
+
+def stages():
+    """Этапы: имя, документ ('main' или 'takeoff'), полное и лёгкое извлечение"""
+    from your_script import extract_first_n_lines_from_doc, index_page, page_lines, split_columns
+
+    return [
+        ("main_sheet lines", "main", full_first_lines, extract_first_n_lines_from_doc),
+        ("foreflight split", "takeoff", full_takeoff_split,
+         lambda doc: split_columns(doc[0])),
+        ("airport_maps titles", "main", full_maps_titles, lambda doc: page_lines(doc[-1], limit=4)),
+        ("header_image spans", "main", full_header_spans, lambda doc: index_page(doc[0])),
+    ]
+
+
+def best_ms(fn, doc, number, repeat):
+    return min(timeit.repeat(lambda: fn(doc), number=number, repeat=repeat)) / number * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Full vs lean PyMuPDF text extraction per stage")
+    parser.add_argument("--main", help="основной PDF (по умолчанию синтетический)")
+    parser.add_argument("--takeoff", help="PDF Takeoff (по умолчанию синтетический)")
+    parser.add_argument("--waypoints", type=int, default=30, help="строк маршрута синтетического плана")
+    parser.add_argument("--number", type=int, default=20, help="вызовов в одном замере")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--noise", type=float, default=0.1, help="допустимое замедление, доля")
+    parser.add_argument("--json", help="записать результаты в JSON")
+    args = parser.parse_args(argv)
+
+    import fitz
+    from synthetic_plans import make_navlog_pdf, make_takeoff_pdf
+
+    sources = {
+        "main": args.main or make_navlog_pdf(n_waypoints=args.waypoints),
+        "takeoff": args.takeoff or make_takeoff_pdf(),
+    }
+    docs = {
+        name: fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+        for name, source in sources.items()
+    }
+
+    results = []
+    print(f"{'stage':22} {'full, ms':>10} {'lean, ms':>10} {'saving':>8}")
+    for name, doc_name, full, lean in stages():
+        doc = docs[doc_name]
+        full_ms = best_ms(full, doc, args.number, args.repeat)
+        lean_ms = best_ms(lean, doc, args.number, args.repeat)
+        saving = 1 - lean_ms / full_ms if full_ms else 0.0
+        results.append({"stage": name, "full_ms": full_ms, "lean_ms": lean_ms, "saving": saving})
+        print(f"{name:22} {full_ms:10.3f} {lean_ms:10.3f} {saving:8.0%}")
+
+    full_total = sum(r["full_ms"] for r in results)
+    lean_total = sum(r["lean_ms"] for r in results)
+    print(f"{'total':22} {full_total:10.3f} {lean_total:10.3f} {1 - lean_total / full_total:8.0%}")
+
+    for doc in docs.values():
+        doc.close()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    slower = [r["stage"] for r in results if r["lean_ms"] > r["full_ms"] * (1 + args.noise)]
+    if slower:
+        print(f"FAIL: lean extraction slower for: {', '.join(slower)}")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
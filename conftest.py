@@ -0,0 +1,8 @@
+# conftest.py
+"""Общие настройки pytest"""
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "slow: долгие масштабные проверки (исключить: pytest -m 'not slow')"
+    )
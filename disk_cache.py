@@ -0,0 +1,140 @@
+# disk_cache.py
+"""
+Кэш на диске с ограничением по размеру.
+
+Записи — файлы с именем-ключом; при превышении max_bytes удаляются
+самые давно использованные (по mtime, который обновляется при чтении).
+Запись атомарна (os.replace), поэтому кэш можно делить между процессами.
+
+Каталог кэша доступен только владельцу (0700); каталог другого
+пользователя не используется (PermissionError).
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "FLIGHTLOG_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "flight_log"),
+)
+
+
+def digest(data):
+    """SHA-256 содержимого в hex"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def private_directory(directory):
+    """
+    Создаёт каталог с правами 0700 или сужает до них права своего каталога
+
+    Raises:
+        PermissionError: каталог принадлежит другому пользователю
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):
+        return
+    st = os.stat(directory)
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"Каталог кэша {directory} принадлежит другому пользователю")
+    if st.st_mode & 0o077:
+        os.chmod(directory, 0o700)
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 файла в hex, чтение по частям"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DiskCache:
+    """Каталог с записями bytes и вытеснением давно использованных"""
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+        private_directory(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Содержимое записи или None"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Сохраняет запись и вытесняет старые при превышении размера"""
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # Перезаписываемая запись уже учтена в размере
+            try:
+                old_size = os.stat(path).st_size
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith(".tmp-") or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Удаляет самые старые записи, пока кэш не станет меньше 90% лимита"""
+        entries = sorted(self._entries())
+        size = sum(s for _, s, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.unlink(path)
+                size -= entry_size
+            except OSError:
+                pass
+        self._size = size
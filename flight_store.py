@@ -0,0 +1,293 @@
+# flight_store.py
+"""
+Локальное хранилище разобранных планов полётов (SQLite).
+
+Каждый вызов process_two_pdfs(..., store=FlightStore(path)) сохраняет строки
+маршрута, строки таблицы аэродромов и переменные Takeoff; аналитика по истории
+выполняется запросами к индексированной базе без повторного разбора PDF.
+
+Период запросов считается по дате плана (plan_date, из самого PDF), а для
+планов без даты - по времени обработки (processed_at).
+
+Запуск:
+    python flight_store.py --db flights.db import main.pdf takeoff.pdf
+    python flight_store.py --db flights.db waypoint LFMQ --since 2026-09-01
+    python flight_store.py --db flights.db fuel LFMQ LFMV --since 2026-09-01
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+DEFAULT_DB_PATH = os.environ.get("FLIGHTLOG_DB", "flights.db")
+
+# Колонки Main_Route_Grid в порядке exact_columns
+ROUTE_COLUMNS = [
+    "waypoint", "airway", "hdg", "crs", "alt", "cmp", "wind", "isa",
+    "tas", "gs", "dist_leg", "dist_rem", "fuel_used", "fuel_rem", "fuel_act",
+    "time_leg", "time_rem", "ete", "time_act",
+]
+
+# Дата полёта в запросах: дата плана, для плана без даты - время обработки
+FLIGHT_DATE = "COALESCE(plan_date, processed_at)"
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS flights (
+    id INTEGER PRIMARY KEY,
+    processed_at TEXT NOT NULL,
+    plan_date TEXT,
+    main_name TEXT,
+    takeoff_name TEXT,
+    departure TEXT,
+    destination TEXT,
+    fuel_used REAL,
+    distance REAL
+);
+CREATE TABLE IF NOT EXISTS route_rows (
+    flight_id INTEGER NOT NULL REFERENCES flights(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    {", ".join(f"{name} TEXT" for name in ROUTE_COLUMNS)},
+    PRIMARY KEY (flight_id, seq)
+);
+CREATE TABLE IF NOT EXISTS airports (
+    flight_id INTEGER NOT NULL REFERENCES flights(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT,
+    icao TEXT,
+    cells TEXT,
+    PRIMARY KEY (flight_id, seq)
+);
+CREATE TABLE IF NOT EXISTS takeoff_vars (
+    flight_id INTEGER NOT NULL REFERENCES flights(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (flight_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_flights_date ON flights({FLIGHT_DATE});
+CREATE INDEX IF NOT EXISTS idx_flights_pair ON flights(departure, destination, {FLIGHT_DATE});
+CREATE INDEX IF NOT EXISTS idx_route_waypoint ON route_rows(waypoint, flight_id);
+CREATE INDEX IF NOT EXISTS idx_airports_icao ON airports(icao, flight_id);
+"""
+
+def _route_totals(route, numbers=None):
+    """
+    Расход топлива и дистанция плана: последние FUEL_CUM и DIST_CUM route_numbers
+
+    route_numbers различает USED на участок и нарастающим итогом; сумма
+    колонки USED для второго случая дала бы сумму нарастающих итогов.
+
+    Returns:
+        tuple: (fuel_used, distance), None - колонка без чисел
+    """
+    if numbers is None:
+        from your_script import route_numbers
+        numbers = route_numbers(route)
+    if numbers.empty:
+        return None, None
+
+    def total(values, cumulative):
+        if values.isna().all() or numbers[cumulative].isna().iloc[-1]:
+            return None
+        return round(float(numbers[cumulative].iloc[-1]), 1)
+
+    return total(numbers["FUEL_USED"], "FUEL_CUM"), total(numbers["DIST_LEG"], "DIST_CUM")
+
+
+class FlightStore:
+    """Хранилище планов: одно соединение на операцию, WAL для параллельных читателей"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._migrate(conn)
+            conn.executescript(SCHEMA)
+
+    @staticmethod
+    def _migrate(conn):
+        """
+        База прежней схемы: created_at - время обработки, итоги - сумма колонок
+
+        Колонка переименовывается в processed_at, добавляется plan_date,
+        fuel_used и distance пересчитываются по сохранённым строкам маршрута.
+        """
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(flights)")}
+        if "created_at" not in columns:
+            return
+        import pandas as pd
+
+        conn.execute("DROP INDEX IF EXISTS idx_flights_created")
+        conn.execute("DROP INDEX IF EXISTS idx_flights_pair")
+        conn.execute("ALTER TABLE flights RENAME COLUMN created_at TO processed_at")
+        conn.execute("ALTER TABLE flights ADD COLUMN plan_date TEXT")
+        for (flight_id,) in conn.execute("SELECT id FROM flights").fetchall():
+            rows = conn.execute(
+                f"SELECT {', '.join(ROUTE_COLUMNS)} FROM route_rows WHERE flight_id = ? ORDER BY seq",
+                (flight_id,),
+            ).fetchall()
+            route = pd.DataFrame([tuple(row) for row in rows], columns=ROUTE_COLUMNS)
+            fuel_used, distance = _route_totals(route) if len(route) else (None, None)
+            conn.execute("UPDATE flights SET fuel_used = ?, distance = ? WHERE id = ?",
+                         (fuel_used, distance, flight_id))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def save_plan(self, route, airports=None, variables=None, main_name=None, takeoff_name=None,
+                  plan_date=None, numbers=None, processed_at=None):
+        """
+        Сохраняет разобранный план одной транзакцией
+
+        Args:
+            route: pd.DataFrame - Main_Route_Grid (колонки exact_columns)
+            airports: pd.DataFrame - таблица аэродромов (подписи колонок из заголовка)
+            variables: dict - переменные ForeFlight
+            main_name, takeoff_name: str - имена исходных файлов
+            plan_date: str - дата плана YYYY-MM-DD (plan_date); None - в PDF её нет
+            numbers: pd.DataFrame - route_numbers(route), если уже посчитан
+            processed_at: datetime - время обработки (по умолчанию текущее, UTC)
+
+        Returns:
+            int: id записи flights
+        """
+        processed_at = (processed_at or datetime.now(timezone.utc)).strftime("%Y-%m-%dT%H:%M:%S")
+        route_values = [
+            [str(v) if v is not None else "" for v in row[:len(ROUTE_COLUMNS)]]
+            for row in route.itertuples(index=False)
+        ]
+
+        airport_rows = []
+        if airports is not None and len(airports.columns):
+            labels = [str(c) for c in airports.columns]
+            icao_col = labels.index("AIRPORT") if "AIRPORT" in labels else min(1, len(labels) - 1)
+            for row in airports.itertuples(index=False):
+                cells = dict(zip(labels, row))
+                airport_rows.append((str(row[0]).strip(), str(row[icao_col]).strip(),
+                                     json.dumps(cells, ensure_ascii=False)))
+
+        roles = {role.upper(): icao for role, icao, _ in airport_rows}
+        departure = roles.get("DEP") or (route_values[0][0] if route_values else None)
+        destination = roles.get("DEST") or (route_values[-1][0] if route_values else None)
+        fuel_used, distance = _route_totals(route, numbers)
+
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO flights (processed_at, plan_date, main_name, takeoff_name, departure,"
+                " destination, fuel_used, distance) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (processed_at, plan_date, main_name, takeoff_name, departure, destination,
+                 fuel_used, distance),
+            )
+            flight_id = cur.lastrowid
+            placeholders = ", ".join("?" * (len(ROUTE_COLUMNS) + 2))
+            conn.executemany(
+                f"INSERT INTO route_rows (flight_id, seq, {', '.join(ROUTE_COLUMNS)}) "
+                f"VALUES ({placeholders})",
+                [(flight_id, seq, *(row + [""] * (len(ROUTE_COLUMNS) - len(row))))
+                 for seq, row in enumerate(route_values)],
+            )
+            conn.executemany(
+                "INSERT INTO airports (flight_id, seq, role, icao, cells) VALUES (?, ?, ?, ?, ?)",
+                [(flight_id, seq, *row) for seq, row in enumerate(airport_rows)],
+            )
+            conn.executemany(
+                "INSERT INTO takeoff_vars (flight_id, name, value) VALUES (?, ?, ?)",
+                [(flight_id, name, str(value)) for name, value in (variables or {}).items()],
+            )
+        return flight_id
+
+    @staticmethod
+    def _period(since, until, column=FLIGHT_DATE):
+        clauses, params = [], []
+        if since:
+            clauses.append(f"{column} >= ?")
+            params.append(since)
+        if until:
+            clauses.append(f"{column} < ?")
+            params.append(until)
+        return clauses, params
+
+    def flights_through(self, waypoint, since=None, until=None):
+        """Полёты через точку маршрута за период (даты ISO, until не включается)"""
+        clauses, params = self._period(since, until)
+        where = " AND ".join(["r.waypoint = ?"] + clauses)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT DISTINCT f.id, {FLIGHT_DATE} AS flight_date, f.plan_date, f.processed_at,"
+                " f.departure, f.destination, f.main_name"
+                " FROM route_rows r JOIN flights f ON f.id = r.flight_id"
+                f" WHERE {where} ORDER BY flight_date",
+                [waypoint.upper()] + params,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def average_fuel_used(self, departure, destination, since=None, until=None):
+        """Средний расход топлива на направлении: (среднее, число полётов)"""
+        clauses, params = self._period(since, until)
+        where = " AND ".join(["f.departure = ?", "f.destination = ?", "f.fuel_used IS NOT NULL"] + clauses)
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT AVG(f.fuel_used), COUNT(*) FROM flights f WHERE {where}",
+                [departure.upper(), destination.upper()] + params,
+            ).fetchone()
+        return row[0], row[1]
+
+    def route(self, flight_id):
+        """Строки маршрута сохранённого полёта"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(ROUTE_COLUMNS)} FROM route_rows WHERE flight_id = ? ORDER BY seq",
+                (flight_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="History of parsed flight plans")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="разобрать пару PDF и сохранить")
+    p_import.add_argument("file1")
+    p_import.add_argument("file2")
+
+    p_waypoint = sub.add_parser("waypoint", help="полёты через точку")
+    p_waypoint.add_argument("waypoint")
+
+    p_fuel = sub.add_parser("fuel", help="средний расход на направлении")
+    p_fuel.add_argument("departure")
+    p_fuel.add_argument("destination")
+
+    for p in (p_waypoint, p_fuel):
+        p.add_argument("--since", help="YYYY-MM-DD")
+        p.add_argument("--until", help="YYYY-MM-DD (не включается)")
+
+    args = parser.parse_args(argv)
+    store = FlightStore(args.db)
+
+    if args.command == "import":
+        from your_script import process_two_pdfs
+        process_two_pdfs(args.file1, args.file2, os.path.basename(args.file1),
+                         os.path.basename(args.file2), store=store)
+        print("saved")
+    elif args.command == "waypoint":
+        for flight in store.flights_through(args.waypoint, args.since, args.until):
+            print(f"{flight['flight_date']}  {flight['departure']} -> {flight['destination']}"
+                  f"  #{flight['id']}  {flight['main_name'] or ''}")
+    elif args.command == "fuel":
+        avg, count = store.average_fuel_used(args.departure, args.destination, args.since, args.until)
+        if count:
+            print(f"{args.departure.upper()} -> {args.destination.upper()}: "
+                  f"{avg:.1f} average fuel used over {count} flights")
+        else:
+            print("no flights")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+# isolation.py
+"""
+Изолированная обработка: process_two_pdfs в дочернем процессе с ограничениями.
+
+Битый или огромный PDF может надолго занять MuPDF или PIL. В дочернем
+процессе такая задача не держит поток сервера и не роняет его:
+  - таймаут по часам (FLIGHTLOG_JOB_TIMEOUT, с) - по истечении процесс
+    останавливается (SIGTERM, через TERMINATE_GRACE - SIGKILL);
+  - лимит процессорного времени (FLIGHTLOG_CPU_LIMIT, с; 0 - равен таймауту)
+    и адресного пространства (FLIGHTLOG_MEMORY_LIMIT_MB; 0 - без лимита)
+    через setrlimit;
+  - отмена: cancel (threading.Event) или JobQueue.cancel для задачи очереди.
+
+Текущий этап дочерний процесс пишет в общую память (StageTimer.on_stage),
+промежуточные результаты (предпросмотр отчёта) передаёт report_partial,
+поэтому ошибки называют этап: ProcessingTimeout, ProcessingCrashed,
+ProcessingCancelled. Метрики запуска (metrics.py) учитываются в родительском
+процессе: реестр дочернего процесса пропал бы вместе с ним.
+
+На Linux процессы создаются через forkserver: сервер форков один раз
+импортирует PRELOAD_MODULES, и задача не платит за импорт pandas и PyMuPDF.
+FLIGHTLOG_START_METHOD задаёт другой способ (spawn, fork).
+"""
+import math
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.connection import wait
+
+from job_queue import JobCancelled, current_job
+
+JOB_TIMEOUT = float(os.environ.get("FLIGHTLOG_JOB_TIMEOUT", "120"))
+CPU_LIMIT = float(os.environ.get("FLIGHTLOG_CPU_LIMIT", "0"))
+MEMORY_LIMIT_MB = float(os.environ.get("FLIGHTLOG_MEMORY_LIMIT_MB", "4096"))
+START_METHOD = os.environ.get("FLIGHTLOG_START_METHOD") or (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+PRELOAD_MODULES = ["isolation", "your_script", "fitz", "numpy", "pandas", "openpyxl", "PIL.Image"]
+
+# Ожидание после SIGTERM до SIGKILL и интервал проверки отмены, с
+TERMINATE_GRACE = 2.0
+CANCEL_POLL_INTERVAL = 0.2
+STAGE_BUFFER_SIZE = 64
+
+_context = None
+_stage_buffer = None
+_conn = None
+
+
+class ProcessingTimeout(TimeoutError):
+    """Дочерний процесс превысил таймаут или лимит процессорного времени"""
+
+    def __init__(self, stage, seconds, limit="time"):
+        what = "превышен лимит процессорного времени" if limit == "cpu" else "превышено время обработки"
+        super().__init__(
+            f"Обработка прервана: {what} ({seconds:g} с) на этапе '{stage}'. "
+            "Возможно, PDF повреждён или слишком велик."
+        )
+        self.stage = stage
+        self.seconds = seconds
+        self.limit = limit
+
+    def __reduce__(self):
+        return type(self), (self.stage, self.seconds, self.limit)
+
+
+class ProcessingCrashed(RuntimeError):
+    """Дочерний процесс завершился без результата"""
+
+    def __init__(self, stage, exitcode):
+        reason = f"код {exitcode}"
+        if exitcode is not None and exitcode < 0:
+            reason = f"сигнал {signal.Signals(-exitcode).name}"
+            if exitcode == -signal.SIGKILL:
+                reason += ", вероятно, не хватило памяти"
+        super().__init__(f"Обработка аварийно завершилась на этапе '{stage}' ({reason}).")
+        self.stage = stage
+        self.exitcode = exitcode
+
+    def __reduce__(self):
+        return type(self), (self.stage, self.exitcode)
+
+
+class ProcessingCancelled(JobCancelled):
+    """Обработка отменена; дочерний процесс остановлен"""
+
+    def __init__(self, stage):
+        super().__init__(f"Обработка отменена на этапе '{stage}'.")
+        self.stage = stage
+
+    def __reduce__(self):
+        return type(self), (self.stage,)
+
+
+def get_context():
+    """Контекст multiprocessing (START_METHOD); forkserver заранее импортирует PRELOAD_MODULES"""
+    global _context
+    if _context is None:
+        context = multiprocessing.get_context(START_METHOD)
+        if START_METHOD == "forkserver":
+            context.set_forkserver_preload(PRELOAD_MODULES)
+        _context = context
+    return _context
+
+
+def report_stage(name):
+    """Записывает текущий этап в общую память (вызывается в дочернем процессе)"""
+    if _stage_buffer is not None:
+        data = name.encode("utf-8")[:STAGE_BUFFER_SIZE - 1]
+        _stage_buffer.raw = data + b"\0" * (STAGE_BUFFER_SIZE - len(data))
+
+
+def report_partial(value):
+    """Передаёт родителю промежуточный результат (вызывается в дочернем процессе)"""
+    if _conn is not None:
+        _conn.send(("partial", value))
+
+
+def _read_stage(buffer):
+    return buffer.value.decode("utf-8", "replace") or "start"
+
+
+def _set_limits(cpu_seconds, memory_mb):
+    """Мягкие лимиты процесса; жёсткие лимиты родителя не повышаются"""
+    import resource
+
+    def lower(kind, value):
+        _, hard = resource.getrlimit(kind)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(kind, (value, hard))
+
+    if cpu_seconds:
+        lower(resource.RLIMIT_CPU, math.ceil(cpu_seconds))
+    if memory_mb:
+        lower(resource.RLIMIT_AS, int(memory_mb * 2**20))
+
+
+def _child(conn, stage_buffer, cpu_seconds, memory_mb, fn, args, kwargs):
+    global _stage_buffer, _conn
+    _stage_buffer = stage_buffer
+    _conn = conn
+    try:
+        _set_limits(cpu_seconds, memory_mb)
+        message = ("ok", fn(*args, **kwargs))
+    except MemoryError as e:
+        # Отказ выделения под RLIMIT_AS приходит без текста
+        if type(e) is MemoryError:
+            e = MemoryError(f"Не хватило памяти на этапе '{_read_stage(stage_buffer)}' "
+                            f"(лимит {memory_mb:.0f} МБ).")
+        message = ("error", e)
+    except BaseException as e:
+        message = ("error", e)
+    try:
+        conn.send(message)
+    except Exception:
+        # Результат или исключение не передаются через pickle
+        error = message[1] if message[0] == "error" else None
+        conn.send(("error", RuntimeError(f"{type(error).__name__}: {error}" if error else
+                                         "Результат обработки не удалось передать")))
+    finally:
+        conn.close()
+
+
+def _stop(process):
+    process.terminate()
+    process.join(TERMINATE_GRACE)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+
+def run_isolated(fn, args=(), kwargs=None, timeout=None, cpu_seconds=None, memory_mb=None, cancel=None,
+                 on_partial=None):
+    """
+    Выполняет fn(*args, **kwargs) в дочернем процессе и возвращает результат
+
+    fn, аргументы и результат передаются через pickle. Исключение fn
+    поднимается в вызывающем процессе.
+
+    Args:
+        timeout: float - таймаут по часам, с; по умолчанию JOB_TIMEOUT
+        cpu_seconds: float - RLIMIT_CPU, с; по умолчанию CPU_LIMIT или timeout
+        memory_mb: float - RLIMIT_AS, МБ; по умолчанию MEMORY_LIMIT_MB
+        cancel: threading.Event - отмена; по умолчанию cancel_requested текущей
+                задачи JobQueue
+        on_partial: callable - вызывается со значениями report_partial из
+                    дочернего процесса
+
+    Raises:
+        ProcessingTimeout, ProcessingCrashed, ProcessingCancelled
+    """
+    timeout = JOB_TIMEOUT if timeout is None else timeout
+    cpu_seconds = (CPU_LIMIT or timeout) if cpu_seconds is None else cpu_seconds
+    memory_mb = MEMORY_LIMIT_MB if memory_mb is None else memory_mb
+    if cancel is None and current_job() is not None:
+        cancel = current_job().cancel_requested
+
+    context = get_context()
+    stage_buffer = context.RawArray("c", STAGE_BUFFER_SIZE)
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_child,
+        args=(sender, stage_buffer, cpu_seconds, memory_mb, fn, tuple(args), kwargs or {}),
+        # Не daemon: дочернему процессу нужен свой пул (разбор участков, parse_legs).
+        # Процесс останавливается явно в finally (_stop), воркеры пула - вместе с ним
+        daemon=False,
+    )
+    started = time.monotonic()
+    process.start()
+    sender.close()
+
+    try:
+        while True:
+            remaining = timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                stage = _read_stage(stage_buffer)
+                _stop(process)
+                raise ProcessingTimeout(stage, timeout)
+            if cancel is not None and cancel.is_set():
+                stage = _read_stage(stage_buffer)
+                _stop(process)
+                raise ProcessingCancelled(stage)
+
+            ready = wait([receiver, process.sentinel], min(remaining, CANCEL_POLL_INTERVAL))
+            if not ready:
+                continue
+            if receiver.poll():
+                try:
+                    status, value = receiver.recv()
+                except EOFError:
+                    pass
+                else:
+                    if status == "partial":
+                        if on_partial is not None:
+                            on_partial(value)
+                        continue
+                    process.join(TERMINATE_GRACE)
+                    if status == "error":
+                        raise value
+                    return value
+
+            # Процесс завершился, ничего не передав
+            process.join(TERMINATE_GRACE)
+            if process.is_alive():
+                continue
+            stage = _read_stage(stage_buffer)
+            if process.exitcode == -signal.SIGXCPU:
+                raise ProcessingTimeout(stage, cpu_seconds, limit="cpu")
+            raise ProcessingCrashed(stage, process.exitcode)
+    finally:
+        receiver.close()
+        if process.is_alive():
+            _stop(process)
+
+
+def _process_job(file1, file2, name1, name2, kwargs, preview=False):
+    from your_script import process_two_pdfs
+
+    metrics = {}
+    process_two_pdfs(file1, file2, name1, name2, metrics=metrics, on_stage=report_stage,
+                     record_metrics=False, on_parsed=report_partial if preview else None, **kwargs)
+    return metrics
+
+
+def process_two_pdfs_isolated(file1, file2, name1, name2, output, pdf_output=None,
+                              timeout=None, cpu_seconds=None, memory_mb=None, cancel=None,
+                              on_parsed=None, **kwargs):
+    """
+    process_two_pdfs в дочернем процессе (run_isolated)
+
+    Отчёты пишутся по путям output и pdf_output: файловые объекты между
+    процессами не передаются. Остальные именованные аргументы (profile,
+    output_format, store, memory_budget_mb, ...) передаются process_two_pdfs.
+    on_parsed вызывается в этом процессе с предпросмотром, присланным
+    дочерним (report_preview).
+
+    Returns:
+        dict: метрики запуска, в metrics["isolation"] - способ запуска и время
+              с учётом создания процесса
+    """
+    for target in (output, pdf_output):
+        if target is not None and not isinstance(target, (str, os.PathLike)):
+            raise ValueError("В изолированном режиме отчёт пишется только по пути к файлу")
+
+    from metrics import observe_run
+    from your_script import default_page_workers
+
+    record_metrics = kwargs.pop("record_metrics", True)
+    # Число процессов пула зависит от очереди этого потока; дочерний процесс её не видит
+    if kwargs.get("page_workers") is None:
+        kwargs["page_workers"] = default_page_workers()
+    started = time.perf_counter()
+    try:
+        metrics = run_isolated(
+            _process_job,
+            (file1, file2, name1, name2, dict(kwargs, output=output, pdf_output=pdf_output),
+             on_parsed is not None),
+            timeout=timeout,
+            cpu_seconds=cpu_seconds,
+            memory_mb=memory_mb,
+            cancel=cancel,
+            on_partial=on_parsed,
+        )
+    except Exception as e:
+        if record_metrics:
+            observe_run({}, time.perf_counter() - started, e)
+        raise
+    seconds = time.perf_counter() - started
+    metrics["isolation"] = {"start_method": START_METHOD, "seconds": round(seconds, 6)}
+    if record_metrics:
+        observe_run(metrics, seconds)
+    return metrics
@@ -0,0 +1,226 @@
+# job_queue.py
+"""
+Локальная очередь задач обработки с фиксированным пулом воркеров.
+
+Одновременно выполняется не больше max_workers задач, остальные ждут в
+очереди (не больше max_pending, дальше submit отказывает QueueFull), поэтому
+пик нагрузки удлиняет ожидание, а не замедляет всех сразу.
+
+Настройки по умолчанию: FLIGHTLOG_WORKERS (число воркеров, по умолчанию —
+число ядер), FLIGHTLOG_MAX_PENDING (длина очереди), FLIGHTLOG_JOB_TTL
+(сколько секунд хранить завершённые задачи).
+
+cancel() снимает задачу с очереди, а у выполняющейся выставляет
+cancel_requested: задача узнаёт о нём через current_job() (так isolation
+останавливает дочерний процесс) и завершается исключением JobCancelled.
+
+publish_partial сохраняет в задаче промежуточный результат (Job.partial) -
+например, предпросмотр отчёта, который показывается до окончания задачи.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+MAX_WORKERS = int(os.environ.get("FLIGHTLOG_WORKERS", os.cpu_count() or 2))
+MAX_PENDING = int(os.environ.get("FLIGHTLOG_MAX_PENDING", "32"))
+JOB_TTL = float(os.environ.get("FLIGHTLOG_JOB_TTL", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_local = threading.local()
+
+
+class QueueFull(RuntimeError):
+    """Очередь заполнена — задача не принята"""
+
+
+class JobCancelled(RuntimeError):
+    """Задача отменена через JobQueue.cancel"""
+
+
+def current_job():
+    """Задача, которую выполняет текущий поток-воркер, или None"""
+    return getattr(_local, "job", None)
+
+
+def current_concurrency():
+    """Сколько задач одновременно выполняет очередь текущего потока-воркера (max_workers); вне воркера 1"""
+    return getattr(_local, "max_workers", 1)
+
+
+def publish_partial(value):
+    """Промежуточный результат текущей задачи (Job.partial); вне воркера ничего не делает"""
+    job = current_job()
+    if job is not None:
+        job.partial = value
+
+
+class Job:
+    """Задача очереди: статус, результат или ошибка, отметки времени"""
+
+    def __init__(self, fn, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.result = None
+        self.partial = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+        self.cancel_requested = threading.Event()
+
+    @property
+    def wait_seconds(self):
+        end = self.started_at or time.time()
+        return end - self.submitted_at
+
+    @property
+    def run_seconds(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobQueue:
+    """Очередь FIFO с пулом потоков-воркеров и ограничением длины"""
+
+    def __init__(self, max_workers=MAX_WORKERS, max_pending=MAX_PENDING, job_ttl=JOB_TTL):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self._jobs = {}
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"flightlog-worker-{i}", daemon=True)
+            for i in range(self.max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Ставит fn(*args, **kwargs) в очередь и возвращает id задачи"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Очередь остановлена")
+            self._drop_expired()
+            if self.max_pending and len(self._pending) >= self.max_pending:
+                raise QueueFull(
+                    f"Очередь заполнена ({len(self._pending)} задач), попробуйте позже."
+                )
+            job = Job(fn, args, kwargs)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._cond.notify()
+            return job.id
+
+    def get(self, job_id):
+        """Задача по id или None"""
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id):
+        """Место в очереди (1 — следующая), 0 — задача уже выполняется или завершена"""
+        with self._cond:
+            for idx, job in enumerate(self._pending, start=1):
+                if job.id == job_id:
+                    return idx
+            return 0
+
+    def stats(self):
+        """Число задач в очереди и выполняющихся"""
+        with self._cond:
+            running = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+            return {"queued": len(self._pending), "running": running, "workers": self.max_workers}
+
+    def result(self, job_id, timeout=None):
+        """Ждёт завершения; возвращает результат или поднимает ошибку задачи"""
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if not job.done.wait(timeout):
+            raise TimeoutError(f"Задача {job_id} не завершилась за {timeout} с")
+        if job.status in (FAILED, CANCELLED):
+            raise job.error
+        return job.result
+
+    def cancel(self, job_id):
+        """
+        Отменяет задачу: ожидающая снимается с очереди сразу, выполняющейся
+        выставляется cancel_requested. False, если задача уже завершена или не найдена.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.done.is_set():
+                return False
+            job.cancel_requested.set()
+            if job.status == QUEUED:
+                self._pending.remove(job)
+                job.status = CANCELLED
+                job.error = JobCancelled("Задача отменена")
+                job.finished_at = time.time()
+                job.fn = job.args = job.kwargs = None
+                job.done.set()
+            return True
+
+    def forget(self, job_id):
+        """Удаляет завершённую задачу вместе с результатом"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None and job.done.is_set():
+                del self._jobs[job_id]
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _drop_expired(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.job_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _worker(self):
+        _local.max_workers = self.max_workers
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+                job = self._pending.popleft()
+                job.status = RUNNING
+                job.started_at = time.time()
+
+            _local.job = job
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                job.error = e
+                job.status = CANCELLED if isinstance(e, JobCancelled) else FAILED
+            else:
+                job.result = result
+                job.status = DONE
+            finally:
+                _local.job = None
+                job.finished_at = time.time()
+                job.fn = job.args = job.kwargs = None
+                job.done.set()
@@ -0,0 +1,258 @@
+# load_test.py
+"""
+Нагрузочный тест обработки: N одновременных сессий повторяют путь app.py.
+
+Каждая сессия в цикле берёт пару PDF, ставит задачу в общую JobQueue (как
+кнопка Start Advanced Processing), ждёт результата и пишет xlsx в
+SpooledTemporaryFile. С --target direct сессии вызывают process_two_pdfs
+сами, без очереди, — для сравнения с поведением без ограничения параллелизма.
+С --isolate каждая обработка идёт в дочернем процессе (isolation.py), как в
+app.py с FLIGHTLOG_ISOLATION.
+
+Отчёт: пропускная способность, задержки p50/p95/p99 (от постановки в очередь
+до результата), доля ошибок по типам и RSS процесса во времени (/proc).
+Кэши разбора по умолчанию выключены, чтобы каждая задача разбирала PDF заново.
+
+Запуск:
+    python load_test.py --synthetic 8 --sessions 8 --duration 60
+    python load_test.py --pairs-dir ./plans --sessions 16 --requests 20 --workers 4
+    python load_test.py --synthetic 4 --sessions 4 --requests 10 --max-p95 5 --json report.json
+    python load_test.py --synthetic 4 --sessions 4 --requests 10 --isolate
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+
+def read_rss_mb():
+    """RSS текущего процесса в МБ (Linux /proc; иначе пик ru_maxrss)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def discover_pairs(directory):
+    """Пары (основной, Takeoff) из каталога, подобранные pair_documents"""
+    from your_script import pair_documents
+
+    paths = [
+        (name, os.path.join(directory, name))
+        for name in sorted(os.listdir(directory)) if name.lower().endswith(".pdf")
+    ]
+    pairs = pair_documents(paths)["pairs"]
+    if not pairs:
+        raise ValueError(f"В {directory} нет пар навлог + Takeoff")
+    return [(pair["main"], pair["takeoff"]) for pair in pairs]
+
+
+class RssSampler(threading.Thread):
+    """Фоновый замер RSS с заданным интервалом"""
+
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+        self._start = time.perf_counter()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append((time.perf_counter() - self._start, read_rss_mb()))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.samples.append((time.perf_counter() - self._start, read_rss_mb()))
+
+
+def run_job(main_path, takeoff_path, isolate=False):
+    """Одна обработка, как в app.py: отчёт в SpooledTemporaryFile или, с isolate, во временный файл"""
+    from your_script import process_two_pdfs
+
+    if isolate:
+        from isolation import process_two_pdfs_isolated
+
+        with tempfile.NamedTemporaryFile(suffix=".xlsx") as report:
+            process_two_pdfs_isolated(main_path, takeoff_path, os.path.basename(main_path),
+                                      os.path.basename(takeoff_path), output=report.name)
+            return os.path.getsize(report.name)
+
+    with tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024) as report:
+        process_two_pdfs(main_path, takeoff_path, os.path.basename(main_path),
+                         os.path.basename(takeoff_path), output=report)
+        return report.tell()
+
+
+def session(index, pairs, queue, deadline, max_requests, results, lock, isolate=False):
+    """Сессия пилота: задачи одна за другой до дедлайна или числа запросов"""
+    done = 0
+    while time.perf_counter() < deadline and (max_requests is None or done < max_requests):
+        main_path, takeoff_path = pairs[(index + done) % len(pairs)]
+        started = time.perf_counter()
+        error = None
+        try:
+            if queue is None:
+                run_job(main_path, takeoff_path, isolate)
+            else:
+                job_id = queue.submit(run_job, main_path, takeoff_path, isolate)
+                try:
+                    queue.result(job_id)
+                finally:
+                    queue.forget(job_id)
+        except Exception as e:
+            error = type(e).__name__
+        with lock:
+            results.append({"latency": time.perf_counter() - started, "error": error,
+                            "finished": time.perf_counter()})
+        done += 1
+
+
+def summarize(results, wall_seconds, samples):
+    latencies = [r["latency"] for r in results if r["error"] is None]
+    errors = Counter(r["error"] for r in results if r["error"] is not None)
+    total = len(results)
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "errors": dict(errors),
+        "error_rate": (total - len(latencies)) / total if total else 0.0,
+        "wall_seconds": wall_seconds,
+        "throughput_per_s": len(latencies) / wall_seconds if wall_seconds else 0.0,
+        "latency_s": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+        },
+        "rss_mb": {
+            "start": samples[0][1] if samples else None,
+            "peak": max(rss for _, rss in samples) if samples else None,
+            "end": samples[-1][1] if samples else None,
+            "timeline": [(round(t, 2), round(rss, 1)) for t, rss in samples],
+        },
+    }
+
+
+def print_report(report, args, buckets=10):
+    print(f"target: {args.target}, sessions: {args.sessions}"
+          + (f", workers: {args.workers}" if args.target == "queue" else "")
+          + (", isolated" if args.isolate else ""))
+    print(f"requests: {report['requests']}, ok: {report['ok']}, "
+          f"errors: {report['requests'] - report['ok']} ({report['error_rate']:.1%})")
+    for name, count in sorted(report["errors"].items()):
+        print(f"  {name}: {count}")
+    print(f"wall: {report['wall_seconds']:.1f} s, throughput: {report['throughput_per_s']:.2f} req/s")
+    lat = report["latency_s"]
+    if lat["p50"] is not None:
+        print(f"latency: p50 {lat['p50']:.2f} s, p95 {lat['p95']:.2f} s, "
+              f"p99 {lat['p99']:.2f} s, max {lat['max']:.2f} s")
+    rss = report["rss_mb"]
+    if rss["peak"] is not None:
+        print(f"rss: start {rss['start']:.0f} MB, peak {rss['peak']:.0f} MB, end {rss['end']:.0f} MB")
+        timeline = rss["timeline"]
+        step = max(1, len(timeline) // buckets)
+        print("rss over time (max per interval):")
+        for i in range(0, len(timeline), step):
+            chunk = timeline[i:i + step]
+            print(f"  {chunk[0][0]:7.1f} s  {max(r for _, r in chunk):7.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for flight log processing")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pairs-dir", help="каталог с реальными парами PDF")
+    source.add_argument("--synthetic", type=int, metavar="N", help="сгенерировать N синтетических пар")
+    parser.add_argument("--waypoints", type=int, default=12, help="строк маршрута в синтетических парах")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30.0, help="секунд (если не задан --requests)")
+    parser.add_argument("--requests", type=int, help="запросов на сессию")
+    parser.add_argument("--target", choices=["queue", "direct"], default="queue")
+    parser.add_argument("--workers", type=int, default=None, help="воркеров очереди (FLIGHTLOG_WORKERS)")
+    parser.add_argument("--isolate", action="store_true", help="обработка в дочерних процессах")
+    parser.add_argument("--cache", action="store_true", help="не выключать кэши разбора и схем")
+    parser.add_argument("--sample-interval", type=float, default=0.25)
+    parser.add_argument("--json", help="записать отчёт в JSON")
+    parser.add_argument("--max-p95", type=float, help="код выхода 1, если p95 больше, с")
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    # Настройки кэшей читаются при импорте your_script
+    if not args.cache:
+        os.environ["FLIGHTLOG_DOCUMENT_CACHE_MB"] = "0"
+        os.environ["FLIGHTLOG_DIAGRAM_CACHE_MB"] = "0"
+    from job_queue import MAX_WORKERS, JobQueue
+
+    workdir = None
+    if args.synthetic:
+        from synthetic_plans import make_pairs
+        workdir = tempfile.TemporaryDirectory(prefix="flightlog-load-")
+        pairs = make_pairs(workdir.name, args.synthetic, args.waypoints)
+    else:
+        pairs = discover_pairs(args.pairs_dir)
+
+    args.workers = args.workers or MAX_WORKERS
+    queue = JobQueue(max_workers=args.workers, max_pending=0) if args.target == "queue" else None
+
+    # Прогрев: ленивые импорты и первый разбор не входят в замер
+    run_job(*pairs[0], isolate=args.isolate)
+
+    results = []
+    lock = threading.Lock()
+    sampler = RssSampler(args.sample_interval)
+    sampler.start()
+    started = time.perf_counter()
+    deadline = float("inf") if args.requests else started + args.duration
+    threads = [
+        threading.Thread(target=session,
+                         args=(i, pairs, queue, deadline, args.requests, results, lock, args.isolate))
+        for i in range(args.sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+    sampler.stop()
+    if queue is not None:
+        queue.shutdown()
+    if workdir is not None:
+        workdir.cleanup()
+
+    report = summarize(results, wall_seconds, sampler.samples)
+    print_report(report, args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    ok = report["error_rate"] <= args.max_error_rate
+    if args.max_p95 is not None and (report["latency_s"]["p95"] or 0) > args.max_p95:
+        print(f"FAIL: p95 {report['latency_s']['p95']:.2f} s exceeds {args.max_p95:.2f} s")
+        ok = False
+    if report["error_rate"] > args.max_error_rate:
+        print(f"FAIL: error rate {report['error_rate']:.1%} exceeds {args.max_error_rate:.1%}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+# metrics.py
+"""
+Метрики обработки в текстовом формате Prometheus: счётчики и гистограммы.
+
+process_two_pdfs после каждого запуска вызывает observe_run:
+  flightlog_runs_total{status}                   - запуски, ok или error
+  flightlog_errors_total{type,reason}            - ошибки по типу и тексту
+  flightlog_run_duration_seconds                 - время запуска целиком
+  flightlog_stage_duration_seconds{stage}        - время этапов (StageTimer)
+  flightlog_input_bytes{document}                - размер входных PDF (main, takeoff)
+  flightlog_output_bytes{format}                 - размер отчётов (xlsx, pdf)
+
+Метрики хранятся в памяти процесса и отдаются:
+  - по HTTP: start_http_server (в app.py - при FLIGHTLOG_METRICS_PORT),
+    GET /metrics на FLIGHTLOG_METRICS_ADDR (по умолчанию 127.0.0.1);
+  - файлом для textfile collector node_exporter: FLIGHTLOG_METRICS_TEXTFILE,
+    файл переписывается атомарно после каждого запуска.
+
+Запуск (синтетические пары, затем запрос к собственному /metrics):
+    python metrics.py --synthetic 3
+    python metrics.py --synthetic 3 --port 9108 --serve
+"""
+import argparse
+import math
+import os
+import re
+import sys
+import threading
+import time
+
+METRICS_PORT = int(os.environ.get("FLIGHTLOG_METRICS_PORT", "0"))
+METRICS_ADDR = os.environ.get("FLIGHTLOG_METRICS_ADDR", "127.0.0.1")
+METRICS_TEXTFILE = os.environ.get("FLIGHTLOG_METRICS_TEXTFILE")
+
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (16 * 2**10, 64 * 2**10, 256 * 2**10, 2**20, 4 * 2**20, 16 * 2**20, 64 * 2**20)
+
+# Больше стольких разных текстов ошибок одного типа не заводится - дальше reason="other"
+MAX_ERROR_REASONS = 50
+ERROR_REASON_LENGTH = 120
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Счётчик с метками: inc(*значения меток, amount=1)"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """Гистограмма с метками: observe(*значения меток, value=...)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *labels, value):
+        with self._lock:
+            counts, total = self._values.get(labels, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[labels] = (counts, total + value)
+
+    def count(self, *labels):
+        entry = self._values.get(labels)
+        return entry[0][-1] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                le = (("le", _format_value(bound)),)
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {count}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {counts[-1]}"
+
+
+class Registry:
+    """Набор метрик процесса и их вывод в текстовом формате"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Текстовый формат Prometheus 0.0.4"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+RUNS = REGISTRY.counter("flightlog_runs_total", "Processing runs by outcome.", ("status",))
+ERRORS = REGISTRY.counter("flightlog_errors_total", "Failed runs by error type and message.",
+                          ("type", "reason"))
+RUN_SECONDS = REGISTRY.histogram("flightlog_run_duration_seconds", "Wall time of a processing run.")
+STAGE_SECONDS = REGISTRY.histogram("flightlog_stage_duration_seconds", "Wall time of a processing stage.",
+                                   ("stage",))
+INPUT_BYTES = REGISTRY.histogram("flightlog_input_bytes", "Size of input PDF documents.",
+                                 ("document",), SIZE_BUCKETS)
+OUTPUT_BYTES = REGISTRY.histogram("flightlog_output_bytes", "Size of generated reports.",
+                                  ("format",), SIZE_BUCKETS)
+
+_error_reasons = {}
+_textfile_lock = threading.Lock()
+
+
+def error_reason(error):
+    """Текст ошибки для метки: числа заменены на N, длина и число вариантов ограничены"""
+    reason = re.sub(r"\d+(?:[.,]\d+)?", "N", str(error).strip())[:ERROR_REASON_LENGTH] or "-"
+    seen = _error_reasons.setdefault(type(error).__name__, set())
+    if reason not in seen:
+        if len(seen) >= MAX_ERROR_REASONS:
+            return "other"
+        seen.add(reason)
+    return reason
+
+
+def observe_run(run_metrics, seconds, error=None):
+    """
+    Учитывает один запуск process_two_pdfs
+
+    Args:
+        run_metrics: dict - метрики запуска (metrics process_two_pdfs): этапы,
+                     input_bytes, output_format, output_bytes, pdf_bytes
+        seconds: float - время запуска целиком
+        error: исключение, если запуск завершился ошибкой
+    """
+    if error is None:
+        RUNS.inc("ok")
+    else:
+        RUNS.inc("error")
+        ERRORS.inc(type(error).__name__, error_reason(error))
+    RUN_SECONDS.observe(value=seconds)
+
+    for stage, values in run_metrics.get("stages", {}).items():
+        STAGE_SECONDS.observe(stage, value=values["seconds"])
+    for document, size in run_metrics.get("input_bytes", {}).items():
+        INPUT_BYTES.observe(document, value=size)
+    if error is None:
+        output_format = run_metrics.get("output_format", "xlsx")
+        if "output_bytes" in run_metrics:
+            OUTPUT_BYTES.observe(output_format, value=run_metrics["output_bytes"])
+        if output_format != "pdf" and "pdf_bytes" in run_metrics:
+            OUTPUT_BYTES.observe("pdf", value=run_metrics["pdf_bytes"])
+
+    if METRICS_TEXTFILE:
+        write_textfile(METRICS_TEXTFILE)
+
+
+def write_textfile(path, registry=REGISTRY):
+    """Пишет метрики в файл атомарно (временный файл рядом и os.replace)"""
+    with _textfile_lock:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(registry.render())
+        os.replace(tmp_path, path)
+
+
+def start_http_server(port=None, addr=None, registry=REGISTRY):
+    """
+    HTTP-сервер метрик в фоновом потоке: GET /metrics
+
+    Returns:
+        ThreadingHTTPServer: server.server_address - фактический адрес
+        (port=0 выбирает свободный порт); остановка - server.shutdown()
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((METRICS_ADDR if addr is None else addr,
+                                  METRICS_PORT if port is None else port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="flightlog-metrics", daemon=True).start()
+    return server
+
+
+def scrape(url, timeout=5):
+    """Текст метрик по URL (для проверки эндпоинта)"""
+    from urllib.request import urlopen
+
+    with urlopen(url, timeout=timeout) as response:
+        return response.read().decode("utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process synthetic pairs and scrape the metrics endpoint")
+    parser.add_argument("--synthetic", type=int, default=2, metavar="N", help="обработать N синтетических пар")
+    parser.add_argument("--port", type=int, default=0, help="порт эндпоинта (0 - свободный)")
+    parser.add_argument("--textfile", help="также записать метрики в файл")
+    parser.add_argument("--serve", action="store_true", help="не завершаться после проверки")
+    args = parser.parse_args(argv)
+
+    import tempfile
+    from synthetic_plans import make_pairs
+    from your_script import process_two_pdfs
+
+    # your_script пишет в реестр импортированного модуля metrics, а не __main__
+    from metrics import RUNS, start_http_server, write_textfile
+
+    server = start_http_server(args.port)
+    host, port = server.server_address[:2]
+    with tempfile.TemporaryDirectory(prefix="flightlog-metrics-") as workdir:
+        pairs = make_pairs(workdir, args.synthetic)
+        # Пара из двух основных документов - для счётчика ошибок
+        pairs.append((pairs[0][0], pairs[0][0]))
+        for main_path, takeoff_path in pairs:
+            try:
+                process_two_pdfs(main_path, takeoff_path, os.path.basename(main_path),
+                                 os.path.basename(takeoff_path))
+            except ValueError:
+                pass
+
+    text = scrape(f"http://{host}:{port}/metrics")
+    print(text, end="")
+    if args.textfile:
+        write_textfile(args.textfile)
+
+    ok = RUNS.value("ok") == args.synthetic and RUNS.value("error") == 1
+    print(f"{'OK' if ok else 'FAIL'}: {RUNS.value('ok')} ok, {RUNS.value('error')} error runs "
+          f"scraped from http://{host}:{port}/metrics")
+    if args.serve:
+        print("serving, Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    server.shutdown()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
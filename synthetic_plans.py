@@ -0,0 +1,256 @@
+# synthetic_plans.py
+"""
+Синтетические пары PDF (навлог + Takeoff) для нагрузочных и масштабных замеров.
+
+Структура повторяет то, что ищет your_script: шапка с 'Route' и 'Landing Fuel',
+таблица WAYPOINT ... ACT с 19 колонками, страница AIRPORT со строками DEP/DEST,
+последняя страница со схемами аэродромов; документ Takeoff с двумя колонками
+и 'All Engines Operating'. С legs > 1 навлог многоучастковый: на каждый
+участок страница маршрута и страница аэродромов.
+
+Запуск:
+    python synthetic_plans.py out_dir --pairs 10 --waypoints 12
+    python synthetic_plans.py out_dir --pairs 2 --legs 6
+"""
+import argparse
+import io
+import os
+import sys
+
+ROUTE_HEADERS = [
+    "WAYPOINT", "AIRWAY", "HDG", "CRS", "ALT", "CMP", "DIR/SPD", "ISA",
+    "TAS", "GS", "LEG", "REM", "USED", "REM", "ACT", "LEG", "REM", "ETE", "ACT",
+]
+ROUTE_X = [10, 70, 110, 135, 160, 190, 215, 255, 280, 305, 330, 355, 385, 415, 445, 470, 495, 525, 560]
+
+# Максимальная высота страницы PDF, пт
+MAX_PAGE_HEIGHT = 14400
+
+
+def _diagram_png(seed, size=400):
+    """Растровая «схема аэродрома»: цветной фон с сеткой линий"""
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.empty((size, size, 3), dtype=np.uint8)
+    pixels[:] = (200, (50 + 100 * seed) % 256, 50)
+    pixels[:, ::20] = 0
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _save(doc, path):
+    if path is None:
+        data = doc.tobytes()
+        doc.close()
+        return data
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def _write_text(page, items, fontsize):
+    """
+    Пишет слова (x, y, текст) шрифтом Helvetica одним потоком содержимого
+
+    page.insert_text и Shape.insert_text на каждое слово копируют весь
+    накопленный поток, и страница на 100 тыс. слов генерировалась бы
+    минутами. Первое слово пишется insert_text (он заводит шрифт /helv
+    в ресурсах страницы), остальные - операторами TJ в его же поток.
+    """
+    if not items:
+        return
+    x, y, text = items[0]
+    page.insert_text((x, y), text, fontsize=fontsize)
+    height = page.rect.height
+    ops = [f"BT /helv {fontsize:g} Tf"]
+    for x, y, text in items[1:]:
+        ops.append(f"1 0 0 1 {x:g} {height - y:g} Tm [<{text.encode('cp1252').hex()}>]TJ")
+    ops.append("ET\n")
+    doc = page.parent
+    xref = page.get_contents()[-1]
+    doc.update_stream(xref, doc.xref_stream(xref) + "\n".join(ops).encode("ascii"))
+
+
+def _route_page(doc, n_waypoints, font_size, row_pitch, departure, destination):
+    """Страница плана: шапка и таблица маршрута участка"""
+    header_y = 140
+    height = max(792, header_y + (n_waypoints + 3) * row_pitch + 40)
+    if height > MAX_PAGE_HEIGHT:
+        raise ValueError(
+            f"Таблица из {n_waypoints} строк не помещается на страницу; уменьшите row_pitch"
+        )
+
+    page = doc.new_page(width=612, height=height)
+    page.insert_text((20, 30), f"FLIGHT PLAN {departure}-{destination}", fontsize=8)
+    page.insert_text((20, 40), "N12345 C172", fontsize=8)
+    page.insert_text((450, 30), "Generated 2026-01-01", fontsize=8)
+    page.insert_text((450, 40), "Page 1", fontsize=8)
+    for c in range(7):
+        page.insert_text((20 + c * 80, 60), f"H{c}", fontsize=7)
+        page.insert_text((20 + c * 80, 69), f"V{c}", fontsize=7)
+    page.insert_text((20, 90), "Landing Fuel 12.3", fontsize=7)
+    page.insert_text((20, 110), f"Route {departure} DCT {destination}", fontsize=7)
+
+    items = [(x, header_y, label) for label, x in zip(ROUTE_HEADERS, ROUTE_X)]
+
+    waypoints = [departure] + [f"WP{i:02d}" for i in range(1, n_waypoints - 1)] + [destination]
+    # Участки согласованы: REM убывает на LEG (мили, минуты) и на USED (топливо за участок)
+    leg_dist = [0] + [10 + r % 10 for r in range(1, n_waypoints)]
+    leg_time = [0] + [5 + r % 10 for r in range(1, n_waypoints)]
+    leg_fuel = 1.2
+    total_fuel = 40.0 + leg_fuel * n_waypoints
+    rem_dist, rem_time = sum(leg_dist), sum(leg_time)
+    for r, name in enumerate(waypoints):
+        y = header_y + row_pitch * (r + 1)
+        used = leg_fuel if r else 0.0
+        rem_dist -= leg_dist[r]
+        rem_time -= leg_time[r]
+        values = [
+            name, "DCT", f"{(90 + r * 10) % 360:03d}", f"{(95 + r * 10) % 360:03d}",
+            f"FL{50 + r * 5:03d}" if r % 2 else f"{3500 + r * 100}",
+            "", f"240/{10 + r % 30}", "+2", "110", "105",
+            f"{leg_dist[r]}", f"{rem_dist}", f"{used:.1f}", f"{total_fuel - leg_fuel * r:.1f}", "",
+            f"{leg_time[r] // 60}:{leg_time[r] % 60:02d}", f"{rem_time // 60}:{rem_time % 60:02d}",
+            f"{leg_time[r] // 60}:{leg_time[r] % 60:02d}", "",
+        ]
+        items.extend((x, y, value) for value, x in zip(values, ROUTE_X) if value)
+    items.append((10, header_y + row_pitch * (n_waypoints + 1) + 6, "ALTERNATE LFTH"))
+    _write_text(page, items, font_size)
+
+
+def _airport_page(doc, departure, destination):
+    """Страница таблицы аэродромов участка (строки DEP, DEST)"""
+    page = doc.new_page(width=612, height=792)
+    page.insert_text((80, 50), "AIRPORT", fontsize=7)
+    for x, label in [(160, "ETA"), (210, "WX"), (260, "TWR/CTAF"), (330, "CLR"), (380, "GND"),
+                     (430, "ELEV"), (480, "RWY"), (530, "LONGEST")]:
+        page.insert_text((x, 50), label, fontsize=7)
+    for y, row in [(66, ["DEP", departure, "10:00", "126.3", "118.5", "", "121.9", "440", "13/31", "3000"]),
+                   (80, ["DEST", destination, "11:10", "127.5", "120.2", "", "121.7", "124", "17/35", "4000"])]:
+        for x, value in zip([10, 80, 160, 210, 260, 330, 380, 430, 480, 530], row):
+            if value:
+                page.insert_text((x, y), value, fontsize=7)
+
+
+def _decoy_page(doc, n_words):
+    """
+    Страница из n_words ориентиров, не складывающихся в заголовок таблицы:
+    в каждой строке ACT левее WAYPOINT (для масштабных замеров)
+    """
+    per_line = 20
+    lines = -(-n_words // per_line)
+    pitch = min(12.0, (MAX_PAGE_HEIGHT - 60) / max(lines, 1))
+    page = doc.new_page(width=612, height=max(792, 40 + lines * pitch + 20))
+    items = []
+    for i in range(n_words):
+        line, k = divmod(i, per_line)
+        word = "ACT" if k < per_line // 2 else "WAYPOINT"
+        items.append((10 + k * 29, 40 + line * pitch, word))
+    _write_text(page, items, min(6.0, pitch * 0.6))
+
+
+def make_navlog_pdf(path=None, n_waypoints=6, font_size=6, row_pitch=14,
+                    departure="LFMQ", destination="LFMV", legs=1, decoy_words=0):
+    """
+    Основной документ: шапка, таблица маршрута, аэродромы, схемы
+
+    Args:
+        path: str - куда сохранить; без него возвращаются bytes
+        n_waypoints: int - строк маршрута участка (включая аэродромы вылета и назначения)
+        font_size, row_pitch: размер шрифта и шаг строк таблицы, пт;
+                              уменьшаются для плотных страниц
+        legs: int - участков; промежуточные аэродромы LFX1, LFX2, ...
+        decoy_words: int - слов на странице-ловушке перед схемами (_decoy_page)
+
+    Returns:
+        bytes | str: PDF или path
+    """
+    import fitz
+
+    n_waypoints = max(2, n_waypoints)
+    airports = [departure] + [f"LFX{k}" for k in range(1, legs)] + [destination]
+
+    doc = fitz.open()
+    for leg in range(legs):
+        _route_page(doc, n_waypoints, font_size, row_pitch, airports[leg], airports[leg + 1])
+        _airport_page(doc, airports[leg], airports[leg + 1])
+    if decoy_words:
+        _decoy_page(doc, decoy_words)
+
+    # Страница схем аэродромов
+    page = doc.new_page(width=612, height=792)
+    page.insert_text((20, 30), "Airport Diagrams", fontsize=8)
+    page.insert_text((20, 45), f"DEP {departure}", fontsize=8)
+    page.insert_text((20, 60), "Notes", fontsize=8)
+    page.insert_text((20, 400), f"DEST {destination}", fontsize=8)
+    for seed, rect in enumerate([fitz.Rect(20, 70, 300, 350), fitz.Rect(20, 420, 300, 700)]):
+        page.insert_image(rect, stream=_diagram_png(seed))
+
+    return _save(doc, path)
+
+
+def make_takeoff_pdf(path=None, runways=(("13", 130, 10), ("17L", 170, 12)), per_page=None):
+    """
+    Документ Takeoff: колонка на каждую ВПП
+
+    Args:
+        runways: последовательность (ВПП, направление ветра, скорость ветра)
+        per_page: колонок на странице (по умолчанию все на первой)
+
+    Returns:
+        bytes | str: PDF или path
+    """
+    import fitz
+
+    per_page = per_page or len(runways)
+    doc = fitz.open()
+    for first in range(0, len(runways), per_page):
+        page_runways = runways[first:first + per_page]
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((20, 30), "Takeoff Performance", fontsize=10)
+        column_width = 600 / len(page_runways)
+        for k, (runway, wind_dir, wind_speed) in enumerate(page_runways):
+            x = 20 + k * column_width
+            lines = [
+                "Runway", "Departure", "Runway", runway, "Usable Length", "3000 ft",
+                "Runway Surface", "Asphalt", "Wind", f"{wind_dir}°T {wind_speed} kts",
+                "Headwind 8 kts", "Crosswind 6 kts", "Temperature", "15 C", "Altimeter",
+                "29.92 / 1013", "Safety Distance Factor", "1.0", "Distance", "1200 / 1500 ft",
+            ]
+            for i, line in enumerate(lines):
+                page.insert_text((x, 60 + i * 14), line, fontsize=8)
+        page.insert_text((20, 450), "All Engines Operating", fontsize=8)
+
+    return _save(doc, path)
+
+
+def make_pairs(directory, count, n_waypoints=6, legs=1):
+    """Пишет count пар plan_NNN.pdf / plan_NNN_takeoff.pdf; возвращает список пар путей"""
+    os.makedirs(directory, exist_ok=True)
+    pairs = []
+    for i in range(count):
+        main_path = os.path.join(directory, f"plan_{i:03d}.pdf")
+        takeoff_path = os.path.join(directory, f"plan_{i:03d}_takeoff.pdf")
+        make_navlog_pdf(main_path, n_waypoints=n_waypoints + i % 5, legs=legs)
+        make_takeoff_pdf(takeoff_path)
+        pairs.append((main_path, takeoff_path))
+    return pairs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic navlog/Takeoff PDF pairs")
+    parser.add_argument("directory")
+    parser.add_argument("--pairs", type=int, default=10)
+    parser.add_argument("--waypoints", type=int, default=12)
+    parser.add_argument("--legs", type=int, default=1, help="участков в навлоге")
+    args = parser.parse_args(argv)
+
+    for main_path, takeoff_path in make_pairs(args.directory, args.pairs, args.waypoints, args.legs):
+        print(main_path, takeoff_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+# test_scaling.py
+"""
+Показатель степени t ~ N^k этапов process_two_pdfs на синтетических планах
+bench_scaling. Проверяется только наклон в логарифмическом масштабе:
+абсолютное время зависит от машины. Квадратичный этап (как прежнее
+ws.merge_cells на тысячах диапазонов) даёт k около 2.
+
+Запуск без этой проверки: pytest -m "not slow"
+"""
+import pytest
+
+import bench_scaling
+
+SIZES = (3000, 10000, 30000)
+REPEAT = 2
+MAX_EXPONENT = 1.5
+# Точки короче этого не входят в оценку (шум, постоянные затраты)
+MIN_SECONDS = 0.05
+
+
+@pytest.fixture(scope="module")
+def takeoff_pdf():
+    from synthetic_plans import make_takeoff_pdf
+
+    takeoff = make_takeoff_pdf()
+    # Прогрев: импорты pandas, openpyxl и PyMuPDF не входят в замер
+    bench_scaling.run_stages(bench_scaling.make_plan("dense", 200), takeoff, 1)
+    return takeoff
+
+
+@pytest.fixture(autouse=True)
+def no_caches(monkeypatch):
+    import your_script
+
+    monkeypatch.setattr(your_script, "DIAGRAM_CACHE_MB", 0)
+    monkeypatch.setattr(your_script, "DOCUMENT_CACHE_MB", 0)
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("scenario", bench_scaling.SCENARIOS)
+def test_stages_scale_subquadratically(scenario, takeoff_pdf):
+    timings = {
+        words: bench_scaling.run_stages(bench_scaling.make_plan(scenario, words), takeoff_pdf, REPEAT)
+        for words in SIZES
+    }
+    stage_names = dict.fromkeys(name for stages in timings.values() for name in stages)
+
+    exponents = {}
+    for stage in stage_names:
+        points = [(n, timings[n][stage]) for n in SIZES if stage in timings[n]]
+        exponents[stage] = bench_scaling.exponent(points, MIN_SECONDS)
+
+    assert exponents["workbook"] is not None
+    steep = {stage: round(k, 2) for stage, k in exponents.items() if k is not None and k > MAX_EXPONENT}
+    assert not steep, f"{scenario}: t ~ N^k выше {MAX_EXPONENT}: {steep}"
@@ -0,0 +1,48 @@
+# test_wind.py
+"""Обозначение ветра Takeoff: H/T и L/R по тексту ForeFlight, расчёт - запасной"""
+import pytest
+
+import your_script
+from your_script import process_wind_variable
+
+
+@pytest.fixture(autouse=True)
+def no_variation(monkeypatch):
+    monkeypatch.setattr(your_script, "MAGNETIC_VARIATION", 0.0)
+
+
+@pytest.mark.parametrize("crosswind, expected", [
+    ("Crosswind 1 kts Right", "H10/R1 (242°/10)"),
+    ("Crosswind 1 kts R", "H10/R1 (242°/10)"),
+    ("Right Crosswind 1 kts", "H10/R1 (242°/10)"),
+    ("Crosswind R1 kts", "H10/R1 (242°/10)"),
+    ("Crosswind 1 kts Left", "H10/L1 (242°/10)"),
+])
+def test_crosswind_side_from_foreflight(crosswind, expected):
+    # Ветер почти вдоль ВПП 24: расчётная боковая около 0.35 kt справа,
+    # но сторону задаёт ForeFlight (например, с иным склонением)
+    wind = f"242°T 10 kts Headwind 10 kts {crosswind}"
+    assert process_wind_variable(wind, "24", "1") == (wind, expected)
+
+
+def test_near_zero_crosswind_with_variation(monkeypatch):
+    # Восточное склонение 5° переносит ветер 242°T на 237° магнитных - слева от ВПП 24;
+    # ForeFlight указал справа, и обозначение не должно ему противоречить
+    monkeypatch.setattr(your_script, "MAGNETIC_VARIATION", 5.0)
+    wind = "242°T 10 kts Headwind 10 kts Crosswind 0 kts Right"
+    assert process_wind_variable(wind, "24", "1")[1] == "H10/R0 (242°/10)"
+
+
+@pytest.mark.parametrize("direction, expected", [
+    (242, "H10/R1 (242°/10)"),
+    (238, "H10/L1 (238°/10)"),
+])
+def test_crosswind_side_computed_without_foreflight_side(direction, expected):
+    wind = f"{direction}°T 10 kts Headwind 10 kts Crosswind 1 kts"
+    assert process_wind_variable(wind, "24", "1")[1] == expected
+
+
+def test_runway_letters_are_not_a_side():
+    # Буква торца ('24L') не принимается за сторону ветра
+    wind = "280°T 10 kts Headwind 8 kts Crosswind 6 kts 24L"
+    assert process_wind_variable(wind, "24", "1")[1] == "H8/R6 (280°/10)"
@@ -0,0 +1,461 @@
+# watch_folder.py
+"""
+Обработка по папке: демон следит за каталогом, куда синхронизация EFB
+складывает навлоги и файлы Takeoff, и сам обрабатывает новые пары.
+
+Новый PDF берётся в работу, когда он не менялся SETTLE_SECONDS
+(синхронизация дописала файл). Тип файла определяет is_takeoff_file, пары
+подбирает pair_documents среди файлов, которые ещё ждут пару. Пара "по
+порядку" (без общих аэродромов и общего префикса имён) принимается, только
+если оба файла ждут не меньше PAIR_WAIT: иначе навлог ушёл бы с чужим
+Takeoff, пока его собственный ещё копируется.
+
+Пары обрабатываются в JobQueue на --workers воркерах, каждая - в своём
+дочернем процессе (isolation.process_two_pdfs_isolated) с таймаутом и
+лимитами: пропускная способность растёт с числом ядер, а битый PDF не
+останавливает демон. Отчёты пишутся рядом с навлогом:
+<имя навлога>.flightlog.xlsx (и .flightlog.pdf с --formats xlsx pdf).
+
+Журнал (SQLite, по умолчанию .flightlog-watch.db в наблюдаемом каталоге)
+хранит для каждого файла размер, время изменения, тип, пару, итог, отчёты
+и ошибку. После перезапуска обработанные и отклонённые файлы не
+обрабатываются, пока не изменятся; пары, прерванные остановкой, - заново.
+Изменённый файл обрабатывается снова вместе со своей прежней парой.
+
+Изменения каталога приходят через inotify (Linux, через libc); без него
+каталог опрашивается раз в WATCH_INTERVAL секунд: os.scandir без чтения
+файлов, PDF открываются только новые и изменённые.
+
+Запуск:
+    python watch_folder.py /srv/efb-inbox
+    python watch_folder.py /srv/efb-inbox --workers 4 --formats xlsx pdf --profile compact
+    python watch_folder.py /srv/efb-inbox --once
+"""
+import argparse
+import json
+import os
+import select
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+WATCH_INTERVAL = float(os.environ.get("FLIGHTLOG_WATCH_INTERVAL", "2"))
+SETTLE_SECONDS = float(os.environ.get("FLIGHTLOG_WATCH_SETTLE", "2"))
+PAIR_WAIT = float(os.environ.get("FLIGHTLOG_WATCH_PAIR_WAIT", "60"))
+LEDGER_NAME = ".flightlog-watch.db"
+REPORT_SUFFIX = ".flightlog"
+
+# Без изменений в каталоге и без работы демон просыпается раз в столько секунд
+IDLE_TIMEOUT = 60.0
+
+# Состояния файлов в журнале
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+REJECTED = "rejected"
+
+# Маска событий inotify(7): файл дописан, перенесён в каталог или из него, удалён
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_DELETE = 0x200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    kind TEXT,
+    state TEXT NOT NULL,
+    partner TEXT,
+    reports TEXT,
+    error TEXT,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+def log(message):
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {message}", flush=True)
+
+
+class Ledger:
+    """Журнал файлов каталога: одно соединение на операцию, как в FlightStore"""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load(self):
+        """Записи журнала: {имя файла: dict с колонками files}"""
+        with self._connect() as conn:
+            return {row["name"]: dict(row) for row in conn.execute("SELECT * FROM files")}
+
+    def save(self, *records):
+        """Записывает записи одной транзакцией"""
+        updated_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO files (name, size, mtime_ns, kind, state, partner, reports, error,"
+                " updated_at) VALUES (:name, :size, :mtime_ns, :kind, :state, :partner, :reports, :error,"
+                " :updated_at)",
+                [dict(record, updated_at=updated_at) for record in records],
+            )
+
+    def delete(self, names):
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM files WHERE name = ?", [(name,) for name in names])
+
+
+class InotifyWatcher:
+    """Ожидание изменений каталога через inotify (libc через ctypes)"""
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+        self.fd = fd
+
+    def wait(self, timeout):
+        """Ждёт событий не дольше timeout секунд; события только будят, каталог сканируется заново"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        try:
+            while ready and os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return bool(ready)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Запасной способ без inotify: каждый проход - повторный os.scandir"""
+
+    def __init__(self, interval=WATCH_INTERVAL):
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        return True
+
+    def close(self):
+        pass
+
+
+def make_watcher(directory, polling=False, interval=WATCH_INTERVAL):
+    """InotifyWatcher, если inotify доступен, иначе PollingWatcher"""
+    if not polling:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            log(f"inotify unavailable ({e}), polling every {interval:g} s")
+    return PollingWatcher(interval)
+
+
+def scan(directory):
+    """PDF каталога: {имя: (размер, mtime_ns)}; скрытые файлы и отчёты демона пропускаются"""
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = entry.name
+            lower = name.lower()
+            if name.startswith(".") or not lower.endswith(".pdf") or lower.endswith(f"{REPORT_SUFFIX}.pdf"):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            files[name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def report_names(main_name, formats):
+    """Имена отчётов пары: <имя навлога>.flightlog.<формат>"""
+    stem = os.path.splitext(main_name)[0]
+    return {fmt: f"{stem}{REPORT_SUFFIX}.{fmt}" for fmt in formats}
+
+
+def process_pair(directory, main_name, takeoff_name, formats=("xlsx",), profile="full", store=None,
+                 timeout=None):
+    """
+    Задача очереди: обрабатывает пару каталога в дочернем процессе
+
+    Отчёты пишутся в скрытые временные файлы того же каталога и переносятся
+    под свои имена os.replace, так что недописанный отчёт не виден.
+
+    Returns:
+        list: имена отчётов в каталоге
+    """
+    from isolation import process_two_pdfs_isolated
+
+    names = report_names(main_name, formats)
+    paths = {}
+    for fmt in names:
+        fd, paths[fmt] = tempfile.mkstemp(prefix=".", suffix=f".{fmt}.part", dir=directory)
+        os.close(fd)
+    main_format = "xlsx" if "xlsx" in paths else "pdf"
+    try:
+        process_two_pdfs_isolated(
+            os.path.join(directory, main_name),
+            os.path.join(directory, takeoff_name),
+            main_name,
+            takeoff_name,
+            output=paths[main_format],
+            pdf_output=paths.get("pdf") if main_format == "xlsx" else None,
+            output_format=main_format,
+            profile=profile,
+            store=store,
+            timeout=timeout,
+        )
+        for fmt, path in paths.items():
+            os.chmod(path, 0o644)
+            os.replace(path, os.path.join(directory, names[fmt]))
+    finally:
+        for path in paths.values():
+            if os.path.exists(path):
+                os.unlink(path)
+    return list(names.values())
+
+
+class FolderDaemon:
+    """Проходы по каталогу: новые файлы, подбор пар, задачи очереди, журнал"""
+
+    def __init__(self, directory, ledger_path=None, workers=None, formats=("xlsx",), profile="full",
+                 settle=SETTLE_SECONDS, pair_wait=PAIR_WAIT, store=None, timeout=None):
+        from job_queue import MAX_WORKERS, JobQueue
+
+        self.directory = os.path.abspath(directory)
+        self.ledger = Ledger(ledger_path or os.path.join(self.directory, LEDGER_NAME))
+        self.formats = tuple(formats)
+        self.profile = profile
+        self.settle = settle
+        self.pair_wait = pair_wait
+        self.store = store
+        self.timeout = timeout
+        self.queue = JobQueue(max_workers=workers or MAX_WORKERS, max_pending=0)
+        self.jobs = {}
+        self.stats = Counter()
+        self.records = self.ledger.load()
+
+        # Пары, прерванные остановкой демона, подбираются и обрабатываются заново
+        interrupted = [record for record in self.records.values() if record["state"] == RUNNING]
+        for record in interrupted:
+            record.update(state=PENDING, partner=None)
+        self.ledger.save(*interrupted)
+        # Первый проход подбирает пары и без новых файлов
+        self.pair_deadline = 0.0
+
+    def step(self):
+        """
+        Один проход по каталогу
+
+        Returns:
+            bool: осталась незавершённая работа (файлы дописываются, пары
+                  ждут PAIR_WAIT, задачи выполняются) - следующий проход
+                  нужен через WATCH_INTERVAL, а не IDLE_TIMEOUT
+        """
+        self.collect()
+        files = scan(self.directory)
+        now = time.time()
+        busy = False
+
+        # Удалённые файлы уходят из журнала (кроме пар в обработке)
+        gone = [name for name, record in self.records.items() if name not in files and record["state"] != RUNNING]
+        for name in gone:
+            del self.records[name]
+        if gone:
+            self.ledger.delete(gone)
+
+        changed = []
+        for name, (size, mtime_ns) in files.items():
+            record = self.records.get(name)
+            if record is not None and (record["state"] == RUNNING
+                                       or (record["size"], record["mtime_ns"]) == (size, mtime_ns)):
+                continue
+            if now - mtime_ns / 1e9 < self.settle:
+                busy = True
+                continue
+            changed.append(self.classify(name, size, mtime_ns, record))
+
+        if changed:
+            self.ledger.save(*changed)
+        if changed or (self.pair_deadline is not None and now >= self.pair_deadline):
+            self.pair(now)
+        return busy or bool(self.jobs) or self.pair_deadline is not None
+
+    def classify(self, name, size, mtime_ns, previous=None):
+        """Запись журнала для нового или изменённого файла; прежняя пара снова ждёт пару"""
+        from your_script import is_takeoff_file
+
+        record = {"name": name, "size": size, "mtime_ns": mtime_ns, "kind": None, "state": PENDING,
+                  "partner": None, "reports": None, "error": None}
+        try:
+            record["kind"] = "takeoff" if is_takeoff_file(os.path.join(self.directory, name)) else "main"
+        except Exception as e:
+            record.update(state=REJECTED, error=f"Не удалось открыть PDF: {e}")
+            self.stats[REJECTED] += 1
+            log(f"rejected {name}: {e}")
+
+        partner = self.records.get(previous["partner"]) if previous and previous["partner"] else None
+        if partner is not None and partner["state"] in (DONE, FAILED):
+            partner.update(state=PENDING, partner=None)
+            self.ledger.save(partner)
+        self.records[name] = record
+        return record
+
+    def pair(self, now):
+        """Подбирает пары среди ждущих файлов и ставит их в очередь"""
+        from your_script import pair_documents
+
+        self.pair_deadline = None
+        pending = sorted((record for record in self.records.values() if record["state"] == PENDING),
+                         key=lambda record: (record["mtime_ns"], record["name"]))
+        if {record["kind"] for record in pending} != {"main", "takeoff"}:
+            return
+        result = pair_documents([(record["name"], os.path.join(self.directory, record["name"]))
+                                 for record in pending])
+        for pair in result["pairs"]:
+            main, takeoff = self.records[pair["main_name"]], self.records[pair["takeoff_name"]]
+            if pair["matched_by"] == "order":
+                ready_at = max(main["mtime_ns"], takeoff["mtime_ns"]) / 1e9 + self.pair_wait
+                if now < ready_at:
+                    self.pair_deadline = min(ready_at, self.pair_deadline or ready_at)
+                    continue
+            self.submit(main, takeoff, pair["matched_by"])
+
+    def submit(self, main, takeoff, matched_by):
+        job_id = self.queue.submit(process_pair, self.directory, main["name"], takeoff["name"],
+                                   formats=self.formats, profile=self.profile, store=self.store,
+                                   timeout=self.timeout)
+        main.update(state=RUNNING, partner=takeoff["name"], reports=None, error=None)
+        takeoff.update(state=RUNNING, partner=main["name"], reports=None, error=None)
+        self.ledger.save(main, takeoff)
+        self.jobs[job_id] = (main["name"], takeoff["name"])
+        log(f"queued {main['name']} + {takeoff['name']} (matched by {matched_by})")
+
+    def collect(self):
+        """Итоги завершившихся задач - в журнал"""
+        for job_id, (main_name, takeoff_name) in list(self.jobs.items()):
+            job = self.queue.get(job_id)
+            if not job.done.is_set():
+                continue
+            del self.jobs[job_id]
+            try:
+                reports = self.queue.result(job_id)
+                update = {"state": DONE, "reports": json.dumps(reports), "error": None}
+                log(f"done {main_name} -> {', '.join(reports)} ({job.run_seconds:.1f} s)")
+            except Exception as e:
+                update = {"state": FAILED, "reports": None, "error": f"{type(e).__name__}: {e}"}
+                log(f"failed {main_name} + {takeoff_name}: {e}")
+            finally:
+                self.queue.forget(job_id)
+            self.stats[update["state"]] += 1
+            records = [self.records[name] for name in (main_name, takeoff_name) if name in self.records]
+            for record in records:
+                record.update(update)
+            self.ledger.save(*records)
+
+    def run(self, watcher, interval=WATCH_INTERVAL, once=False):
+        """Проходы по каталогу до остановки; once - пока есть работа"""
+        while True:
+            busy = self.step()
+            if once and not busy:
+                return
+            watcher.wait(interval if busy else IDLE_TIMEOUT)
+
+    def close(self):
+        """Отменяет выполняющиеся задачи; в журнале они остаются running и после перезапуска обрабатываются заново"""
+        for job_id in self.jobs:
+            self.queue.cancel(job_id)
+        self.queue.shutdown()
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch a folder and process navlog + Takeoff pairs as they arrive")
+    parser.add_argument("directory")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="параллельных обработок (по умолчанию FLIGHTLOG_WORKERS)")
+    parser.add_argument("--formats", nargs="+", choices=("xlsx", "pdf"), default=["xlsx"])
+    parser.add_argument("--profile", choices=("full", "compact"), default="full")
+    parser.add_argument("--ledger", help=f"журнал (по умолчанию {LEDGER_NAME} в каталоге)")
+    parser.add_argument("--db", help="сохранять разобранные планы в FlightStore")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="период опроса, с")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="файл берётся в работу, если не менялся столько секунд")
+    parser.add_argument("--pair-wait", type=float, default=PAIR_WAIT,
+                        help="пара по порядку файлов принимается, если оба ждут столько секунд")
+    parser.add_argument("--timeout", type=float, default=None, help="таймаут обработки пары, с")
+    parser.add_argument("--polling", action="store_true", help="опрос вместо inotify")
+    parser.add_argument("--once", action="store_true",
+                        help="обработать то, что есть в каталоге, и завершиться (пары по порядку - без ожидания)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"not a directory: {args.directory}")
+
+    from flight_store import FlightStore
+    from metrics import METRICS_PORT, start_http_server
+
+    if METRICS_PORT:
+        start_http_server()
+    daemon = FolderDaemon(
+        args.directory,
+        ledger_path=args.ledger,
+        workers=args.workers,
+        formats=args.formats,
+        profile=args.profile,
+        settle=args.settle,
+        pair_wait=0 if args.once else args.pair_wait,
+        store=FlightStore(args.db) if args.db else None,
+        timeout=args.timeout,
+    )
+    watcher = make_watcher(daemon.directory, args.polling, args.interval)
+    signal.signal(signal.SIGTERM, _interrupt)
+    log(f"watching {daemon.directory} with {daemon.queue.max_workers} workers ({type(watcher).__name__})")
+    started = time.perf_counter()
+    try:
+        daemon.run(watcher, args.interval, args.once)
+    except KeyboardInterrupt:
+        log("stopping")
+    finally:
+        daemon.close()
+        watcher.close()
+
+    seconds = time.perf_counter() - started
+    log(f"{daemon.stats[DONE]} pairs done, {daemon.stats[FAILED]} failed, {daemon.stats[REJECTED]} files rejected "
+        f"in {seconds:.1f} s")
+    return 1 if daemon.stats[FAILED] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,142 +1,914 @@
 # your_script.py
-import fitz
+# Тяжёлые модули (fitz, pandas, numpy, openpyxl, PIL) импортируются внутри
+# функций, которым они нужны: импорт самого модуля остаётся дешёвым для
+# воркеров Streamlit и дочерних процессов. Бюджет проверяет bench_startup.py.
 import unicodedata
-import pandas as pd
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.drawing.image import Image as XLImage
-from openpyxl.worksheet.page import PageMargins
-from docx import Document
-from docx.shared import Inches, Pt
-from PIL import Image as PILImage
+import bisect
 import io
+import json
+import os
 import re
-import numpy as np
+import threading
+import time
+
+from disk_cache import DEFAULT_CACHE_DIR, DiskCache, digest, file_digest
+
+# Размер кэша уменьшенных схем аэродромов, МБ (0 — кэш отключён)
+DIAGRAM_CACHE_MB = float(os.environ.get("FLIGHTLOG_DIAGRAM_CACHE_MB", "64"))
+DIAGRAM_SIZE = (500, 500)
+
+# Размер кэша результатов разбора документов, МБ (0 — кэш отключён). Кэш хранит
+# разобранные планы, поэтому включается явно (например, 256).
+# PARSE_CACHE_VERSION меняется вместе со структурой результатов разбора.
+DOCUMENT_CACHE_MB = float(os.environ.get("FLIGHTLOG_DOCUMENT_CACHE_MB", "0"))
+PARSE_CACHE_VERSION = 6
+
+# Профили вывода: full - как есть, compact - сжатые изображения и ZIP уровня 9
+OUTPUT_PROFILES = ("full", "compact")
+OUTPUT_FORMATS = ("xlsx", "pdf")
+COMPACT_PALETTE_COLORS = 64
+COMPACT_JPEG_QUALITY = 75
+
+# Бюджет памяти процесса на этап обработки, МБ (0 — без ограничения).
+# FLIGHTLOG_TRACEMALLOC=1 добавляет в отчёт пики Python-аллокаций (медленнее).
+MEMORY_BUDGET_MB = float(os.environ.get("FLIGHTLOG_MEMORY_BUDGET_MB", "0"))
+TRACE_MEMORY = os.environ.get("FLIGHTLOG_TRACEMALLOC") == "1"
+
+# Процессов для параллельного разбора страниц одной обработки: участков навлога,
+# страниц Takeoff (1 — по очереди; 0 — ядра делятся между одновременными обработками)
+PAGE_WORKERS = int(os.environ.get("FLIGHTLOG_PAGE_WORKERS", "0"))
+
+_diagram_cache = None
+_document_cache = None
+_page_pool = None
+_page_pool_lock = threading.Lock()
 
 
 # === ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ===
+class MemoryBudgetExceeded(MemoryError):
+    """Этап обработки вышел за бюджет памяти процесса"""
+
+    def __init__(self, stage, used_mb, budget_mb):
+        super().__init__(
+            f"Этап '{stage}' превысил бюджет памяти: {used_mb:.0f} МБ при лимите {budget_mb:.0f} МБ. "
+            "Файл слишком тяжёлый для обработки (например, скан с крупными изображениями)."
+        )
+        self.stage = stage
+        self.used_mb = used_mb
+        self.budget_mb = budget_mb
+
+    def __reduce__(self):
+        # Исключение передаётся из дочернего процесса (isolation) через pickle
+        return type(self), (self.stage, self.used_mb, self.budget_mb)
+
+
+def read_rss():
+    """(текущий, пиковый) RSS процесса в МБ из /proc/self/status; вне Linux - (None, None)"""
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, value = line.split()[:2]
+                    values[key] = int(value) / 1024
+    except OSError:
+        return None, None
+    return values.get("VmRSS:"), values.get("VmHWM:")
+
+
+def reset_peak_rss():
+    """Сбрасывает пиковый RSS (VmHWM) процесса; False, если ядро не позволяет"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class StageTimer:
+    """
+    Замер этапов обработки: start(name) закрывает предыдущий этап
+    
+    Для каждого этапа кроме времени пишется память процесса: rss_mb в конце
+    этапа и rss_peak_mb (пик RSS за этап), с trace_memory ещё py_peak_mb
+    (пик Python-аллокаций по tracemalloc). RSS общий для процесса: при
+    нескольких задачах в потоках это память всех задач вместе.
+    
+    С budget_mb этап, чей пик RSS превысил бюджет, завершается исключением
+    MemoryBudgetExceeded; reserve() проверяет бюджет до крупного выделения.
+    on_stage(name) вызывается в начале каждого этапа.
+    """
+
+    def __init__(self, metrics, budget_mb=None, trace_memory=False, on_stage=None):
+        self.stages = metrics.setdefault("stages", {})
+        self.budget_mb = budget_mb or None
+        self.trace_memory = trace_memory
+        self.on_stage = on_stage
+        self.current = None
+        self._started = None
+        self._peak_reset = False
+        self._owns_tracemalloc = False
+
+    def start(self, name):
+        self.stop()
+        if self.on_stage is not None:
+            self.on_stage(name)
+        self.current = name
+        self._peak_reset = reset_peak_rss()
+        if self.trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracemalloc = True
+            tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+
+    def stop(self):
+        if self.current is None:
+            return
+        name = self.current
+        stage = {"seconds": round(time.perf_counter() - self._started, 6)}
+        self.current = None
+        
+        rss, peak = read_rss()
+        if rss is not None:
+            stage["rss_mb"] = round(rss, 1)
+            stage["rss_peak_mb"] = round(peak if self._peak_reset else rss, 1)
+        if self.trace_memory:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                stage["py_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        self.stages[name] = stage
+        
+        if self.budget_mb and rss is not None and stage["rss_peak_mb"] > self.budget_mb:
+            self.close()
+            raise MemoryBudgetExceeded(name, stage["rss_peak_mb"], self.budget_mb)
+
+    def reserve(self, nbytes):
+        """Проверка до выделения nbytes: текущий RSS плюс выделение не больше бюджета"""
+        if not self.budget_mb:
+            return
+        rss, _ = read_rss()
+        if rss is not None and rss + nbytes / 2**20 > self.budget_mb:
+            stage = self.current or "unknown"
+            self.close()
+            raise MemoryBudgetExceeded(stage, rss + nbytes / 2**20, self.budget_mb)
+
+    def close(self):
+        """Закрывает этап без проверки бюджета и останавливает свой tracemalloc"""
+        if self.current is not None:
+            budget, self.budget_mb = self.budget_mb, None
+            self.stop()
+            self.budget_mb = budget
+        if self._owns_tracemalloc:
+            import tracemalloc
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+
+
+def get_diagram_cache():
+    """Общий для задач кэш схем аэродромов (None, если отключён или недоступен)"""
+    global _diagram_cache
+    if DIAGRAM_CACHE_MB <= 0:
+        return None
+    if _diagram_cache is None:
+        try:
+            _diagram_cache = DiskCache(
+                os.path.join(DEFAULT_CACHE_DIR, "diagrams"),
+                max_bytes=int(DIAGRAM_CACHE_MB * 1024 * 1024),
+            )
+        except OSError:
+            return None
+    return _diagram_cache
+
+
+def get_document_cache():
+    """Кэш результатов разбора документов по хэшу файла (None, если отключён)"""
+    global _document_cache
+    if DOCUMENT_CACHE_MB <= 0:
+        return None
+    if _document_cache is None:
+        try:
+            _document_cache = DiskCache(
+                os.path.join(DEFAULT_CACHE_DIR, "documents"),
+                max_bytes=int(DOCUMENT_CACHE_MB * 1024 * 1024),
+            )
+        except OSError:
+            return None
+    return _document_cache
+
+
+def dump_parsed(result):
+    """
+    Результат разбора для кэша документов: только данные, без pickle
+    
+    JSON с метками типов - {"$frame": ...} (DataFrame: подписи колонок и
+    строки), {"$bytes": [начало, длина]} (изображение в двоичной части за
+    JSON), {"$dict": [[ключ, значение], ...]}, {"$tuple": [...]}. Первые
+    8 байт - длина JSON.
+    """
+    import pandas as pd
+    
+    blobs = []
+    offset = 0
+    
+    def encode(value):
+        nonlocal offset
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, (bytes, bytearray)):
+            blobs.append(value)
+            offset += len(value)
+            return {"$bytes": [offset - len(value), len(value)]}
+        if isinstance(value, pd.DataFrame):
+            return {"$frame": {
+                "columns": [encode(c) for c in value.columns],
+                "rows": [[encode(v) for v in row] for row in value.itertuples(index=False, name=None)],
+            }}
+        if isinstance(value, dict):
+            return {"$dict": [[encode(k), encode(v)] for k, v in value.items()]}
+        if isinstance(value, tuple):
+            return {"$tuple": [encode(v) for v in value]}
+        if isinstance(value, list):
+            return [encode(v) for v in value]
+        if hasattr(value, "item"):
+            # Скаляры numpy
+            return encode(value.item())
+        raise TypeError(f"Тип {type(value).__name__} не сохраняется в кэше разбора")
+    
+    header = json.dumps(encode(result), ensure_ascii=False).encode("utf-8")
+    return b"".join([len(header).to_bytes(8, "big"), header] + blobs)
+
+
+def load_parsed(data):
+    """Результат разбора из записи dump_parsed"""
+    import pandas as pd
+    
+    data = memoryview(data)
+    size = int.from_bytes(data[:8], "big")
+    blobs = data[8 + size:]
+    
+    def decode(value):
+        if isinstance(value, list):
+            return [decode(v) for v in value]
+        if not isinstance(value, dict):
+            return value
+        (tag, body), = value.items()
+        if tag == "$bytes":
+            start, length = body
+            return bytes(blobs[start:start + length])
+        if tag == "$frame":
+            return pd.DataFrame([[decode(v) for v in row] for row in body["rows"]],
+                                columns=[decode(c) for c in body["columns"]])
+        if tag == "$dict":
+            return {decode(k): decode(v) for k, v in body}
+        if tag == "$tuple":
+            return tuple(decode(v) for v in body)
+        raise ValueError(f"Неизвестная метка в кэше разбора: {tag}")
+    
+    return decode(json.loads(bytes(data[8:8 + size])))
+
+
+def cached_parse(cache, key, stats, name, parse):
+    """Результат разбора из кэша или parse() с сохранением; stats[name] = 'hit'/'miss'"""
+    key = f"{key}-v{PARSE_CACHE_VERSION}.bin"
+    if cache is not None:
+        data = cache.get(key)
+        if data is not None:
+            try:
+                result = load_parsed(data)
+            except Exception:
+                result = None
+            if result is not None:
+                stats[name] = "hit"
+                return result
+    
+    stats[name] = "miss"
+    result = parse()
+    if cache is not None:
+        cache.put(key, dump_parsed(result))
+    return result
+
+
+def cached_parse_metrics(main, metrics):
+    """
+    Метрики разбора основного документа, взятого из кэша: участки - по
+    разобранному результату (seconds 0, cached)
+    """
+    if len(main.get("legs") or ()) > 1:
+        metrics["legs"] = [
+            {"page": leg["page"] + 1, "rows": len(leg["route"]), "seconds": 0.0, "cached": True}
+            for leg in main["legs"]
+        ]
+
+
 def normalize_ascii(text):
     nfkd = unicodedata.normalize('NFKD', text)
     return ''.join(c for c in nfkd if ord(c) < 128)
 
 
-def is_takeoff_file(content_bytes):
+def open_pdf(source):
+    """
+    Открывает PDF без лишних копий содержимого
+    
+    Args:
+        source: путь (str/PathLike), bytes/bytearray/memoryview
+                или файловый объект
+    
+    Returns:
+        fitz.Document: документ; файлы на диске MuPDF читает лениво
+    """
+    import fitz
+    
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(os.fspath(source), filetype="pdf")
+    if isinstance(source, (bytes, bytearray, memoryview, io.BytesIO)):
+        return fitz.open(stream=source, filetype="pdf")
+    name = getattr(source, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return fitz.open(name, filetype="pdf")
+    return fitz.open(stream=source.read(), filetype="pdf")
+
+
+def source_digest(source):
+    """
+    SHA-256 содержимого PDF; файлы на диске читаются по частям
+    
+    Returns:
+        tuple: (источник для open_pdf, hex-хэш); файловый объект без пути
+               читается в bytes, так как повторно его не прочитать
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return source, file_digest(os.fspath(source))
+    if isinstance(source, io.BytesIO):
+        return source, digest(source.getbuffer())
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source, digest(source)
+    name = getattr(source, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name, file_digest(name)
+    data = source.read()
+    return data, digest(data)
+
+
+def source_size(source):
+    """Размер PDF в байтах для источника из source_digest"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    if isinstance(source, io.BytesIO):
+        return source.getbuffer().nbytes
+    return memoryview(source).nbytes
+
+
+def is_takeoff_document(doc):
+    """Определяет, содержит ли открытый PDF 'Takeoff' в начале"""
+    raw = doc[0].get_text("text")[:250]
+    return normalize_ascii(raw).strip().lower().startswith("takeoff")
+
+
+def is_takeoff_file(source):
     """Определяет, содержит ли PDF 'Takeoff' в начале"""
-    doc = fitz.open(stream=content_bytes, filetype="pdf")
+    doc = open_pdf(source)
     try:
-        raw = doc[0].get_text("text")[:250]
-        return normalize_ascii(raw).strip().lower().startswith("takeoff")
+        return is_takeoff_document(doc)
     finally:
         doc.close()
 
 
-def extract_first_n_lines_from_doc(doc, n=32):
-    page = doc[0]
-    blocks = page.get_text("dict")["blocks"]
-    blocks.sort(key=lambda b: (b["bbox"][1], b["bbox"][0]))
+# === ПОДБОР ПАР ДОКУМЕНТОВ ===
+_ICAO_RE = re.compile(r'\b[A-Z]{4}\b')
+
+
+def header_codes(doc, n=12):
+    """Четырёхбуквенные коды (кандидаты ICAO) из первых строк документа"""
+    return set(_ICAO_RE.findall(normalize_ascii(" ".join(extract_first_n_lines_from_doc(doc, n)))))
+
+
+def _stem_similarity(name1, name2):
+    """Длина общего префикса имён файлов без расширения"""
+    stem1 = os.path.splitext(os.path.basename(name1))[0].lower()
+    stem2 = os.path.splitext(os.path.basename(name2))[0].lower()
+    return len(os.path.commonprefix([stem1, stem2]))
+
+
+def pair_documents(files):
+    """
+    Разбивает набор PDF на пары навлог + Takeoff
+    
+    Тип файла определяется по is_takeoff_document. Пары подбираются жадно:
+    сначала по общим кодам аэродромов в шапках обоих документов (коды, которые
+    есть в шапке каждого навлога, вроде PLAN, не учитываются), затем по общему
+    префиксу имён файлов, затем по порядку загрузки.
+    
+    Args:
+        files: список (имя, источник) - источник в форматах open_pdf
+    
+    Returns:
+        dict: pairs - список {main_name, main, takeoff_name, takeoff, matched_by, airports},
+              matched_by - "airports", "name" или "order";
+              unpaired - список {name, reason}
+    """
+    mains, takeoffs, unpaired = [], [], []
+    for index, (name, source) in enumerate(files):
+        try:
+            doc = open_pdf(source)
+        except Exception as e:
+            unpaired.append({"name": name, "reason": f"Не удалось открыть PDF: {e}"})
+            continue
+        try:
+            entry = {"index": index, "name": name, "source": source, "codes": header_codes(doc)}
+            (takeoffs if is_takeoff_document(doc) else mains).append(entry)
+        finally:
+            doc.close()
+    
+    common = set.intersection(*(m["codes"] for m in mains)) if len(mains) > 1 else set()
+    candidates = []
+    for m in mains:
+        for t in takeoffs:
+            airports = (m["codes"] - common) & t["codes"]
+            score = (len(airports), _stem_similarity(m["name"], t["name"]), -abs(m["index"] - t["index"]))
+            candidates.append((score, m["index"], t["index"], m, t, airports))
+    candidates.sort(key=lambda c: (c[0], -c[1], -c[2]), reverse=True)
+    
+    pairs, used = [], set()
+    for (n_airports, similarity, _), main_index, takeoff_index, m, t, airports in candidates:
+        if main_index in used or takeoff_index in used:
+            continue
+        used.update((main_index, takeoff_index))
+        pairs.append((main_index, {
+            "main_name": m["name"],
+            "main": m["source"],
+            "takeoff_name": t["name"],
+            "takeoff": t["source"],
+            "matched_by": "airports" if n_airports else "name" if similarity else "order",
+            "airports": sorted(airports),
+        }))
+    
+    for kind, group in (("навлога", mains), ("файла Takeoff", takeoffs)):
+        for entry in group:
+            if entry["index"] not in used:
+                unpaired.append({"name": entry["name"], "reason": f"Нет пары для {kind}"})
+    return {"pairs": [pair for _, pair in sorted(pairs, key=lambda p: p[0])], "unpaired": unpaired}
+
+
+# === ИЗВЛЕЧЕНИЕ ТЕКСТА ===
+# Этапам нужны строки или слова с рамками, а не полный get_text("dict"):
+# он строит словари всех спанов и по умолчанию включает блоки изображений
+# с их данными (на странице схем это мегабайты). Здесь каждый этап получает
+# только своё: blocks/words, флаги без изображений, clip по нужной области.
+_lean_text_flags = None
+
+
+def lean_text_flags():
+    """Флаги извлечения: без блоков изображений, лигатуры не раскрываются"""
+    global _lean_text_flags
+    if _lean_text_flags is None:
+        import fitz
+        _lean_text_flags = (fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES) | fitz.TEXT_PRESERVE_LIGATURES
+    return _lean_text_flags
+
+
+def page_lines(page, clip=None, sort=False, limit=None):
+    """
+    Непустые строки текста страницы из режима blocks (текст блока по строкам)
+    
+    Args:
+        clip: область страницы; None - вся страница
+        sort: упорядочить блоки по (y0, x0), иначе - в порядке документа
+        limit: вернуть не больше limit строк
+    """
+    blocks = page.get_text("blocks", clip=clip, flags=lean_text_flags())
+    if sort:
+        blocks.sort(key=lambda b: (b[1], b[0]))
     lines = []
     for block in blocks:
-        if "lines" not in block:
-            continue
-        for line in block["lines"]:
-            text = "".join(span["text"] for span in line["spans"]).strip()
-            if text:
-                lines.append(text)
-                if len(lines) >= n:
+        for line in block[4].split("\n"):
+            line = line.strip()
+            if line:
+                lines.append(line)
+                if limit is not None and len(lines) >= limit:
                     return lines
     return lines
 
 
-def parse_document_with_simple_split(page, target_phrase="All Engines Operating"):
-    phrase_y_coord = None
-    text_instances = page.search_for(target_phrase)
-    if text_instances:
-        phrase_y_coord = text_instances[0].y0
-    else:
-        return [], []
+def page_text_lines(page, clip=None):
+    """
+    Строки страницы с рамками из dict без блоков изображений
     
-    page_width = page.rect.width
-    mid_x = page.rect.x0 + page_width / 2
-    blocks = page.get_text("dict")["blocks"]
-    left_array = []
-    right_array = []
+    Returns:
+        list: (текст строки без краевых пробелов, x0 строки, y0 строки, правый край спанов)
+    """
+    result = []
+    for block in page.get_text("dict", clip=clip, flags=lean_text_flags())["blocks"]:
+        for line in block.get("lines", ()):
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                x0, y0 = line["bbox"][:2]
+                result.append((text, x0, y0, max(span["bbox"][2] for span in line["spans"])))
+    return result
+
+
+def extract_first_n_lines_from_doc(doc, n=32):
+    return page_lines(doc[0], sort=True, limit=n)
+
+
+# === ОРИЕНТИРЫ СТРАНИЦ ===
+# Ориентир - слова подряд в одной строке, каждое по своему выражению.
+# Первые слова ориентиров проверяются одним общим выражением, поэтому
+# не должны подходить под два ориентира сразу.
+LANDMARKS = {
+    "WAYPOINT": ("WAYPOINT",),
+    "ACT": ("ACT",),
+    "MAG": ("MAG",),
+    "ALT": ("ALT",),
+    "ALTERNATE": (r".*ALTERNATE.*",),
+    "2000 FT ISA": ("2000", "FT", "ISA:"),
+    "AIRPORT": (r"(?i:AIRPORT)",),
+    "DEST": (r"(?i:DEST)",),
+    "Route": (r"(?i:Route)\b\W*",),
+    "Landing Fuel": (r"(?i:Landing)", r"(?i:Fuel)\b\W*"),
+    "All Engines Operating": ("All", "Engines", r"Operating\W*"),
+}
+
+_LANDMARK_NAMES = list(LANDMARKS)
+_LANDMARK_FIRST = re.compile("|".join(
+    f"(?P<l{k}>{parts[0]})" for k, parts in enumerate(LANDMARKS.values())
+))
+_LANDMARK_REST = [[re.compile(part) for part in parts[1:]] for parts in LANDMARKS.values()]
+
+
+def page_landmarks(words):
+    """
+    Индекс ориентиров страницы за один проход по её словам
     
-    for block in blocks:
-        if "lines" in block:
-            for line in block["lines"]:
-                if line["bbox"][1] < phrase_y_coord:
-                    line_text = "".join(span["text"] for span in line["spans"]).strip()
-                    if line_text:
-                        max_x = max(span["bbox"][2] for span in line["spans"])
-                        if max_x < mid_x:
-                            left_array.append(line_text)
-                        else:
-                            right_array.append(line_text)
-    return left_array, right_array
-
-
-def extract_variables(arr, suffix):
-    variables = {}
-    runway_count = 0
-    for i, item in enumerate(arr):
-        if "Runway" in item:
-            runway_count += 1
-            if runway_count == 2 and i + 1 < len(arr):
-                variables[f"Runway{suffix}"] = arr[i + 1]
-                break
+    Args:
+        words: page.get_text("words") - слова с номерами блока и строки
     
-    for i, item in enumerate(arr):
-        if "Usable Length" in item and i + 1 < len(arr):
-            variables[f"Length{suffix}"] = arr[i + 1]
-            break
+    Returns:
+        dict: имя ориентира -> [(x0, y0, x1, y1, правый край строки), ...]
+              в порядке слов; ненайденных ориентиров в индексе нет
+    """
+    landmarks = {}
+    line = []
+    for word in [*words, None]:
+        if line and (word is None or word[5:7] != line[0][5:7]):
+            line_x1 = max(w[2] for w in line)
+            for i, first in enumerate(line):
+                match = _LANDMARK_FIRST.fullmatch(first[4])
+                if match is None:
+                    continue
+                k = int(match.lastgroup[1:])
+                rest = _LANDMARK_REST[k]
+                hit = line[i:i + 1 + len(rest)]
+                if len(hit) <= len(rest) or not all(p.fullmatch(w[4]) for p, w in zip(rest, hit[1:])):
+                    continue
+                landmarks.setdefault(_LANDMARK_NAMES[k], []).append((
+                    first[0], min(w[1] for w in hit), hit[-1][2], max(w[3] for w in hit), line_x1,
+                ))
+            line = []
+        if word is not None:
+            line.append(word)
+    return landmarks
+
+
+def index_page(page):
+    """Слова страницы и индекс ориентиров по ним: {"words", "landmarks"}"""
+    words = page.get_text("words")
+    return {"words": words, "landmarks": page_landmarks(words)}
+
+
+def page_index(doc, page_num, indexes=None):
+    """Индекс страницы из indexes (список или dict по номерам страниц) или новый"""
+    if indexes is not None:
+        try:
+            return indexes[page_num]
+        except (IndexError, KeyError):
+            pass
+    return index_page(doc[page_num])
+
+
+def line_landmarks(lines):
+    """
+    Индекс ориентиров по строкам page_text_lines (одна строка - один
+    «блок»; у слов рамка всей строки)
+    """
+    words = [
+        (x0, y0, x1, y0, text, n, 0, 0)
+        for n, (line, x0, y0, x1) in enumerate(lines)
+        for text in line.split()
+    ]
+    return page_landmarks(words)
+
+
+# Колонки Takeoff: левые края строк дальше этого расстояния, pt, - разные колонки;
+# группа меньше TAKEOFF_COLUMN_MIN_LINES строк (номер страницы, сноска) колонкой не считается
+TAKEOFF_COLUMN_GAP = 36
+TAKEOFF_COLUMN_MIN_LINES = 3
+
+
+def cluster_columns(starts, min_gap=TAKEOFF_COLUMN_GAP, min_lines=TAKEOFF_COLUMN_MIN_LINES):
+    """
+    Левые края колонок по левым краям строк
     
-    for i, item in enumerate(arr):
-        if "Runway Surface" in item and i + 1 < len(arr):
-            variables[f"Surface{suffix}"] = arr[i + 1]
-            break
+    Отсортированные края, между которыми больше min_gap, начинают новую
+    колонку; группа меньше min_lines строк присоединяется к соседней.
     
-    wind_idx = -1
-    temp_idx = -1
-    for i, item in enumerate(arr):
-        if "Wind" in item:
-            wind_idx = i
-        elif "Temperature" in item:
-            temp_idx = i
-            break
+    Returns:
+        list: возрастающие левые края колонок (пустой, если строк нет)
+    """
+    groups = []
+    for x in sorted(starts):
+        if groups and x - groups[-1][-1] <= min_gap:
+            groups[-1].append(x)
+        else:
+            groups.append([x])
+    
+    merged = []
+    pending = []
+    for group in groups:
+        if len(group) < min_lines and merged:
+            merged[-1].extend(group)
+            continue
+        pending.extend(group)
+        if len(pending) >= min_lines:
+            merged.append(pending)
+            pending = []
+    if pending:
+        if merged:
+            merged[-1].extend(pending)
+        else:
+            merged.append(pending)
+    return [group[0] for group in merged]
+
+
+def split_columns(page, target_phrase="All Engines Operating"):
+    """
+    Строки страницы Takeoff по колонкам ВПП выше target_phrase
     
-    if wind_idx != -1 and temp_idx != -1 and wind_idx < temp_idx:
-        wind_content = " ".join(arr[wind_idx + 1 : temp_idx])
-        variables[f"Wind{suffix}"] = wind_content
+    Колонок сколько угодно: они находятся кластеризацией левых краёв строк
+    (cluster_columns). На странице без target_phrase берутся все строки.
     
-    for i, item in enumerate(arr):
-        if "Altimeter" in item and i + 1 < len(arr):
-            next_item = arr[i + 1]
-            if "/" in next_item:
-                variables[f"Altimeter{suffix}"] = next_item.split("/", 1)[1].strip()
-            else:
-                variables[f"Altimeter{suffix}"] = next_item
-            break
+    Returns:
+        list[list[str]]: строки колонок слева направо
+    """
+    # Фраза ищется в тех же строках; search_for - только если она разбита на строки
+    lines = page_text_lines(page)
+    if target_phrase in LANDMARKS:
+        hits = line_landmarks(lines).get(target_phrase)
+        phrase_y = hits[0][1] if hits else None
+    else:
+        phrase_y = next((y0 for text, _, y0, _ in lines if target_phrase in text), None)
+    if phrase_y is None:
+        text_instances = page.search_for(target_phrase)
+        if text_instances:
+            phrase_y = text_instances[0].y0
+    if phrase_y is not None:
+        lines = [line for line in lines if line[2] < phrase_y]
+    
+    edges = cluster_columns([x0 for _, x0, _, _ in lines])
+    columns = [[] for _ in edges]
+    for text, x0, _, _ in lines:
+        columns[max(0, bisect.bisect_right(edges, x0) - 1)].append(text)
+    return columns
+
+
+# === ИЗВЛЕЧЕНИЕ ТАБЛИЦ ===
+def projection_boundaries(intervals, min_gap):
+    """
+    Находит границы колонок по промежуткам в x-проекции отрезков (x0, x1).
+
+    Проекция строится как гистограмма занятости с шагом 1 pt; каждая пустая
+    полоса шириной не меньше min_gap даёт границу по своей середине.
+
+    Returns:
+        np.ndarray: возрастающие границы, включая крайние
+    """
+    import numpy as np
+
+    intervals = np.asarray(intervals, dtype=float).reshape(-1, 2)
+    if not len(intervals):
+        return np.array([], dtype=float)
+
+    origin = np.floor(intervals[:, 0].min())
+    start = np.floor(intervals[:, 0] - origin).astype(int)
+    stop = np.maximum(np.ceil(intervals[:, 1] - origin).astype(int), start + 1)
+    width = int(stop.max())
+
+    delta = np.zeros(width + 1, dtype=int)
+    np.add.at(delta, start, 1)
+    np.add.at(delta, stop, -1)
+    occupied = np.cumsum(delta[:-1]) > 0
+
+    edges = np.diff(occupied.astype(int))
+    gap_start = np.flatnonzero(edges == -1) + 1
+    gap_stop = np.flatnonzero(edges == 1) + 1
+    wide = (gap_stop - gap_start) >= min_gap
+    inner = (gap_start[wide] + gap_stop[wide]) / 2 + origin
+    return np.concatenate(([origin], inner, [origin + width]))
+
+
+def extract_table(words, header_words=(), min_gap=None, anchor_column=None):
+    """
+    Собирает таблицу из слов get_text("words") без заранее заданных координат
+
+    Колонки определяются промежутками x-проекции слов вместе со словами
+    заголовка; если в одну колонку попали несколько подписей заголовка,
+    она делится посередине между ними. Строки — кластеры базовых линий.
+
+    Args:
+        words: слова тела таблицы
+        header_words: слова строки заголовка (подписи колонок)
+        min_gap: минимальная ширина промежутка между колонками, pt
+                 (по умолчанию 0.75 высоты строки)
+        anchor_column: подпись или номер колонки; строка без слова
+                       в этой колонке присоединяется к предыдущей
+
+    Returns:
+        pd.DataFrame: текст ячеек, колонки подписаны текстом заголовка
+    """
+    import numpy as np
+    import pandas as pd
+
+    boxes = np.array([w[:4] for w in words], dtype=float).reshape(-1, 4)
+    texts = [w[4] for w in words]
+    head_boxes = np.array([w[:4] for w in header_words], dtype=float).reshape(-1, 4)
+    head_texts = [w[4] for w in header_words]
+    all_boxes = np.vstack([boxes, head_boxes])
+    if not len(all_boxes):
+        return pd.DataFrame()
+
+    heights = all_boxes[:, 3] - all_boxes[:, 1]
+    if min_gap is None:
+        min_gap = 0.75 * float(np.median(heights))
+    bounds = projection_boundaries(all_boxes[:, [0, 2]], min_gap)
+
+    # Подписи заголовка: слова, стоящие ближе min_gap, образуют одну подпись
+    groups = []
+    if len(head_boxes):
+        head_centers = (head_boxes[:, 0] + head_boxes[:, 2]) / 2
+        group_bounds = projection_boundaries(head_boxes[:, [0, 2]], min_gap)
+        group_idx = np.searchsorted(group_bounds, head_centers, side="right") - 1
+        for g in np.unique(group_idx):
+            members = np.flatnonzero(group_idx == g)
+            members = members[np.argsort(head_boxes[members, 0])]
+            groups.append((
+                head_boxes[members, 0].min(),
+                head_boxes[members, 2].max(),
+                " ".join(head_texts[m] for m in members),
+            ))
+
+        # Слитые колонки делятся между соседними подписями
+        extra = []
+        for (x0_prev, x1_prev, _), (x0_next, x1_next, _) in zip(groups, groups[1:]):
+            centers = np.array([(x0_prev + x1_prev) / 2, (x0_next + x1_next) / 2])
+            col_prev, col_next = np.searchsorted(bounds, centers, side="right")
+            if col_prev == col_next:
+                extra.append((x1_prev + x0_next) / 2)
+        bounds = np.unique(np.concatenate([bounds, extra]))
+
+    num_cols = max(len(bounds) - 1, 1)
+    labels = [""] * num_cols
+    for x0, x1, text in groups:
+        col = min(max(int(np.searchsorted(bounds, (x0 + x1) / 2, side="right")) - 1, 0), num_cols - 1)
+        labels[col] = f"{labels[col]} {text}".strip()
+
+    if isinstance(anchor_column, str):
+        anchor_column = labels.index(anchor_column) if anchor_column in labels else None
+
+    if not len(boxes):
+        return pd.DataFrame(columns=labels)
+
+    # Колонка каждого слова — по центру
+    centers_x = (boxes[:, 0] + boxes[:, 2]) / 2
+    col_idx = np.clip(np.searchsorted(bounds, centers_x, side="right") - 1, 0, num_cols - 1)
+
+    # Строки: кластеры базовых линий
+    baselines = boxes[:, 3]
+    order = np.argsort(baselines, kind="stable")
+    line_tol = 0.5 * float(np.median(boxes[:, 3] - boxes[:, 1]))
+    breaks = np.diff(baselines[order]) > line_tol
+    line_idx = np.empty(len(boxes), dtype=int)
+    line_idx[order] = np.concatenate(([0], np.cumsum(breaks)))
+    num_lines = int(line_idx.max()) + 1
+
+    if anchor_column is not None:
+        has_anchor = np.zeros(num_lines, dtype=bool)
+        has_anchor[line_idx[col_idx == anchor_column]] = True
+        row_of_line = np.maximum(np.cumsum(has_anchor) - 1, 0)
+    else:
+        row_of_line = np.arange(num_lines)
+    row_idx = row_of_line[line_idx]
+    num_rows = int(row_idx.max()) + 1
+
+    cells = [[[] for _ in range(num_cols)] for _ in range(num_rows)]
+    for k in np.lexsort((boxes[:, 0], line_idx, col_idx, row_idx)):
+        cells[row_idx[k]][col_idx[k]].append(texts[k])
+
+    data = [[" ".join(cell) for cell in row] for row in cells]
+    return pd.DataFrame(data, columns=labels)
+
+
+# === ПОЛЯ ДОКУМЕНТА TAKEOFF ===
+def value_after_slash(value):
+    """'29.92 / 1013' -> '1013'"""
+    if "/" in value:
+        return value.split("/", 1)[1].strip()
+    return value
+
+
+# Описание полей: метка, номер её вхождения, исключающий шаблон,
+# стоп-метка (значение — строки между меткой и стоп-меткой) и постобработка.
+# Без стоп-метки значением служит строка, следующая за меткой.
+TAKEOFF_FIELDS = (
+    {"name": "Runway", "label": re.compile(r"Runway"), "occurrence": 2},
+    {"name": "Length", "label": re.compile(r"Usable Length")},
+    {"name": "Surface", "label": re.compile(r"Runway Surface")},
+    {"name": "Wind", "label": re.compile(r"Wind"), "until": re.compile(r"Temperature")},
+    {"name": "Altimeter", "label": re.compile(r"Altimeter"), "convert": value_after_slash},
+    {"name": "Distance", "label": re.compile(r"Distance"),
+     "exclude": re.compile(r"Safety Distance Factor"), "convert": value_after_slash},
+)
+
+
+def compile_field_filter(fields):
+    """Общий шаблон всех меток: строки без меток пропускаются одной проверкой"""
+    patterns = []
+    for field in fields:
+        patterns.append(field["label"].pattern)
+        if "until" in field:
+            patterns.append(field["until"].pattern)
+    return re.compile("|".join(f"(?:{p})" for p in patterns))
+
+
+_TAKEOFF_FIELD_FILTER = compile_field_filter(TAKEOFF_FIELDS)
+
+
+def extract_variables(arr, suffix, fields=TAKEOFF_FIELDS):
+    """
+    Извлекает поля колонки Takeoff за один проход по строкам
+
+    Args:
+        arr: list[str] - строки колонки
+        suffix: str - суффикс имён переменных ("1", "2", ...)
+        fields: описание полей (по умолчанию TAKEOFF_FIELDS)
+
+    Returns:
+        dict: {f"{name}{suffix}": значение}
+    """
+    label_filter = _TAKEOFF_FIELD_FILTER if fields is TAKEOFF_FIELDS else compile_field_filter(fields)
+    variables = {}
+    counts = [0] * len(fields)
+    label_idx = [-1] * len(fields)
+    pending = list(range(len(fields)))
     
     for i, item in enumerate(arr):
-        if "Distance" in item and "Safety Distance Factor" not in item and i + 1 < len(arr):
-            next_item = arr[i + 1]
-            if "/" in next_item:
-                variables[f"Distance{suffix}"] = next_item.split("/", 1)[1].strip()
-            else:
-                variables[f"Distance{suffix}"] = next_item
+        if not pending:
             break
+        if not label_filter.search(item):
+            continue
+        
+        for k in list(pending):
+            field = fields[k]
+            is_label = field["label"].search(item) is not None
+            if is_label and "exclude" in field and field["exclude"].search(item):
+                is_label = False
+            
+            if "until" in field:
+                # Значение — строки между последней меткой и стоп-меткой
+                if is_label:
+                    label_idx[k] = i
+                elif field["until"].search(item):
+                    if label_idx[k] != -1:
+                        value = " ".join(arr[label_idx[k] + 1 : i])
+                        variables[f"{field['name']}{suffix}"] = field.get("convert", str)(value)
+                    pending.remove(k)
+            elif is_label:
+                counts[k] += 1
+                if counts[k] == field.get("occurrence", 1) and i + 1 < len(arr):
+                    variables[f"{field['name']}{suffix}"] = field.get("convert", str)(arr[i + 1])
+                    pending.remove(k)
     
     return variables
 
 
+_RUNWAY_NUMBER_RE = re.compile(r'^\d+$')
+_RUNWAY_SIDE_RE = re.compile(r'^(\d+)([LR])$')
+_DIGITS_RE = re.compile(r'\d+')
+_WIND_KTS_RE = re.compile(r'(\d+(?:-\d+)?)\s*kts', re.IGNORECASE)
+_WIND_DEGREE_RE = re.compile(r'(\d+)°T')
+_WIND_WORD_RE = re.compile(r'headwind|tailwind', re.IGNORECASE)
+# Сторона боковой составляющей в тексте ForeFlight: 'Left'/'Right' или буква L/R
+_CROSSWIND_SIDE_RE = re.compile(r'(?<![A-Za-z0-9])((?i:left|right)|[LR])(?![A-Za-z])')
+
+
 def process_runway_variable(runway_value, suffix):
     if not runway_value:
         return runway_value, runway_value
     
     runway0 = runway_value.strip()
-    if re.match(r'^\d+$', runway0):
+    side_match = _RUNWAY_SIDE_RE.match(runway0)
+    if _RUNWAY_NUMBER_RE.match(runway0):
         num = int(runway0)
         if num < 18:
             new_runway = f"{num:02d}/{num+18:02d}"
@@ -144,9 +916,8 @@ def process_runway_variable(runway_value, suffix):
             new_runway = f"{num-18:02d}/{num:02d}"
         return runway0, new_runway
     
-    elif re.match(r'^\d+[LR]$', runway0):
-        num_part = re.findall(r'\d+', runway0)[0]
-        letter_part = re.findall(r'[LR]', runway0)[0]
+    elif side_match:
+        num_part, letter_part = side_match.groups()
         runway0_numeric = num_part
         opposite_letter = 'L' if letter_part == 'R' else 'R'
         num = int(num_part)
@@ -158,7 +929,7 @@ def process_runway_variable(runway_value, suffix):
     
     elif '/' in runway0:
         before_slash = runway0.split('/')[0]
-        numeric_part = re.findall(r'\d+', before_slash)
+        numeric_part = _DIGITS_RE.findall(before_slash)
         if numeric_part:
             runway0_numeric = numeric_part[0]
         else:
@@ -175,8 +946,8 @@ def process_wind_variable(wind_value, runway0_value, suffix):
         return wind_value, wind_value
     
     wind0 = wind_value.strip()
-    kts_matches = list(re.finditer(r'(\d+(?:-\d+)?)\s*kts', wind0, re.IGNORECASE))
-    degree_match = re.search(r'(\d+)°T', wind0)
+    kts_matches = list(_WIND_KTS_RE.finditer(wind0))
+    degree_match = _WIND_DEGREE_RE.search(wind0)
     
     if len(kts_matches) >= 3 and degree_match:
         wind_x_1_full = kts_matches[1].group(1)
@@ -190,26 +961,29 @@ def process_wind_variable(wind_value, runway0_value, suffix):
         try:
             runway0_num = int(runway0_value)
         except ValueError:
-            runway0_numeric_match = re.search(r'\d+', str(runway0_value))
+            runway0_numeric_match = _DIGITS_RE.search(str(runway0_value))
             if runway0_numeric_match:
                 runway0_num = int(runway0_numeric_match.group())
             else:
                 return wind0, wind0
         
-        abs_val_1 = abs(runway0_num * 10 - wind_x_1)
-        if 90 <= abs_val_1 <= 270:
-            wind_x_1_str = "H" + str(wind_x_1)
+        # H и L/R - по тексту ForeFlight (он учитывает склонение); расчёт по
+        # магнитному ветру - только когда ForeFlight их не указал
+        headwind, crosswind = wind_components([runway0_num * 10], [magnetic_wind(int(degree_match.group(1)))],
+                                              [wind_x_4])
+        word = _WIND_WORD_RE.search(wind0)
+        if word:
+            is_headwind = word.group().lower() == "headwind"
         else:
-            wind_x_1_str = "T" + str(wind_x_1)
-        
-        abs_val_2 = abs(runway0_num * 10 - wind_x_2)
-        if abs_val_2 > 0:
-            if (runway0_num * 10 - wind_x_2) > 0:
-                wind_x_2_str = "L" + str(wind_x_2)
-            else:
-                wind_x_2_str = "R" + str(wind_x_2)
+            is_headwind = headwind[0, 0] >= 0
+        crosswind_end = kts_matches[3].start() if len(kts_matches) > 3 else len(wind0)
+        side = _CROSSWIND_SIDE_RE.search(wind0, kts_matches[1].end(), crosswind_end)
+        if side:
+            is_right = side.group()[0].upper() == "R"
         else:
-            wind_x_2_str = "L" + str(wind_x_2)
+            is_right = crosswind[0, 0] > 0
+        wind_x_1_str = ("H" if is_headwind else "T") + str(wind_x_1)
+        wind_x_2_str = ("R" if is_right else "L") + str(wind_x_2)
         
         new_wind = f"{wind_x_1_str}/{wind_x_2_str} ({wind_x_3}/{wind_x_4})"
         return wind0, new_wind
@@ -217,285 +991,1704 @@ def process_wind_variable(wind_value, runway0_value, suffix):
         return wind0, wind0
 
 
-def process_two_pdfs(file1_bytes, file2_bytes, name1, name2):
+# === СОСТАВЛЯЮЩИЕ ВЕТРА ===
+# ВПП обозначены по магнитному курсу, ForeFlight даёт ветер в °T: перед расчётом
+# составляющих ветер переводится в магнитный. Склонение района полётов, градусы,
+# восточное положительное (магнитный = истинный - склонение)
+MAGNETIC_VARIATION = float(os.environ.get("FLIGHTLOG_MAGNETIC_VARIATION", "0"))
+_RUNWAY_END_RE = re.compile(r'\b(0?[1-9]|[12]\d|3[0-6])([LRC]?)\b')
+
+
+def runway_ends(text):
+    """'13/31 04L/22R' -> ['13', '31', '04L', '22R']"""
+    return [num.zfill(2) + side for num, side in _RUNWAY_END_RE.findall(text or "")]
+
+
+_WIND_SAMPLE_RE = re.compile(r'(\d+)°T\s*(\d+)(?:-(\d+))?\s*kts', re.IGNORECASE)
+
+
+def parse_winds(wind_values):
     """
-    Обрабатывает два PDF файла и возвращает байты Excel-файла
-    
-    Args:
-        file1_bytes: bytes - содержимое первого PDF
-        file2_bytes: bytes - содержимое второго PDF
-        name1: str - имя первого файла
-        name2: str - имя второго файла
+    Варианты ветра из строк ForeFlight: каждая группа 'ddd°T ss kts';
+    с порывами ('12-15 kts') - два варианта, средний ветер и порыв
     
     Returns:
-        bytes: содержимое сгенерированного Excel-файла
+        list: [(направление °T, скорость kt)]
     """
-    # === ОПРЕДЕЛЕНИЕ ФАЙЛОВ ===
-    is_takeoff_1 = is_takeoff_file(file1_bytes)
-    is_takeoff_2 = is_takeoff_file(file2_bytes)
-    
-    if is_takeoff_1 == is_takeoff_2:
-        raise ValueError(
-            "Один файл должен содержать 'Takeoff' в начале, другой — нет. "
-            "Проверьте корректность загруженных файлов."
-        )
-    
-    if is_takeoff_1:
-        takeoff_bytes, takeoff_name = file1_bytes, name1
-        main_bytes, main_name = file2_bytes, name2
-    else:
-        takeoff_bytes, takeoff_name = file2_bytes, name2
-        main_bytes, main_name = file1_bytes, name1
-    
-    # === ОТКРЫТИЕ ДОКУМЕНТОВ ===
-    doc_main = fitz.open(stream=main_bytes, filetype="pdf")
-    doc_takeoff = fitz.open(stream=takeoff_bytes, filetype="pdf")
+    if isinstance(wind_values, str) or wind_values is None:
+        wind_values = [wind_values]
+    samples = []
+    for value in wind_values:
+        for direction, speed, gust in _WIND_SAMPLE_RE.findall(value or ""):
+            samples.append((int(direction), int(speed)))
+            if gust:
+                samples.append((int(direction), int(gust)))
+    return samples
+
+
+def magnetic_wind(direction, variation=None):
+    """Направление ветра °T -> магнитное (склонение по умолчанию MAGNETIC_VARIATION)"""
+    variation = MAGNETIC_VARIATION if variation is None else variation
+    return (direction - variation) % 360
+
+
+def wind_components(runway_headings, wind_directions, wind_speeds):
+    """
+    Встречная и боковая составляющие ветра для всех ВПП и вариантов ветра
+
+    Курсы и направления должны быть в одной системе отсчёта: ВПП - по
+    магнитному курсу, поэтому ветер ForeFlight (°T) переводится magnetic_wind.
     
-    try:
-        # === ЛИСТ 1: ОСНОВНОЕ ===
-        lines = extract_first_n_lines_from_doc(doc_main, n=32)
-        while len(lines) < 32:
-            lines.append("")
-        
-        wb = Workbook()
-        ws1 = wb.active
-        ws1.title = "Основное"
-        ws1.cell(row=1, column=1, value=lines[0])
-        ws1.cell(row=2, column=1, value=lines[1])
-        ws1.cell(row=1, column=7, value=lines[2])
-        ws1.cell(row=2, column=7, value=lines[3])
-        
-        block1 = lines[4:18]
-        if len(block1) == 14:
-            for col in range(7):
-                ws1.cell(row=4, column=1 + col, value=block1[col * 2])
-                ws1.cell(row=5, column=1 + col, value=block1[col * 2 + 1])
-        
-        block2 = lines[18:32]
-        if len(block2) == 14:
-            for col in range(7):
-                ws1.cell(row=7, column=1 + col, value=block2[col * 2])
-                ws1.cell(row=8, column=1 + col, value=block2[col * 2 + 1])
-        
-        bold_font = Font(bold=True)
-        left_align = Alignment(horizontal="left", vertical="top")
-        right_align = Alignment(horizontal="right", vertical="top")
-        
-        ws1['A1'].font = bold_font
-        ws1['A1'].alignment = left_align
-        ws1['G1'].alignment = right_align
-        ws1['G2'].alignment = right_align
-        
+    Args:
+        runway_headings: магнитные курсы торцов ВПП, градусы
+        wind_directions: магнитные направления ветра (откуда дует), градусы
+        wind_speeds: скорости ветра, kt
+
+    Returns:
+        tuple: (headwind, crosswind) формы (ВПП, ветер);
+               headwind < 0 — попутный, crosswind > 0 — справа
+    """
+    import numpy as np
+
+    headings = np.radians(np.asarray(runway_headings, dtype=float))[:, None]
+    directions = np.radians(np.asarray(wind_directions, dtype=float))[None, :]
+    speeds = np.asarray(wind_speeds, dtype=float)[None, :]
+    angle = directions - headings
+    return speeds * np.cos(angle), speeds * np.sin(angle)
+
+
+def best_runway(ends, wind_directions, wind_speeds):
+    """
+    Лучший торец ВПП для набора вариантов ветра: максимум встречной
+    составляющей в худшем варианте, при равенстве — минимум наибольшей боковой
+
+    Returns:
+        tuple: (торец, headwind, crosswind) - худшие по вариантам значения:
+               наименьшая встречная и наибольшая по модулю боковая (со знаком);
+               None, если нет торцов или ветра
+    """
+    import numpy as np
+
+    if not ends or not len(wind_directions):
+        return None
+    headings = [int(_DIGITS_RE.search(end).group()) * 10 for end in ends]
+    headwind, crosswind = wind_components(headings, wind_directions, wind_speeds)
+    worst_head = headwind.min(axis=1)
+    worst_cross = crosswind[np.arange(len(ends)), np.abs(crosswind).argmax(axis=1)]
+    best = np.lexsort((np.abs(worst_cross).round(1), -worst_head.round(1)))[0]
+    return ends[best], float(worst_head[best]), float(worst_cross[best])
+
+
+def suggest_runway(runway_texts, wind_values, variation=None):
+    """
+    Рекомендуемый торец ВПП для ветра ForeFlight, например '13 (H10/L0)'
+    
+    Ветер - строка или список строк, все варианты (parse_winds) оцениваются
+    вместе (best_runway). Торцы с одинаковым номером берутся из первого
+    текста, где они встретились: первым передаётся обозначение из Takeoff
+    ('17L'), затем ВПП таблицы аэродромов ('17/35').
+    """
+    winds = parse_winds(wind_values)
+    ends = {}
+    for text in runway_texts:
+        for end in runway_ends(text):
+            ends.setdefault(_DIGITS_RE.search(end).group(), end)
+    if not winds or not ends:
+        return ""
+    directions = [magnetic_wind(direction, variation) for direction, _ in winds]
+    end, headwind, crosswind = best_runway(list(ends.values()), directions, [speed for _, speed in winds])
+    head = ("H" if headwind >= 0 else "T") + str(round(abs(headwind)))
+    cross = ("R" if crosswind > 0 else "L") + str(round(abs(crosswind)))
+    return f"{end} ({head}/{cross})"
+
+
+# === РАЗБОР ОСНОВНОГО ДОКУМЕНТА ===
+ROUTE_GRID_COLUMNS = [
+    "WAYPOINT", "AIRWAY", "HDG", "CRS", "ALT", "CMP", "DIR/SPD", "ISA",
+    "TAS", "GS", "LEG", "REM", "USED", "REM", "ACT", "LEG", "REM", "ETE", "ACT"
+]
+
+
+def route_header_y(landmarks):
+    """
+    Середина строки заголовка WAYPOINT ... ACT по индексу ориентиров страницы или None
+    
+    Заголовок - первый WAYPOINT, правее которого в пределах 5 pt по высоте
+    есть ACT. Вхождения ACT сортируются по середине и для окна по высоте
+    берётся максимум x0 из разреженной таблицы: на странице с тысячами
+    WAYPOINT и ACT не в одной строке поиск не перебирает все пары.
+    """
+    acts = sorted(((wy0 + wy1) / 2, wx0) for wx0, wy0, wx1, wy1, _ in landmarks.get("ACT", ()))
+    if not acts:
+        return None
+    centers = [center for center, _ in acts]
+    # max_x0[k][i] - наибольший x0 среди acts[i:i + 2**k]
+    max_x0 = [[x0 for _, x0 in acts]]
+    while 2 ** len(max_x0) <= len(acts):
+        prev, step = max_x0[-1], 2 ** (len(max_x0) - 1)
+        max_x0.append([max(prev[i], prev[i + step]) for i in range(len(prev) - step)])
+    
+    for x0, y0, x1, y1, _ in landmarks.get("WAYPOINT", ()):
+        center = (y0 + y1) / 2
+        lo = bisect.bisect_right(centers, center - 5)
+        hi = bisect.bisect_left(centers, center + 5)
+        if lo < hi:
+            k = (hi - lo).bit_length() - 1
+            if max(max_x0[k][lo], max_x0[k][hi - 2 ** k]) > x0:
+                return center
+    return None
+
+
+def parse_route_grid(page, index=None):
+    """
+    Разбирает таблицу маршрута (WAYPOINT ... ACT) страницы навлога
+    
+    Args:
+        page: страница с таблицей
+        index: index_page(page), если уже построен
+    
+    Returns:
+        pd.DataFrame: строки маршрута с колонками ROUTE_GRID_COLUMNS
+    """
+    import pandas as pd
+    
+    index = index_page(page) if index is None else index
+    all_words = index["words"]
+    landmarks = index["landmarks"]
+    
+    # Поиск заголовка таблицы
+    target_y = route_header_y(landmarks)
+    
+    if target_y is None and "MAG" in landmarks:
+        x0, y0, x1, y1, _ = landmarks["MAG"][0]
+        target_y = (y0 + y1) / 2 + 15
+    
+    if target_y is None:
+        raise ValueError("Не найдена строка заголовка таблицы маршрута.")
+    
+    # Извлечение заголовков
+    header_keywords = ["WAYPOINT", "AIRWAY", "HDG", "CRS", "ALT", "CMP", "DIR/SPD", "ISA", 
+                      "TAS", "GS", "LEG", "REM", "USED", "ACT", "ETE"]
+    tolerance = 5.0
+    header_words = [
+        w for w in all_words
+        if abs((w[1] + w[3]) / 2 - target_y) <= tolerance and w[4] in header_keywords
+    ]
+    
+    if not any(w[4] == "ALT" for w in header_words):
+        raise ValueError("Не найдены координаты слова 'ALT'.")
+    
+    # Нижняя граница таблицы
+    bottom = landmarks.get("ALTERNATE") or landmarks.get("2000 FT ISA")
+    y0_alternate = bottom[0][1] if bottom else None
+    
+    if y0_alternate is None:
+        raise ValueError("Не найдена нижняя граница таблицы маршрута.")
+    
+    # Парсинг сетки: колонки по промежуткам, строки по словам колонки ALT
+    header_bottom = max(w[3] for w in header_words)
+    body_words = [
+        w for w in all_words
+        if header_bottom <= (w[1] + w[3]) / 2 <= y0_alternate - 2
+    ]
+    df_grid = extract_table(body_words, header_words, anchor_column="ALT")
+    
+    exact_columns = ROUTE_GRID_COLUMNS
+    
+    data_grid = []
+    for row in df_grid.itertuples(index=False):
+        row_data = list(row[:len(exact_columns)])
+        row_data += [''] * (len(exact_columns) - len(row_data))
+        data_grid.append(row_data)
+    
+    df = pd.DataFrame(data_grid, columns=exact_columns)
+    return df
+
+
+# === ЧИСЛОВЫЕ КОЛОНКИ МАРШРУТА ===
+# Вычисленные колонки Main_Route_Grid: (группа в строке 1, заголовок, колонка route_numbers)
+ROUTE_CHECK_SHEET_COLUMNS = [
+    ("ALT", "FT", "ALT_FT"),
+    ("CUMULATIVE", "DIST NM", "DIST_CUM"),
+    (None, "TIME MIN", "TIME_CUM"),
+    (None, "FUEL G", "FUEL_CUM"),
+    ("CHECK", "DIST", "DIST_MISMATCH"),
+    (None, "FUEL", "FUEL_MISMATCH"),
+    (None, "TIME", "TIME_MISMATCH"),
+]
+# Допуски сверки: значения в навлоге округлены (мили до 1, топливо до 0.1, время до минуты)
+ROUTE_CHECK_TOLERANCE = {"dist": 1.0, "fuel": 0.15, "time": 1.0}
+# Позиции ROUTE_GRID_COLUMNS с числами: HDG, CRS, ALT, TAS, GS, дистанция, топливо, время
+ROUTE_NUMERIC_COLUMNS = (2, 3, 4, 8, 9, 10, 11, 12, 13, 15, 16, 17)
+_NUMBER_PATTERN = r'(-?\d+(?:\.\d+)?)'
+
+
+def parse_route_values(values):
+    """
+    Разбор строк навлога в числа одним проходом по всему массиву
+    
+    Returns:
+        tuple: (number, altitude, minutes) - массивы float той же формы, что values:
+               первое число строки ('12.3', '1,250', '240/15'), высота в футах
+               ('FL085' -> 8500, '3500' -> 3500), время в минутах ('1:05' -> 65,
+               '12' -> 12); NaN там, где числа нет
+    """
+    import numpy as np
+    import pandas as pd
+    
+    values = np.asarray(values, dtype=object)
+    strings = pd.Series(values.ravel()).fillna("").astype(str).str.strip().str.upper()
+    
+    def numeric(series):
+        return pd.to_numeric(series, errors="coerce").to_numpy(float)
+    
+    number = numeric(strings.str.replace(",", "", regex=False).str.extract(_NUMBER_PATTERN, expand=False))
+    flight_level = numeric(strings.str.extract(r'^FL\s*(\d+)', expand=False)) * 100
+    parts = strings.str.extract(r'(\d+)\s*[:+H]\s*(\d{1,2})')
+    hours_minutes = numeric(parts[0]) * 60 + numeric(parts[1])
+    
+    altitude = np.where(np.isnan(flight_level), number, flight_level)
+    minutes = np.where(np.isnan(hours_minutes), number, hours_minutes)
+    return tuple(array.reshape(values.shape) for array in (number, altitude, minutes))
+
+
+def _mismatch(actual, expected, tolerance):
+    """Расхождение больше допуска; там, где сравнить нечего (NaN), - False"""
+    import numpy as np
+    
+    with np.errstate(invalid="ignore"):
+        return np.abs(actual - expected) > tolerance + 1e-9
+
+
+def route_numbers(df):
+    """
+    Числовые колонки Main_Route_Grid, накопленные итоги и сверка
+    
+    Колонки берутся по позициям ROUTE_GRID_COLUMNS (имена LEG и REM
+    повторяются). Накопленные дистанция, время и топливо считаются от первой
+    строки. Сверка строки i с предыдущей:
+        DIST_MISMATCH - LEG не равен убыванию REM дистанции;
+        TIME_MISMATCH - LEG не равен убыванию REM времени;
+        FUEL_MISMATCH - USED не сходится с убыванием REM топлива.
+    USED в навлогах бывает на участок или нарастающим итогом: принимается
+    соглашение с меньшей средней ошибкой, оно в attrs["fuel_used"]
+    ("leg" или "cumulative").
+    
+    Returns:
+        pd.DataFrame: ALT_FT, HDG, CRS, TAS, GS, DIST_LEG, DIST_REM, FUEL_USED,
+                      FUEL_REM, TIME_LEG, TIME_REM, ETE (минуты), DIST_CUM,
+                      TIME_CUM, FUEL_CUM и флаги *_MISMATCH
+    """
+    import numpy as np
+    import pandas as pd
+    
+    def previous(values):
+        return np.concatenate(([np.nan], values[:-1]))
+    
+    # Нужные колонки разбираются одним массивом: накладные расходы pandas на вызов не растут с их числом
+    grid = np.full((len(df), len(ROUTE_NUMERIC_COLUMNS)), "", dtype=object)
+    for k, index in enumerate(ROUTE_NUMERIC_COLUMNS):
+        if index < df.shape[1]:
+            grid[:, k] = df.iloc[:, index].to_numpy(dtype=object)
+    number, altitude, minutes = parse_route_values(grid)
+    
+    def col(values, index):
+        return values[:, ROUTE_NUMERIC_COLUMNS.index(index)]
+    
+    dist_leg = col(number, 10)
+    dist_rem = col(number, 11)
+    fuel_used = col(number, 12)
+    fuel_rem = col(number, 13)
+    time_leg = col(minutes, 15)
+    time_rem = col(minutes, 16)
+    
+    # Убывание остатков: к предыдущей строке и к первой
+    fuel_drop_leg = previous(fuel_rem) - fuel_rem
+    fuel_drop_total = fuel_rem[0] - fuel_rem if len(fuel_rem) else fuel_rem
+    
+    with np.errstate(invalid="ignore"):
+        error_leg = np.abs(fuel_used - fuel_drop_leg)[1:]
+        error_total = np.abs(fuel_used - fuel_drop_total)[1:]
+    comparable = ~np.isnan(error_leg) & ~np.isnan(error_total)
+    cumulative = comparable.any() and error_total[comparable].mean() < error_leg[comparable].mean()
+    
+    if cumulative:
+        fuel_cum = fuel_used - (fuel_used[0] if len(fuel_used) and not np.isnan(fuel_used[0]) else 0.0)
+        fuel_mismatch = _mismatch(fuel_used, fuel_drop_total, ROUTE_CHECK_TOLERANCE["fuel"])
+    else:
+        fuel_cum = np.nancumsum(np.concatenate(([0.0], fuel_used[1:]))) if len(fuel_used) else fuel_used
+        fuel_mismatch = _mismatch(fuel_used, fuel_drop_leg, ROUTE_CHECK_TOLERANCE["fuel"])
+    if len(fuel_mismatch):
+        fuel_mismatch[0] = False
+    
+    numbers = pd.DataFrame({
+        "ALT_FT": col(altitude, 4),
+        "HDG": col(number, 2),
+        "CRS": col(number, 3),
+        "TAS": col(number, 8),
+        "GS": col(number, 9),
+        "DIST_LEG": dist_leg,
+        "DIST_REM": dist_rem,
+        "FUEL_USED": fuel_used,
+        "FUEL_REM": fuel_rem,
+        "TIME_LEG": time_leg,
+        "TIME_REM": time_rem,
+        "ETE": col(minutes, 17),
+        "DIST_CUM": np.nancumsum(np.concatenate(([0.0], dist_leg[1:]))) if len(dist_leg) else dist_leg,
+        "TIME_CUM": np.nancumsum(np.concatenate(([0.0], time_leg[1:]))) if len(time_leg) else time_leg,
+        "FUEL_CUM": fuel_cum,
+        "DIST_MISMATCH": _mismatch(dist_leg, previous(dist_rem) - dist_rem, ROUTE_CHECK_TOLERANCE["dist"]),
+        "FUEL_MISMATCH": fuel_mismatch,
+        "TIME_MISMATCH": _mismatch(time_leg, previous(time_rem) - time_rem, ROUTE_CHECK_TOLERANCE["time"]),
+    }, index=df.index)
+    numbers.attrs["fuel_used"] = "cumulative" if cumulative else "leg"
+    return numbers
+
+
+def route_check_summary(numbers):
+    """Итоги и число расхождений для metrics["route_check"]"""
+    def last(name):
+        return None if numbers.empty else round(float(numbers[name].iloc[-1]), 1)
+    
+    return {
+        "rows": len(numbers),
+        "fuel_used": numbers.attrs.get("fuel_used"),
+        "distance": last("DIST_CUM"),
+        "time_min": last("TIME_CUM"),
+        "fuel": last("FUEL_CUM"),
+        "mismatches": {
+            name: int(numbers[f"{name.upper()}_MISMATCH"].sum()) for name in ("dist", "fuel", "time")
+        },
+    }
+
+
+def parse_airport_table(doc, pages=None, indexes=None):
+    """
+    Разбирает таблицу аэродромов с первой страницы, где есть 'AIRPORT'
+    
+    Args:
+        pages: номера страниц для поиска (участок плана); по умолчанию все
+        indexes: уже построенные индексы страниц (index_page)
+    
+    Returns:
+        pd.DataFrame | None: строки DEP/DEST, колонки подписаны заголовком
+    """
+    index = None
+    for page_num in (range(len(doc)) if pages is None else pages):
+        index = page_index(doc, page_num, indexes)
+        if "AIRPORT" in index["landmarks"]:
+            break
+    else:
+        return None
+    
+    words = index["words"]
+    landmarks = index["landmarks"]
+    airport_coords = landmarks["AIRPORT"][0][:4]
+    
+    # Нижняя граница: строка DEST или первая строка под заголовком
+    table_bottom = None
+    dest_coords = next((hit[:4] for hit in landmarks.get("DEST", ()) if hit[1] > airport_coords[3]), None)
+    
+    if dest_coords is not None:
+        table_bottom = dest_coords[3] + 2
+    else:
+        words_below_airport = [w for w in words if w[1] > airport_coords[3]]
+        if words_below_airport:
+            min_y0_below = min([w[1] for w in words_below_airport])
+            table_bottom = min_y0_below + 15 + 2
+        else:
+            table_bottom = airport_coords[3] + 50
+    
+    # Извлечение таблицы: строки начинаются с метки DEP/DEST в первой колонке
+    airport_center_y = (airport_coords[1] + airport_coords[3]) / 2
+    header_words = [w for w in words if abs((w[1] + w[3]) / 2 - airport_center_y) < 5]
+    body_words = [
+        w for w in words
+        if airport_coords[3] + 2 <= (w[1] + w[3]) / 2 <= table_bottom
+    ]
+    df_airport = extract_table(body_words, header_words, anchor_column=0)
+    return df_airport
+
+
+def parse_airport_maps(doc):
+    """
+    Подписи схем аэродромов с последней страницы основного документа
+    
+    Сами схемы здесь не извлекаются: их декодирует и уменьшает
+    airport_diagrams - после предпросмотра отчёта.
+    
+    Returns:
+        dict: dep_title, dest_title
+    """
+    last_page = doc[-1]
+    # Подписи - первые строки; блоки схем с данными изображений не извлекаются
+    lines = page_lines(last_page, limit=4)
+    
+    text_A1 = "DEP LFMQ" if len(lines) < 2 else lines[1]
+    text_A28 = "DEST LFMV" if len(lines) < 4 else lines[3]
+    
+    return {"dep_title": text_A1, "dest_title": text_A28}
+
+
+def airport_diagrams(doc, metrics, timer=None):
+    """
+    PNG схем аэродромов 500×500 с последней страницы основного документа
+    
+    Готовые PNG берутся из кэша по хэшу сжатого потока изображения в PDF:
+    при попадании схема не извлекается и не декодируется. С timer перед
+    декодированием каждой схемы проверяется бюджет памяти: распакованный
+    скан может занимать в сотни раз больше исходного файла.
+    
+    Returns:
+        list: PNG схем
+    """
+    from PIL import Image as PILImage
+    
+    images = []
+    cache = get_diagram_cache()
+    cache_stats = metrics.setdefault("diagram_cache", {"hits": 0, "misses": 0})
+    for img in doc[-1].get_images(full=True):
+        xref, width, height = img[0], img[2], img[3]
+        source = doc.xref_object(xref, compressed=True).encode() + doc.xref_stream_raw(xref)
+        cache_key = f"{digest(source)}-{DIAGRAM_SIZE[0]}x{DIAGRAM_SIZE[1]}.png"
+        png_bytes = cache.get(cache_key) if cache else None
+        
+        if png_bytes is None:
+            cache_stats["misses"] += 1
+            if timer is not None:
+                timer.reserve(width * height * 4)
+            image_bytes = doc.extract_image(xref)["image"]
+            pil_img = PILImage.open(io.BytesIO(image_bytes))
+            pil_img = pil_img.resize(DIAGRAM_SIZE, PILImage.LANCZOS)
+            
+            img_buffer = io.BytesIO()
+            pil_img.save(img_buffer, format='PNG')
+            png_bytes = img_buffer.getvalue()
+            if cache:
+                cache.put(cache_key, png_bytes)
+        else:
+            cache_stats["hits"] += 1
+        
+        images.append(png_bytes)
+    
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    cache_stats["hit_rate"] = round(cache_stats["hits"] / lookups, 3) if lookups else 0.0
+    
+    return images
+
+
+def render_header_image(page, index=None):
+    """
+    Снимок шапки плана: от первой строки до 'Route' и 'Landing Fuel'
+    
+    Ориентиры берутся из индекса страницы: верхний по (y0, x0) - одним
+    проходом по найденным вхождениям, без сортировки всех слов страницы.
+    
+    Returns:
+        dict | None: png - PNG 150 dpi, size - (ширина, высота) в пикселях
+    """
+    import fitz
+    
+    index = index_page(page) if index is None else index
+    words = index["words"]
+    landmarks = index["landmarks"]
+    
+    if words:
+        first_word = min(words, key=lambda w: (w[1], w[0]))
+        x01 = first_word[0]
+        y01 = first_word[1]
+        
+        topmost = {
+            name: min(landmarks[name], key=lambda hit: (hit[1], hit[0]))
+            for name in ("Route", "Landing Fuel") if name in landmarks
+        }
+        # Правый край - конец строки 'Landing Fuel' вместе со значением
+        y02 = topmost["Route"][1] if "Route" in topmost else None
+        x02 = topmost["Landing Fuel"][4] if "Landing Fuel" in topmost else None
+        
+        if y02 is not None and x02 is not None:
+            clip_rect = fitz.Rect(
+                x01 - 5,
+                y01 - 3,
+                x02 + 30,
+                y02 - 15
+            )
+            
+            if clip_rect.x0 < 0: clip_rect.x0 = 0
+            if clip_rect.y0 < 0: clip_rect.y0 = 0
+            if clip_rect.x1 > page.rect.width: clip_rect.x1 = page.rect.width
+            if clip_rect.y1 > page.rect.height: clip_rect.y1 = page.rect.height
+            
+            if not clip_rect.is_empty and clip_rect.get_area() >= 1:
+                pix = page.get_pixmap(dpi=150, clip=clip_rect)
+                return {"png": pix.tobytes("png"), "size": (pix.width, pix.height)}
+    return None
+
+
+# === ПУЛ ПРОЦЕССОВ ДЛЯ СТРАНИЦ ===
+def _die_with_parent():
+    """Инициализатор воркера пула: SIGKILL при гибели родителя (Linux prctl)"""
+    try:
+        import ctypes
+        import signal
+        ctypes.CDLL(None).prctl(1, signal.SIGKILL)  # PR_SET_PDEATHSIG
+    except (OSError, AttributeError):
+        pass
+
+
+def page_pool_context():
+    """
+    Контекст процессов пула страниц
+    
+    В дочернем процессе isolation (однопоточном) - fork: модули уже
+    загружены, воркеры стартуют мгновенно. В сервере с потоками fork
+    небезопасен - forkserver isolation с заранее импортированными модулями.
+    """
+    import multiprocessing
+    
+    if multiprocessing.parent_process() is not None:
+        return multiprocessing.get_context("fork")
+    from isolation import get_context
+    return get_context()
+
+
+def default_page_workers():
+    """
+    Процессов разбора страниц на одну обработку по умолчанию
+    
+    FLIGHTLOG_PAGE_WORKERS задаёт число явно. Иначе ядра делятся между
+    обработками, которые очередь (JobQueue) выполняет одновременно: у каждой
+    изолированной обработки свой пул, и пулы на все ядра дали бы порядка
+    ядер² процессов. При воркерах очереди по числу ядер (по умолчанию)
+    изолированная обработка разбирает страницы по очереди, а параллельно
+    идут сами обработки.
+    """
+    if PAGE_WORKERS > 0:
+        return PAGE_WORKERS
+    from job_queue import current_concurrency
+    return max(1, (os.cpu_count() or 1) // current_concurrency())
+
+
+def get_page_pool(workers):
+    """
+    Общий пул процессов разбора страниц: создаётся при первом параллельном
+    разборе и переиспользуется, чтобы не платить за запуск процессов на каждый
+    план. В дочернем процессе isolation пул живёт одну обработку (fork).
+    """
+    global _page_pool
+    from concurrent.futures import ProcessPoolExecutor
+    
+    with _page_pool_lock:
+        # После fork пул родителя в дочернем процессе недействителен
+        if _page_pool is not None and _page_pool[:2] != (os.getpid(), workers):
+            if _page_pool[0] == os.getpid():
+                _page_pool[2].shutdown(wait=False)
+            _page_pool = None
+        if _page_pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=page_pool_context(),
+                initializer=_die_with_parent,
+            )
+            _page_pool = (os.getpid(), workers, pool)
+        return _page_pool[2]
+
+
+def reset_page_pool():
+    """Останавливает общий пул страниц (пул со сломанным воркером заменяется новым)"""
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is not None and _page_pool[0] == os.getpid():
+            _page_pool[2].shutdown(wait=False, cancel_futures=True)
+        _page_pool = None
+
+
+def _timed(parse, doc, args):
+    started = time.perf_counter()
+    return parse(doc, *args), time.perf_counter() - started
+
+
+def _page_job(source, parse, args):
+    """Задача пула: открывает документ в воркере и вызывает parse(doc, *args)"""
+    doc = open_pdf(source)
+    try:
+        return _timed(parse, doc, args)
+    finally:
+        doc.close()
+
+
+def map_pages(doc, source, parse, jobs, workers=None):
+    """
+    parse(doc, *args) для каждого args из jobs; с workers > 1 - параллельно
+    
+    Задачи со второй уходят в общий пул процессов (get_page_pool; каждый
+    воркер открывает документ из source заново: документ PyMuPDF нельзя
+    делить между потоками, а разбор держит GIL), первая выполняется тем
+    временем здесь же. Время - примерно время самой долгой задачи.
+    
+    Args:
+        doc: открытый документ
+        source: источник документа для open_pdf в воркерах (путь или bytes);
+                None - всё выполняется здесь по очереди
+        parse: функция уровня модуля (передаётся воркерам через pickle)
+        jobs: list - аргументы задач; у первой могут быть непередаваемые
+              через pickle данные (она выполняется здесь)
+        workers: int - процессов вместе с текущим; по умолчанию default_page_workers
+    
+    Returns:
+        list: (результат, секунды) по порядку jobs
+    """
+    workers = default_page_workers() if workers is None else workers
+    if workers <= 1 or len(jobs) <= 1 or source is None:
+        return [_timed(parse, doc, args) for args in jobs]
+    
+    from concurrent.futures.process import BrokenProcessPool
+    
+    if isinstance(source, memoryview):
+        source = bytes(source)
+    pool = get_page_pool(workers - 1)
+    futures = [pool.submit(_page_job, source, parse, args) for args in jobs[1:]]
+    try:
+        first = _timed(parse, doc, jobs[0])
+        return [first] + [future.result() for future in futures]
+    except BrokenProcessPool:
+        reset_page_pool()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+# === УЧАСТКИ ПЛАНА ===
+def find_leg_pages(indexes):
+    """
+    Страницы с таблицей маршрута (строка WAYPOINT ... ACT): по одной на участок
+    
+    Args:
+        indexes: индексы всех страниц документа (index_page)
+    
+    Returns:
+        list: номера страниц по возрастанию
+    """
+    return [page_num for page_num, index in enumerate(indexes)
+            if route_header_y(index["landmarks"]) is not None]
+
+
+def airport_titles(df_airport):
+    """Подписи вылета и прибытия участка по таблице аэродромов: 'DEP LFMQ', 'DEST LFMV'"""
+    titles = []
+    for row, label in enumerate(("DEP", "DEST")):
+        if df_airport is not None and row < len(df_airport) and len(df_airport.columns) > 1:
+            label = " ".join(str(v) for v in df_airport.iloc[row, :2] if v) or label
+        titles.append(label)
+    return {"dep_title": titles[0], "dest_title": titles[1], "images": []}
+
+
+def parse_leg(doc, start, stop, indexes=None):
+    """
+    Участок многоучасткового плана: таблица маршрута на странице start,
+    таблица аэродромов - первая на страницах start..stop-1
+    
+    Подписи аэродромов берутся из таблицы аэродромов участка; схемы
+    (последняя страница документа) общие и в участок не входят.
+    
+    Args:
+        indexes: индексы страниц (index_page); в воркере строятся заново
+    
+    Returns:
+        dict: page, route, airports, maps, header_image - как у parse_main_document
+    """
+    index = page_index(doc, start, indexes)
+    airports = parse_airport_table(doc, range(start, stop), {start: index} if indexes is None else indexes)
+    return {
+        "page": start,
+        "route": parse_route_grid(doc[start], index),
+        "airports": airports,
+        "maps": airport_titles(airports),
+        "header_image": render_header_image(doc[start], index),
+    }
+
+
+def parse_legs(doc, source, leg_pages, indexes=None, workers=None):
+    """
+    Разбирает участки; с несколькими участками - параллельно (map_pages)
+    
+    Args:
+        doc: открытый документ
+        source: источник документа для воркеров (путь или bytes)
+        leg_pages: list - результат find_leg_pages
+        indexes: индексы страниц (index_page) для участка, разбираемого на месте
+        workers: int - процессов; по умолчанию default_page_workers
+    
+    Returns:
+        list: участки (parse_leg) по порядку страниц, у каждого seconds
+    """
+    starts = list(leg_pages)
+    ranges = list(zip(starts, starts[1:] + [len(doc)]))
+    # Первый участок разбирается на месте по готовым индексам; в воркеры их не передаём
+    jobs = [ranges[0] + (indexes,)] + ranges[1:]
+    legs = []
+    for leg, seconds in map_pages(doc, source, parse_leg, jobs, workers):
+        leg["seconds"] = seconds
+        legs.append(leg)
+    return legs
+
+
+_PLAN_DATE_RE = re.compile(
+    r"\b(?:(?P<iso>\d{4}-\d{2}-\d{2})"
+    r"|(?P<day>\d{1,2})\s?(?P<month>JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)[A-Z]*\s?(?P<year>\d{4}|\d{2}))\b",
+    re.IGNORECASE,
+)
+_PDF_DATE_RE = re.compile(r"D:(\d{4})(\d{2})(\d{2})")
+
+
+def plan_date(doc, lines=()):
+    """
+    Дата плана: первая дата в верхних строках первой страницы
+    (2026-10-19, 19 OCT 2026, 19OCT26), иначе дата создания PDF
+    
+    Returns:
+        str | None: YYYY-MM-DD; None, если даты в документе нет
+    """
+    from datetime import date, datetime
+    
+    for match in _PLAN_DATE_RE.finditer(" ".join(lines)):
+        try:
+            if match.group("iso"):
+                return date.fromisoformat(match.group("iso")).isoformat()
+            year = match.group("year")
+            text = f"{match.group('day')} {match.group('month')[:3]} {year}"
+            return datetime.strptime(text, "%d %b %Y" if len(year) == 4 else "%d %b %y").date().isoformat()
+        except ValueError:
+            continue
+    
+    match = _PDF_DATE_RE.match((doc.metadata or {}).get("creationDate") or "")
+    if match:
+        try:
+            return date(*map(int, match.groups())).isoformat()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_main_document(doc, timer=None, metrics=None, source=None, workers=None):
+    """
+    Разбирает основной документ: всё, что нужно для листов кроме ForeFlight
+    
+    Если таблица маршрута есть на нескольких страницах, каждая такая
+    страница - отдельный участок (parse_legs, с source - параллельно
+    в workers процессах).
+    route, airports и header_image верхнего уровня - первого участка.
+    
+    Returns:
+        dict: lines, date (plan_date), route, airports, maps, header_image,
+              legs - участки (page, route, airports, maps, header_image)
+    """
+    metrics = {} if metrics is None else metrics
+    timer = timer or StageTimer({})
+    
+    timer.start("main_sheet")
+    lines = extract_first_n_lines_from_doc(doc, n=32)
+    date = plan_date(doc, lines)
+    while len(lines) < 32:
+        lines.append("")
+    
+    timer.start("route_grid")
+    indexes = [index_page(page) for page in doc]
+    leg_pages = find_leg_pages(indexes)
+    
+    if len(leg_pages) > 1:
+        legs = parse_legs(doc, source, leg_pages, indexes, workers)
+        metrics["legs"] = [
+            {"page": leg["page"] + 1, "rows": len(leg["route"]), "seconds": round(leg.pop("seconds"), 6)}
+            for leg in legs
+        ]
+        route, airports, header_image = legs[0]["route"], legs[0]["airports"], legs[0]["header_image"]
+        
+        timer.start("airport_maps")
+        maps = parse_airport_maps(doc)
+    else:
+        route = parse_route_grid(doc[0], indexes[0])
+        
+        timer.start("airport_table")
+        airports = parse_airport_table(doc, indexes=indexes)
+        
+        timer.start("airport_maps")
+        maps = parse_airport_maps(doc)
+        
+        timer.start("header_image")
+        header_image = render_header_image(doc[0], indexes[0])
+        legs = [{"page": 0, "route": route, "airports": airports, "maps": maps, "header_image": header_image}]
+    
+    return {
+        "lines": lines,
+        "date": date,
+        "route": route,
+        "airports": airports,
+        "maps": maps,
+        "header_image": header_image,
+        "legs": legs,
+    }
+
+
+# === РАЗБОР ДОКУМЕНТА TAKEOFF ===
+# Страниц Takeoff, с которых разбор идёт в пуле: страница разбирается за
+# миллисекунды, и для пары страниц запуск задач в пуле дороже самого разбора
+TAKEOFF_PARALLEL_PAGES = 4
+
+
+def takeoff_column_variables(lines, suffix):
+    """Переменные колонки Takeoff: поля TAKEOFF_FIELDS, торцы ВПП и разложенный ветер"""
+    variables = extract_variables(lines, suffix)
+    
+    if f"Runway{suffix}" in variables:
+        runway0, new_runway = process_runway_variable(variables[f"Runway{suffix}"], suffix)
+        variables[f"Runway0{suffix}"] = runway0
+        variables[f"Runway{suffix}"] = new_runway
+    
+    if f"Wind{suffix}" in variables and f"Runway0{suffix}" in variables:
+        wind0, new_wind = process_wind_variable(variables[f"Wind{suffix}"], variables[f"Runway0{suffix}"], suffix)
+        variables[f"Wind0{suffix}"] = wind0
+        variables[f"Wind{suffix}"] = new_wind
+    
+    return variables
+
+
+def _takeoff_page_columns(doc, page_num):
+    return split_columns(doc[page_num], "All Engines Operating")
+
+
+def parse_takeoff_document(doc, source=None, workers=None):
+    """
+    Разбирает все страницы документа Takeoff на колонки ВПП и переменные
+    
+    Колонки нумеруются подряд по страницам слева направо: переменные
+    колонки k - Runway{k}, Wind{k}, ... Первая колонка - вылет, вторая -
+    прибытие. С source и не меньше TAKEOFF_PARALLEL_PAGES страниц страницы
+    разбираются параллельно в workers процессах (map_pages).
+    
+    Returns:
+        dict: columns - строки колонок (не меньше двух), left, right - первые две;
+              variables - переменные по колонкам
+    """
+    jobs = [(page_num,) for page_num in range(len(doc))]
+    if len(jobs) < TAKEOFF_PARALLEL_PAGES:
+        source = None
+    columns = [
+        column
+        for page_columns, _ in map_pages(doc, source, _takeoff_page_columns, jobs, workers)
+        for column in page_columns
+    ]
+    while len(columns) < 2:
+        columns.append([])
+    
+    variables = [takeoff_column_variables(lines, str(k)) for k, lines in enumerate(columns, start=1)]
+    return {"columns": columns, "left": columns[0], "right": columns[1], "variables": variables}
+
+
+# === СБОРКА ОТЧЁТА ===
+def compact_image(data):
+    """
+    Самое короткое представление изображения для профиля compact
+    
+    Пробует PNG с палитрой (или в оттенках серого, если изображение серое)
+    и JPEG; исходник остаётся, если ни один вариант не меньше. Результат
+    кэшируется вместе со схемами аэродромов.
+    """
+    import numpy as np
+    from PIL import Image as PILImage
+    
+    cache = get_diagram_cache()
+    cache_key = f"{digest(data)}-compact"
+    cached = cache.get(cache_key) if cache else None
+    if cached is not None:
+        return cached
+    
+    img = PILImage.open(io.BytesIO(data)).convert("RGB")
+    pixels = np.asarray(img, dtype=np.int16)
+    is_gray = int((pixels.max(axis=2) - pixels.min(axis=2)).max()) <= 8
+    
+    if is_gray:
+        reduced = img.convert("L")
+    else:
+        reduced = img.quantize(colors=COMPACT_PALETTE_COLORS)
+    
+    candidates = [data]
+    for image, params in (
+        (reduced, {"format": "PNG", "optimize": True}),
+        (img.convert("L") if is_gray else img,
+         {"format": "JPEG", "quality": COMPACT_JPEG_QUALITY, "optimize": True}),
+    ):
+        buffer = io.BytesIO()
+        image.save(buffer, **params)
+        candidates.append(buffer.getvalue())
+    
+    best = min(candidates, key=len)
+    if cache:
+        cache.put(cache_key, best)
+    return best
+
+
+def xlsx_size_breakdown(source):
+    """
+    Сжатый размер частей xlsx по листам
+    
+    Листу засчитываются его XML, связи и всё, на что он ссылается
+    (рисунки, изображения); остальное (стили, строки) - в "shared".
+    
+    Returns:
+        dict: sheets - {имя листа: байты}, shared - байты
+    """
+    import posixpath
+    import zipfile
+    from xml.etree import ElementTree
+    
+    main_ns = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+    rel_attr = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+    rel_tag = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+    
+    with zipfile.ZipFile(source) as archive:
+        sizes = {info.filename: info.compress_size for info in archive.infolist()}
+        
+        def relations(part):
+            folder, name = posixpath.split(part)
+            rels_part = posixpath.join(folder, "_rels", name + ".rels")
+            if rels_part not in sizes:
+                return None, {}
+            targets = {}
+            for rel in ElementTree.fromstring(archive.read(rels_part)).iter(rel_tag):
+                if rel.get("TargetMode") == "External":
+                    continue
+                target = rel.get("Target")
+                if target.startswith("/"):
+                    target = target[1:]
+                else:
+                    target = posixpath.normpath(posixpath.join(folder, target))
+                targets[rel.get("Id")] = target
+            return rels_part, targets
+        
+        def collect(part, seen):
+            if part in seen or part not in sizes:
+                return
+            seen.add(part)
+            rels_part, targets = relations(part)
+            if rels_part:
+                seen.add(rels_part)
+            for target in targets.values():
+                collect(target, seen)
+        
+        _, workbook_targets = relations("xl/workbook.xml")
+        workbook_xml = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        sheets = {}
+        claimed = set()
+        for sheet in workbook_xml.iter(f"{main_ns}sheet"):
+            parts = set()
+            collect(workbook_targets.get(sheet.get(rel_attr)), parts)
+            parts -= claimed
+            claimed |= parts
+            sheets[sheet.get("name")] = sum(sizes[p] for p in parts)
+    
+    shared = sum(size for name, size in sizes.items() if name not in claimed)
+    return {"sheets": sheets, "shared": shared}
+
+
+def save_workbook(wb, output, profile="full"):
+    """
+    Записывает книгу в путь или файловый объект с seek
+    
+    Returns:
+        tuple: (размер xlsx в байтах, xlsx_size_breakdown или None,
+                если output нельзя прочитать обратно)
+    """
+    import zipfile
+    from datetime import datetime, timezone
+    from openpyxl.writer.excel import ExcelWriter
+    
+    compresslevel = 9 if profile == "compact" else None
+    is_path = isinstance(output, (str, os.PathLike))
+    start = 0 if is_path else output.tell()
+    
+    archive = zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED, allowZip64=True,
+                              compresslevel=compresslevel)
+    wb.properties.modified = datetime.now(timezone.utc).replace(tzinfo=None)
+    ExcelWriter(wb, archive).save()
+    
+    if is_path:
+        return os.path.getsize(output), xlsx_size_breakdown(output)
+    
+    output.flush()
+    end = output.tell()
+    try:
+        output.seek(start)
+        breakdown = xlsx_size_breakdown(output)
+    except (OSError, ValueError, zipfile.BadZipFile):
+        breakdown = None
+    finally:
+        output.seek(end)
+    return end - start, breakdown
+
+
+def round_up_10(value):
+    """Округление вверх до десятков (высота круга над превышением)"""
+    return (value // 10 + (1 if value % 10 != 0 else 0)) * 10
+
+
+def airport_column(df_airport, *labels):
+    """
+    Номер колонки таблицы аэродромов по подписи заголовка
+    
+    Подпись сравнивается по частям ("TWR/CTAF" - "TWR" и "CTAF"): число
+    колонок extract_table зависит от промежутков на странице, и номер
+    колонки у разных планов разный.
+    
+    Returns:
+        int | None: первая колонка с одной из подписей labels; None, если её нет
+    """
+    if df_airport is None:
+        return None
+    for col, header in enumerate(df_airport.columns):
+        parts = re.split(r"[/\s]+", str(header).strip().upper())
+        if any(label in parts for label in labels):
+            return col
+    return None
+
+
+def airport_info(df_airport, row, title, variables, k):
+    """
+    Данные блока вылета/прибытия: строка таблицы аэродромов и переменные Takeoff
+    
+    Колонки ищутся по подписям заголовка (airport_column); поле без своей
+    колонки остаётся пустым.
+    
+    Args:
+        df_airport: pd.DataFrame | None - таблица аэродромов
+        row: int - строка аэродрома (0 - вылет, 1 - прибытие)
+        title: str - подпись со страницы схем
+        variables: dict - переменные стороны k листа ForeFlight
+        k: int - номер стороны (1, 2)
+    """
+    def airport_cell(*labels):
+        col = airport_column(df_airport, *labels)
+        if col is None or row >= len(df_airport):
+            return None
+        return df_airport.iloc[row, col]
+    
+    elevation_raw = airport_cell("ELEV")
+    try:
+        elevation = round(float(elevation_raw)) if elevation_raw else 0
+    except (ValueError, TypeError):
+        elevation = 0
+    
+    return {
+        "title": title,
+        "elevation": elevation,
+        "circuit": round_up_10(elevation + 300),
+        "atis": airport_cell("WX", "ATIS"),
+        "twr": airport_cell("TWR"),
+        "gnd": airport_cell("GND"),
+        "exp_rwy": variables.get(f"Runway0{k}"),
+        "rwy": variables.get(f"Runway{k}"),
+        "length": variables.get(f"Length{k}"),
+        "surface": variables.get(f"Surface{k}"),
+        "exp_wind": variables.get(f"Wind{k}"),
+        "exp_qnh": variables.get(f"Altimeter{k}"),
+        "req_dist": variables.get(f"Distance{k}"),
+    }
+
+
+def airport_briefing(label, info):
+    """Текст блока вылета/прибытия Generated_Sheet"""
+    def blank(value):
+        return value or "_____"
+    
+    return (
+        f"{label} ({info['title']}, ______,{info['elevation']}, {info['circuit']}, _____ , "
+        f"Exp. RWY: {blank(info['exp_rwy'])}\n"
+        f"ATIS: {blank(info['atis'])}; GND: {blank(info['gnd'])}; TWR: {blank(info['twr'])};\n"
+        f"RWY: {blank(info['rwy'])}; Length: {blank(info['length'])}; "
+        f"Req. Dist.: {blank(info['req_dist'])}; Surface: {blank(info['surface'])};\n"
+        f"Exp. Wind: {blank(info['exp_wind'])}; Exp. QNH: {blank(info['exp_qnh'])}; Exp. TWY:_____\n"
+        f"RWY: ____ ; Wind: ________; QNH: _______; Squak: ________"
+    )
+
+
+FLIGHT_LOG_INFO_LINE = (
+    "Tacho start: ______ Off Block: ______ Take Off: ______ Tacho end: ______ Landing: ______ On Block: ______"
+)
+
+FLIGHT_LOG_FOOTER = (
+    "TEM (Threats error management), CANWE (Crew, Aircraft, Notam, Weather, Environment)\n"
+    "After T/O: Flaps, Lights, Engine        Approach: QNH, Mixture, Fuel, Flaps\n"
+    "Landing: Mixture, Flaps, Lights         After Landing: Heat, Light, Flaps\n"
+    "Waypoint: Top, Track, Altitude, Radio, Engine, Estimates, Area\n"
+    "Diversion: Aircraft Endurance, Terrain, Infrastructure, Weather, Airport\n"
+    "Arrival Briefing (Treats, RWY, Top Of Descent, Integration, Missed Aproach, Holding time, Landing configuration and speed, Taxiway, Apron)"
+)
+
+
+def flight_log_data(main, takeoff):
+    """
+    Модель бортового журнала (Generated_Sheet) из результатов разбора
+    
+    Общая для листа Generated_Sheet и PDF-журнала (render_flight_log_pdf).
+    
+    Returns:
+        dict: waypoints - точки маршрута (name, alt, hdg, crs, dist, time, efob),
+              departure, destination - данные блоков аэродромов (airport_info),
+              variables - переменные ForeFlight обеих сторон с BestRunway{k},
+              header_image - снимок шапки плана
+    """
+    df = main["route"]
+    df_airport = main["airports"]
+    maps = main["maps"]
+    
+    airport_runways = []
+    runway_col = airport_column(df_airport, "RWY")
+    if runway_col is not None:
+        airport_runways = df_airport.iloc[:, runway_col].tolist()
+    
+    # Рекомендуемый торец: ВПП из Takeoff (её обозначение главнее) и ВПП аэродрома (строка DEP/DEST)
+    variables = [dict(v) for v in takeoff["variables"]]
+    for k, side in enumerate(variables, start=1):
+        runway_texts = [side.get(f"Runway{k}", "")]
+        if len(airport_runways) >= k:
+            runway_texts.append(airport_runways[k - 1])
+        suggestion = suggest_runway(runway_texts, side.get(f"Wind0{k}"))
+        if suggestion:
+            side[f"BestRunway{k}"] = suggestion
+    
+    # Колонки Main_Route_Grid: 0 WAYPOINT, 2 HDG, 3 CRS, 4 ALT, 10 LEG, 13 REM (топливо), 15 LEG (время)
+    waypoints = [
+        {
+            "name": row[0],
+            "alt": row[4],
+            "hdg": row[2],
+            "crs": row[3],
+            "dist": row[10],
+            "time": row[15],
+            "efob": row[13],
+        }
+        for row in df.itertuples(index=False)
+    ]
+    
+    return {
+        "waypoints": waypoints,
+        "departure": airport_info(df_airport, 0, maps["dep_title"], variables[0], 1),
+        "destination": airport_info(df_airport, 1, maps["dest_title"], variables[1], 2),
+        "variables": variables,
+        "header_image": main["header_image"],
+    }
+
+
+def leg_sheet_title(name, k):
+    """Имя листа участка k (с нуля): первый - name, дальше name_2, name_3, ..."""
+    return name if k == 0 else f"{name}_{k + 1}"
+
+
+def write_route_grid_sheet(wb, title, df, numbers):
+    """
+    Лист таблицы маршрута (Main_Route_Grid) одного участка
+    
+    Справа от колонок df через одну пустую выводятся высота в футах,
+    накопленные итоги и сверка строк из numbers (route_numbers).
+    """
+    from openpyxl.styles import Font, Alignment, PatternFill
+    from openpyxl.utils import get_column_letter
+    from openpyxl.utils.dataframe import dataframe_to_rows
+    
+    ws2 = wb.create_sheet(title=title)
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_font = Font(color="FFFFFF", bold=True)
+    align_center = Alignment(horizontal="center", vertical="center")
+    
+    # Заголовки на строку 2
+    for c_idx, col_name in enumerate(df.columns, start=1):
+        cell = ws2.cell(row=2, column=c_idx, value=col_name)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = align_center
+    
+    # Данные — начиная со строки 3
+    for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=False), start=3):
+        for c_idx, value in enumerate(row, start=1):
+            ws2.cell(row=r_idx, column=c_idx, value=value)
+    
+    # Стилизация и объединение строки 1
+    num_cols = len(df.columns)
+    for col_idx in range(1, num_cols + 1):
+        cell = ws2.cell(row=1, column=col_idx)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = align_center
+    
+    ws2.merge_cells(start_row=1, start_column=3, end_row=1, end_column=4)
+    ws2.cell(row=1, column=3, value="MAG")
+    ws2.merge_cells(start_row=1, start_column=6, end_row=1, end_column=7)
+    ws2.cell(row=1, column=6, value="WIND")
+    ws2.merge_cells(start_row=1, start_column=9, end_row=1, end_column=10)
+    ws2.cell(row=1, column=9, value="SPD KT")
+    ws2.merge_cells(start_row=1, start_column=11, end_row=1, end_column=12)
+    ws2.cell(row=1, column=11, value="DIST NM")
+    ws2.merge_cells(start_row=1, start_column=13, end_row=1, end_column=14)
+    ws2.cell(row=1, column=13, value="FUEL G")
+    ws2.merge_cells(start_row=1, start_column=16, end_row=1, end_column=18)
+    ws2.cell(row=1, column=16, value="TIME")
+    
+    # Вычисленные колонки через одну пустую: высота, итоги, сверка
+    first_col = num_cols + 2
+    mismatch_fill = PatternFill(start_color="F8D7DA", end_color="F8D7DA", fill_type="solid")
+    for offset, (group, header, name) in enumerate(ROUTE_CHECK_SHEET_COLUMNS):
+        col_idx = first_col + offset
+        for r_idx, label in ((1, group), (2, header)):
+            cell = ws2.cell(row=r_idx, column=col_idx, value=label)
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = align_center
+        for r_idx, value in enumerate(numbers[name].tolist(), start=3):
+            if name.endswith("_MISMATCH"):
+                cell = ws2.cell(row=r_idx, column=col_idx, value="MISMATCH" if value else "OK")
+                if value:
+                    cell.fill = mismatch_fill
+            else:
+                ws2.cell(row=r_idx, column=col_idx, value=None if value != value else value)
+    ws2.merge_cells(start_row=1, start_column=first_col + 1, end_row=1, end_column=first_col + 3)
+    ws2.merge_cells(start_row=1, start_column=first_col + 4, end_row=1, end_column=first_col + 6)
+    
+    # Автоширина столбцов
+    max_col = ws2.max_column
+    for col_idx in range(1, max_col + 1):
+        max_len = 0
+        for row in ws2.iter_rows(min_col=col_idx, max_col=col_idx, min_row=1, max_row=ws2.max_row):
+            cell = row[0]
+            if hasattr(cell, 'value') and cell.value is not None:
+                try:
+                    max_len = max(max_len, len(str(cell.value)))
+                except:
+                    pass
+        adjusted_width = min(max_len + 2, 50)
+        ws2.column_dimensions[get_column_letter(col_idx)].width = adjusted_width
+
+
+def merge_range(ws, merged, start_row, start_column, end_row, end_column):
+    """
+    ws.merge_cells без квадратичной проверки пересечений
+    
+    openpyxl сравнивает каждый новый диапазон со всеми прежними
+    (MultiCellRange.__contains__), и Generated_Sheet плана на тысячи точек
+    собирался за квадратичное время (bench_scaling: этап workbook около 48 с
+    на 30 тыс. слов). Пересечения проверяются здесь по набору merged - уже
+    объединённых ячеек листа, - за время, пропорциональное размеру диапазона.
+    
+    Диапазон добавляется в набор листа напрямую и оформляется закрытым
+    Worksheet._clean_merge_range - поэтому requirements.txt ограничивает
+    openpyxl ветвью 3.1, где он и MultiCellRange.ranges устроены так.
+    
+    Raises:
+        ValueError: диапазон пересекается с уже объединённым
+    """
+    cells = {(row, col) for row in range(start_row, end_row + 1) for col in range(start_column, end_column + 1)}
+    if not merged.isdisjoint(cells):
+        raise ValueError(f"Объединение строк {start_row}-{end_row}, колонок {start_column}-{end_column} "
+                         f"пересекается с уже объединёнными ячейками листа {ws.title}")
+    merged |= cells
+    
+    from openpyxl.worksheet.cell_range import CellRange
+    from openpyxl.worksheet.merge import MergedCellRange
+    
+    coord = CellRange(min_col=start_column, min_row=start_row, max_col=end_column, max_row=end_row).coord
+    merged_range = MergedCellRange(ws, coord)
+    ws.merged_cells.ranges.add(merged_range)
+    ws._clean_merge_range(merged_range)
+
+
+def write_generated_sheet(wb, title, log, encode_image):
+    """Лист бортового журнала (Generated_Sheet) по модели flight_log_data"""
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    from openpyxl.drawing.image import Image as XLImage
+    from openpyxl.worksheet.page import PageMargins
+    
+    if title in wb.sheetnames:
+        wb.remove(wb[title])
+    ws = wb.create_sheet(title=title)
+    # Ячейки, уже входящие в объединения листа (merge_range)
+    merged = set()
+    
+    default_font = Font(name='Helvetica Neue', size=11)
+    col_widths = {'A': 5, 'B': 22, 'C': 8, 'D': 8, 'E': 8, 'F': 8, 'G': 8, 'H': 31}
+    for col, width in col_widths.items():
+        ws.column_dimensions[col].width = width
+    
+    bold_gray_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
+    bold_font = Font(name='Helvetica Neue', size=11, bold=True)
+    header_font = Font(name='Helvetica Neue', size=11, bold=True)
+    
+    thin_border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    
+    offset_rows = 7
+    
+    # Убираем границы у первых 7 строк
+    for row in range(1, offset_rows + 1):
+        for col in range(1, 9):
+            cell = ws.cell(row=row, column=col)
+            cell.border = Border()
+    
+    # Информационная строка
+    info_row = offset_rows
+    merge_range(ws, merged, start_row=info_row, start_column=1, end_row=info_row, end_column=8)
+    info_cell = ws.cell(row=info_row, column=1)
+    info_cell.value = FLIGHT_LOG_INFO_LINE
+    info_cell.font = Font(name='Helvetica Neue', size=9)
+    info_cell.alignment = Alignment(horizontal='left', vertical='center')
+    
+    # Заголовки
+    header_row_1 = 8
+    header_row_2 = 9
+    headers = {
+        f'A{header_row_1}': ('№', 'center', 'top', True, 2),
+        f'B{header_row_1}': ('Waypoint', 'left', 'top', True, 2),
+        f'C{header_row_1}': ('ALT', 'center', 'center', True, 2),
+        f'D{header_row_1}': ('HDG', 'left', 'center', False, 1),
+        f'E{header_row_1}': ('Dist.', 'left', 'center', False, 1),
+        f'F{header_row_1}': ('EFOB', 'left', 'center', False, 1),
+        f'G{header_row_1}': ('ETA', 'left', 'center', False, 1),
+        f'H{header_row_1}': ('Radio', 'left', 'top', True, 2),
+        f'D{header_row_2}': ('CRS', 'right', 'center', False, 1),
+        f'E{header_row_2}': ('Time', 'right', 'center', False, 1),
+        f'F{header_row_2}': ('AFOB', 'right', 'center', False, 1),
+        f'G{header_row_2}': ('ATA', 'right', 'center', False, 1),
+    }
+    
+    for cell_ref, (value, h_align, v_align, merge, rows) in headers.items():
+        cell = ws[cell_ref]
+        cell.value = value
+        cell.font = header_font
+        cell.alignment = Alignment(horizontal=h_align, vertical=v_align, wrap_text=False)
+        if merge:
+            col_letter = cell_ref[0]
+            start_row = int(cell_ref[1:])
+            end_row = start_row + rows - 1
+            col_idx = ord(col_letter.upper()) - ord('A') + 1
+            merge_range(ws, merged, start_row=start_row, start_column=col_idx, end_row=end_row, end_column=col_idx)
+    
+    for row in range(header_row_1, header_row_1 + 2):
+        for col in range(1, 9):
+            cell = ws.cell(row=row, column=col)
+            cell.fill = bold_gray_fill
+            cell.font = bold_font
+            cell.border = thin_border
+    
+    # Обработка строк маршрута: блок i - участок к точке i и сама точка
+    waypoints = log["waypoints"]
+    y0 = 5 + offset_rows
+    x = len(waypoints) - 1
+    
+    for i in range(1, x + 1):
+        row_offset = y0 + i * 3
+        
+        # A: номер
+        num_val = i + 1
+        a_val = f"{num_val:02d}"
+        a_cell = ws.cell(row=row_offset, column=1, value=a_val)
+        a_cell.font = default_font
+        a_cell.alignment = Alignment(horizontal='center', vertical='top')
+        
+        if i == x:
+            merge_range(ws, merged, start_row=row_offset, start_column=1, end_row=row_offset+4, end_column=1)
+        else:
+            merge_range(ws, merged, start_row=row_offset, start_column=1, end_row=row_offset+2, end_column=1)
+        
+        # B: Waypoint
+        b_val = waypoints[i]["name"]
+        b_cell = ws.cell(row=row_offset, column=2, value=b_val)
+        b_cell.font = default_font
+        b_cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+        
+        if i == x:
+            merge_range(ws, merged, start_row=row_offset, start_column=2, end_row=row_offset+4, end_column=2)
+        else:
+            merge_range(ws, merged, start_row=row_offset, start_column=2, end_row=row_offset+2, end_column=2)
+        
+        # C: ALT
+        c_val = waypoints[i]["alt"]
+        c_cell = ws.cell(row=row_offset - 1, column=3, value=c_val)
+        c_cell.font = default_font
+        c_cell.alignment = Alignment(horizontal='center', vertical='center')
+        
+        if i < x:
+            merge_range(ws, merged, start_row=row_offset - 1, start_column=3, end_row=row_offset, end_column=3)
+        
+        # D: HDG/CRS
+        d1_val = waypoints[i]["hdg"]
+        d1_cell = ws.cell(row=row_offset - 1, column=4, value=d1_val)
+        d1_cell.font = default_font
+        d1_cell.alignment = Alignment(horizontal='left', vertical='center')
+        
+        d2_val = waypoints[i]["crs"]
+        d2_cell = ws.cell(row=row_offset, column=4, value=d2_val)
+        d2_cell.font = default_font
+        d2_cell.alignment = Alignment(horizontal='right', vertical='center')
+        
+        # E: Dist/Time
+        e1_val = waypoints[i]["dist"]
+        e1_cell = ws.cell(row=row_offset - 1, column=5, value=e1_val)
+        e1_cell.font = default_font
+        e1_cell.alignment = Alignment(horizontal='left', vertical='center')
+        
+        e2_val = waypoints[i]["time"]
+        e2_cell = ws.cell(row=row_offset, column=5, value=e2_val)
+        e2_cell.font = default_font
+        e2_cell.alignment = Alignment(horizontal='right', vertical='center')
+        
+        # F: EFOB/AFOB
+        f_val = waypoints[i]["efob"]
+        f_cell = ws.cell(row=row_offset - 1, column=6, value=f_val)
+        f_cell.font = default_font
+        f_cell.alignment = Alignment(horizontal='left', vertical='center')
+        
+        # G: ETA/ATA — оставляем пустым
+        
+        # H: Radio
+        h_start = row_offset - 1
+        h_end = row_offset
+        merge_range(ws, merged, start_row=h_start, start_column=8, end_row=h_end, end_column=8)
+        h_cell = ws.cell(row=h_start, column=8)
+        h_cell.font = default_font
+        h_cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+        
+        # Последняя строка блока
+        if i < x:
+            merge_range(ws, merged, start_row=row_offset + 1, start_column=3, end_row=row_offset + 1, end_column=8)
+            merged_cell = ws.cell(row=row_offset + 1, column=3)
+            merged_cell.font = default_font
+            merged_cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+    
+    # Первый блок (вылет)
+    start_a = 3 + offset_rows
+    start_b = 3 + offset_rows
+    
+    merge_range(ws, merged, start_row=start_a, start_column=1, end_row=start_a+4, end_column=1)
+    a3 = ws.cell(row=start_a, column=1)
+    a3.value = "01"
+    a3.font = default_font
+    a3.alignment = Alignment(horizontal='center', vertical='top')
+    
+    b3_val = waypoints[0]["name"] if waypoints else None
+    merge_range(ws, merged, start_row=start_b, start_column=2, end_row=start_b+4, end_column=2)
+    b3 = ws.cell(row=start_b, column=2)
+    b3.value = b3_val
+    b3.font = default_font
+    b3.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+    
+    # Большой блок информации о вылете
+    merge_range(ws, merged, start_row=start_a, start_column=3, end_row=start_a+3, end_column=8)
+    c3 = ws.cell(row=start_a, column=3)
+    
+    text_c3 = airport_briefing("Departure", log["departure"])
+    c3.value = text_c3
+    c3.font = Font(name='Helvetica Neue', size=9)
+    c3.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+    
+    # Последний блок (прибытие)
+    final_start_row = y0 + x * 3 + 1
+    final_end_row = final_start_row + 3
+    merge_range(ws, merged, start_row=final_start_row, start_column=3, end_row=final_end_row, end_column=8)
+    final_cell = ws.cell(row=final_start_row, column=3)
+    
+    text_final = airport_briefing("Destination", log["destination"])
+    final_cell.value = text_final
+    final_cell.font = Font(name='Helvetica Neue', size=9)
+    final_cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+    
+    # Высота строк
+    last_output_row = y0 + x * 3 + 4
+    for row_num in range(1, last_output_row + 1):
+        if (start_a <= row_num <= start_a+3) or (final_start_row <= row_num <= final_end_row):
+            ws.row_dimensions[row_num].height = 15
+        else:
+            ws.row_dimensions[row_num].height = 14
+    
+    # Применение границ
+    for row in ws.iter_rows(min_row=1, max_row=last_output_row, min_col=1, max_col=8):
+        for cell in row:
+            if cell.font.size != 9:
+                cell.font = default_font
+            if cell.row <= offset_rows:
+                continue
+            cell.border = thin_border
+    
+    # Дополнительная информация внизу
+    final_info_row = final_end_row + 2
+    info_text = FLIGHT_LOG_FOOTER
+    ws.cell(row=final_info_row, column=1, value=info_text)
+    ws.cell(row=final_info_row, column=1).font = Font(name='Helvetica Neue', size=8)
+    ws.cell(row=final_info_row, column=1).alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+    merge_range(ws, merged, start_row=final_info_row, start_column=1, end_row=final_info_row, end_column=8)
+    ws.row_dimensions[final_info_row].height = 70
+    
+    # Настройка полей страницы
+    ws.page_margins = PageMargins(left=0.2, right=0.2, top=0.3, bottom=0.3, header=0.1, footer=0.1)
+    
+    # === ВСТАВКА ИЗОБРАЖЕНИЯ В ЛИСТ Generated_Sheet ===
+    header_image = log["header_image"]
+    if header_image is not None:
+        xl_img = XLImage(io.BytesIO(encode_image(header_image["png"])))
+        scale_factor = 1.8
+        xl_img.width = int(header_image["size"][0] / scale_factor)
+        xl_img.height = int(header_image["size"][1] / scale_factor)
+        xl_img.anchor = 'A1'
+        ws.add_image(xl_img)
+
+
+def leg_takeoff(takeoff, k, count):
+    """
+    Данные Takeoff для участка k из count
+    
+    Документ Takeoff один на план: сторона вылета относится к первому
+    участку, сторона прибытия - к последнему; у промежуточных участков
+    эти поля остаются пустыми. Остальные колонки (запасные ВПП) не меняются.
+    """
+    if count == 1:
+        return takeoff
+    variables_1, variables_2, *rest = takeoff["variables"]
+    return {
+        **takeoff,
+        "variables": [variables_1 if k == 0 else {}, variables_2 if k == count - 1 else {}, *rest],
+    }
+
+
+def leg_flight_logs(main, takeoff):
+    """Модели бортового журнала (flight_log_data) по участкам плана"""
+    legs = main.get("legs") or [main]
+    return [flight_log_data(leg, leg_takeoff(takeoff, k, len(legs))) for k, leg in enumerate(legs)]
+
+
+def build_workbook(main, takeoff, profile="full", numbers=None):
+    """
+    Собирает книгу Excel из результатов parse_main_document и parse_takeoff_document
+    
+    В профиле compact схемы аэродромов и снимок шапки перекодируются
+    compact_image. Справа от Main_Route_Grid выводятся высота в футах,
+    накопленные итоги и сверка строк из numbers (по умолчанию route_numbers).
+    
+    У многоучасткового плана (main["legs"]) на каждый участок свои
+    Main_Route_Grid и Generated_Sheet: Main_Route_Grid_2, Generated_Sheet_2, ...
+    
+    Args:
+        main: результат parse_main_document со схемами аэродромов
+              в main["maps"]["images"] (airport_diagrams)
+        numbers: список route_numbers по участкам (DataFrame - первого участка)
+    
+    Returns:
+        Workbook: книга с 6 листами (по 2 листа на каждый следующий участок)
+    """
+    import pandas as pd
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, PatternFill
+    from openpyxl.utils import get_column_letter
+    from openpyxl.utils.dataframe import dataframe_to_rows
+    from openpyxl.drawing.image import Image as XLImage
+    from openpyxl.worksheet.page import PageMargins
+    
+    lines = main["lines"]
+    df_airport = main["airports"]
+    maps = main["maps"]
+    legs = main.get("legs") or [main]
+    numbers = [] if numbers is None else numbers
+    numbers = [numbers] if not isinstance(numbers, list) else list(numbers)
+    numbers += [route_numbers(leg["route"]) for leg in legs[len(numbers):]]
+    log = flight_log_data(main, takeoff)
+    encode_image = compact_image if profile == "compact" else (lambda data: data)
+    
+    # === ЛИСТ 1: ОСНОВНОЕ ===
+    wb = Workbook()
+    ws1 = wb.active
+    ws1.title = "Основное"
+    ws1.cell(row=1, column=1, value=lines[0])
+    ws1.cell(row=2, column=1, value=lines[1])
+    ws1.cell(row=1, column=7, value=lines[2])
+    ws1.cell(row=2, column=7, value=lines[3])
+    
+    block1 = lines[4:18]
+    if len(block1) == 14:
+        for col in range(7):
+            ws1.cell(row=4, column=1 + col, value=block1[col * 2])
+            ws1.cell(row=5, column=1 + col, value=block1[col * 2 + 1])
+    
+    block2 = lines[18:32]
+    if len(block2) == 14:
+        for col in range(7):
+            ws1.cell(row=7, column=1 + col, value=block2[col * 2])
+            ws1.cell(row=8, column=1 + col, value=block2[col * 2 + 1])
+    
+    bold_font = Font(bold=True)
+    left_align = Alignment(horizontal="left", vertical="top")
+    right_align = Alignment(horizontal="right", vertical="top")
+    
+    ws1['A1'].font = bold_font
+    ws1['A1'].alignment = left_align
+    ws1['G1'].alignment = right_align
+    ws1['G2'].alignment = right_align
+    
+    for col in range(1, 8):
+        ws1.cell(row=4, column=col).font = bold_font
+        ws1.cell(row=4, column=col).alignment = left_align
+        ws1.cell(row=7, column=col).font = bold_font
+        ws1.cell(row=7, column=col).alignment = left_align
+    
+    for row in [2, 5, 8]:
         for col in range(1, 8):
-            ws1.cell(row=4, column=col).font = bold_font
-            ws1.cell(row=4, column=col).alignment = left_align
-            ws1.cell(row=7, column=col).font = bold_font
-            ws1.cell(row=7, column=col).alignment = left_align
-        
-        for row in [2, 5, 8]:
-            for col in range(1, 8):
-                cell = ws1.cell(row=row, column=col)
-                if cell.value is not None:
-                    cell.alignment = left_align
-        
-        col_widths = [12, 11, 20, 14, 15, 10, 13]
-        for i, w in enumerate(col_widths, start=1):
-            ws1.column_dimensions[get_column_letter(i)].width = w
-        
-        ws1.page_setup.orientation = 'portrait'
-        ws1.page_setup.paperSize = ws1.PAPERSIZE_A4
-        ws1.page_margins.left = 0.2
-        ws1.page_margins.right = 0.2
-        ws1.page_margins.top = 0.3
-        ws1.page_margins.bottom = 0.3
-        ws1.print_area = 'A1:G8'
-        ws1.page_setup.fitToWidth = 1
-        ws1.page_setup.fitToHeight = False
-        
-        # === ЛИСТ 2: ПАРСИНГ ТАБЛИЦЫ (основной файл) ===
-        page = doc_main[0]
-        all_words = page.get_text("words")
-        
-        # Поиск заголовка таблицы
-        target_y = None
-        for word_tuple in all_words:
-            x0, y0, x1, y1, text, *_ = word_tuple
-            if text == "WAYPOINT":
-                for w in all_words:
-                    wx0, wy0, wx1, wy1, wtext, *_ = w
-                    if wtext == "ACT" and abs((y0 + y1)/2 - (wy0 + wy1)/2) < 5 and wx0 > x0:
-                        target_y = (y0 + y1) / 2
-                        break
-                if target_y is not None:
-                    break
-        
-        if target_y is None:
-            for word_tuple in all_words:
-                x0, y0, x1, y1, text, *_ = word_tuple
-                if text == "MAG":
-                    target_y = (y0 + y1) / 2 + 15
-                    break
-        
-        if target_y is None:
-            raise ValueError("Не найдена строка заголовка таблицы маршрута.")
-        
-        # Извлечение заголовков
-        header_keywords = ["WAYPOINT", "AIRWAY", "HDG", "CRS", "ALT", "CMP", "DIR/SPD", "ISA", 
-                          "TAS", "GS", "LEG", "REM", "USED", "ACT", "ETE"]
-        header_words_info = []
-        tolerance = 5.0
-        
-        for word_tuple in all_words:
-            x0, y0, x1, y1, text, *_ = word_tuple
-            center_y = (y0 + y1) / 2
-            if abs(center_y - target_y) <= tolerance and text in header_keywords:
-                header_words_info.append((text, x0, x1))
-        
-        header_words_info.sort(key=lambda item: item[1])
-        
-        # Построение координат колонок XX
-        XX = []
-        for i in range(1, len(header_words_info)):
-            x1_prev = header_words_info[i-1][2]
-            x0_next = header_words_info[i][1]
-            boundary_x = (x0_next - x1_prev) / 2 + x1_prev
-            XX.append(boundary_x)
-        
-        if XX:
-            x0_airway = next((x0 for text, x0, x1 in header_words_info if text == "AIRWAY"), None)
-            if x0_airway is not None:
-                XX[0] = x0_airway - 2
-            XX.insert(0, 5)
-            XX.append(XX[-1] + 10)
-        
-        # Построение координат строк YY
-        alt_coords = None
-        for text, x0, x1 in header_words_info:
-            if text == "ALT":
-                for wx0, wy0, wx1, wy1, wtext, *_ in all_words:
-                    if wtext == "ALT" and abs(wx0 - x0) < 1 and abs(wx1 - x1) < 1:
-                        alt_coords = (wx0, wy0, wx1, wy1)
-                        break
-                if alt_coords:
-                    break
-        
-        if not alt_coords:
-            raise ValueError("Не найдены координаты слова 'ALT'.")
-        
-        x0_alt, y0_alt, x1_alt, y1_alt = alt_coords
-        y0_alternate = None
-        
-        for wx0, wy0, wx1, wy1, wtext, *_ in all_words:
-            if "ALTERNATE" in wtext:
-                y0_alternate = wy0
-                break
-        
-        if y0_alternate is None:
-            for wx0, wy0, wx1, wy1, wtext, *_ in all_words:
-                if "2000 FT" in wtext and "ISA:" in wtext:
-                    y0_alternate = wy0
-                    break
-        
-        if y0_alternate is None:
-            raise ValueError("Не найдена нижняя граница таблицы маршрута.")
-        
-        YY = []
-        for wx0, wy0, wx1, wy1, wtext, *_ in all_words:
-            if x0_alt <= (wx0 + wx1) / 2 <= x1_alt and y1_alt <= wy0 <= y0_alternate:
-                if wtext != "ALT" and "ALTERNATE" not in wtext and "2000 FT" not in wtext:
-                    YY.append(wy0 - 2)
-        YY.append(y0_alternate - 2)
-        
-        # Парсинг сетки
-        num_cols = len(XX) - 1
-        num_rows = len(YY) - 1
-        exact_columns = [
-            "WAYPOINT", "AIRWAY", "HDG", "CRS", "ALT", "CMP", "DIR/SPD", "ISA",
-            "TAS", "GS", "LEG", "REM", "USED", "REM", "ACT", "LEG", "REM", "ETE", "ACT"
-        ]
-        
-        data_grid = []
-        if num_cols <= len(exact_columns):
-            for row_idx in range(num_rows):
-                row_data = [''] * len(exact_columns)
-                for col_idx in range(min(num_cols, len(exact_columns))):
-                    x_min = XX[col_idx]
-                    x_max = XX[col_idx + 1]
-                    y_min = YY[row_idx]
-                    y_max = YY[row_idx + 1]
-                    cell_texts = []
-                    for word_tuple in all_words:
-                        wx0, wy0, wx1, wy1, wtext, *_ = word_tuple
-                        center_x = (wx0 + wx1) / 2
-                        center_y = (wy0 + wy1) / 2
-                        if x_min <= center_x <= x_max and y_min <= center_y <= y_max:
-                            cell_texts.append(wtext)
-                    row_data[col_idx] = ' '.join(cell_texts) if cell_texts else ''
-                data_grid.append(row_data)
-        else:
-            for row_idx in range(num_rows):
-                row_data = []
-                for col_idx in range(len(exact_columns)):
-                    x_min = XX[col_idx]
-                    x_max = XX[col_idx + 1]
-                    y_min = YY[row_idx]
-                    y_max = YY[row_idx + 1]
-                    cell_texts = []
-                    for word_tuple in all_words:
-                        wx0, wy0, wx1, wy1, wtext, *_ = word_tuple
-                        center_x = (wx0 + wx1) / 2
-                        center_y = (wy0 + wy1) / 2
-                        if x_min <= center_x <= x_max and y_min <= center_y <= y_max:
-                            cell_texts.append(wtext)
-                    row_data.append(' '.join(cell_texts) if cell_texts else '')
-                data_grid.append(row_data)
-        
-        df = pd.DataFrame(data_grid, columns=exact_columns)
+            cell = ws1.cell(row=row, column=col)
+            if cell.value is not None:
+                cell.alignment = left_align
+    
+    col_widths = [12, 11, 20, 14, 15, 10, 13]
+    for i, w in enumerate(col_widths, start=1):
+        ws1.column_dimensions[get_column_letter(i)].width = w
+    
+    ws1.page_setup.orientation = 'portrait'
+    ws1.page_setup.paperSize = ws1.PAPERSIZE_A4
+    ws1.page_margins.left = 0.2
+    ws1.page_margins.right = 0.2
+    ws1.page_margins.top = 0.3
+    ws1.page_margins.bottom = 0.3
+    ws1.print_area = 'A1:G8'
+    ws1.page_setup.fitToWidth = 1
+    ws1.page_setup.fitToHeight = False
+    
+    # === ЛИСТ 2: Main_Route_Grid (по листу на участок) ===
+    for k, leg in enumerate(legs):
+        write_route_grid_sheet(wb, leg_sheet_title("Main_Route_Grid", k), leg["route"], numbers[k])
+    
+    # === ЛИСТ 3: AIRPORT TABLE ===
+    ws3 = wb.create_sheet(title="Airport_Table")
+    
+    if df_airport is not None:
+        # Заголовки — подписи колонок из самой таблицы
+        headers = list(df_airport.columns)
         
-        # === СОЗДАНИЕ ЛИСТА 2 ===
-        ws2 = wb.create_sheet(title="Main_Route_Grid")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True)
-        align_center = Alignment(horizontal="center", vertical="center")
+        yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+        bold_font_yellow = Font(bold=True)
         
-        # Заголовки на строку 2
-        for c_idx, col_name in enumerate(df.columns, start=1):
-            cell = ws2.cell(row=2, column=c_idx, value=col_name)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = align_center
+        for col_num, value in enumerate(headers, 1):
+            cell = ws3.cell(row=1, column=col_num, value=value)
+            cell.font = bold_font_yellow
+            cell.fill = yellow_fill
         
-        # Данные — начиная со строки 3
-        for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=False), start=3):
+        # Данные
+        for r_idx, row in enumerate(dataframe_to_rows(df_airport, index=False, header=False), start=2):
             for c_idx, value in enumerate(row, start=1):
-                ws2.cell(row=r_idx, column=c_idx, value=value)
-        
-        # Стилизация и объединение строки 1
-        num_cols = len(df.columns)
-        for col_idx in range(1, num_cols + 1):
-            cell = ws2.cell(row=1, column=col_idx)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = align_center
-        
-        ws2.merge_cells(start_row=1, start_column=3, end_row=1, end_column=4)
-        ws2.cell(row=1, column=3, value="MAG")
-        ws2.merge_cells(start_row=1, start_column=6, end_row=1, end_column=7)
-        ws2.cell(row=1, column=6, value="WIND")
-        ws2.merge_cells(start_row=1, start_column=9, end_row=1, end_column=10)
-        ws2.cell(row=1, column=9, value="SPD KT")
-        ws2.merge_cells(start_row=1, start_column=11, end_row=1, end_column=12)
-        ws2.cell(row=1, column=11, value="DIST NM")
-        ws2.merge_cells(start_row=1, start_column=13, end_row=1, end_column=14)
-        ws2.cell(row=1, column=13, value="FUEL G")
-        ws2.merge_cells(start_row=1, start_column=16, end_row=1, end_column=18)
-        ws2.cell(row=1, column=16, value="TIME")
+                ws3.cell(row=r_idx, column=c_idx, value=value)
         
-        # Автоширина столбцов
-        max_col = ws2.max_column
+        # Автоширина
+        max_col = ws3.max_column
         for col_idx in range(1, max_col + 1):
             max_len = 0
-            for row in ws2.iter_rows(min_col=col_idx, max_col=col_idx, min_row=1, max_row=ws2.max_row):
+            for row in ws3.iter_rows(min_col=col_idx, max_col=col_idx, min_row=1, max_row=ws3.max_row):
                 cell = row[0]
                 if hasattr(cell, 'value') and cell.value is not None:
                     try:
@@ -503,615 +2696,676 @@ def process_two_pdfs(file1_bytes, file2_bytes, name1, name2):
                     except:
                         pass
             adjusted_width = min(max_len + 2, 50)
-            ws2.column_dimensions[get_column_letter(col_idx)].width = adjusted_width
-        
-        # === ЛИСТ 3: AIRPORT TABLE ===
-        page_with_table = None
-        for page_num in range(len(doc_main)):
-            page = doc_main.load_page(page_num)
-            text = page.get_text()
-            if "AIRPORT" in text:
-                page_with_table = page
-                break
-        
-        ws3 = wb.create_sheet(title="Airport_Table")
-        
-        if page_with_table is not None:
-            words = page_with_table.get_text("words")
-            airport_coords = None
-            for word in words:
-                if word[4].upper() == "AIRPORT":
-                    airport_coords = (word[0], word[1], word[2], word[3])
-                    break
-            
-            if airport_coords is not None:
-                XX_airport = [5, 75, 150, 200, 250, 325, 375, 425, 475, 525, 600]
-                YY_airport = []
-                YY_airport.append(airport_coords[3] + 2)
-                
-                dest_coords = None
-                for word in words:
-                    if word[4].upper() == "DEST" and word[1] > airport_coords[3]:
-                        dest_coords = (word[0], word[1], word[2], word[3])
-                        break
-                
-                if dest_coords is not None:
-                    YY_airport.append(dest_coords[1] - 2)
-                    YY_airport.append(dest_coords[3] + 2)
-                else:
-                    words_below_airport = [w for w in words if w[1] > airport_coords[3]]
-                    if words_below_airport:
-                        min_y0_below = min([w[1] for w in words_below_airport])
-                        YY_airport.append(min_y0_below - 2)
-                        YY_airport.append(min_y0_below + 15 + 2)
-                    else:
-                        YY_airport.append(airport_coords[3] + 30)
-                        YY_airport.append(airport_coords[3] + 50)
-                
-                # Извлечение текста
-                blocks = page_with_table.get_text("dict").get("blocks", [])
-                extracted_text_dict = {}
-                for block in blocks:
-                    if "lines" in block:
-                        for line in block["lines"]:
-                            for span in line["spans"]:
-                                text_content = span["text"].strip()
-                                bbox = span["bbox"]
-                                center_x = (bbox[0] + bbox[2]) / 2
-                                center_y = (bbox[1] + bbox[3]) / 2
-                                extracted_text_dict[(center_x, center_y)] = text_content
-                
-                def find_text_in_rect(x0, y0, x1, y1):
-                    found_texts = []
-                    for (cx, cy), text in extracted_text_dict.items():
-                        if x0 <= cx <= x1 and y0 <= cy <= y1:
-                            found_texts.append(text)
-                    return " ".join(found_texts).strip()
-                
-                num_cols_airport = len(XX_airport) - 1
-                num_rows_airport = len(YY_airport) - 1
-                df_data_airport = []
-                
-                for j in range(num_rows_airport):
-                    row_data = []
-                    for i in range(num_cols_airport):
-                        x_start = XX_airport[i]
-                        x_end = XX_airport[i+1]
-                        y_start = YY_airport[j]
-                        y_end = YY_airport[j+1]
-                        cell_text = find_text_in_rect(x_start, y_start, x_end, y_end)
-                        row_data.append(cell_text)
-                    df_data_airport.append(row_data)
-                
-                df_airport = pd.DataFrame(df_data_airport)
-                
-                # Заголовки
-                headers = ["", "AIRPORT", "ETA", "WX", "TWR/CTAF", "CLR", "GND", "ELEV", "RWY", "LONGEST"]
-                if len(headers) > len(df_airport.columns):
-                    headers = headers[:len(df_airport.columns)]
-                elif len(headers) < len(df_airport.columns):
-                    headers += [""] * (len(df_airport.columns) - len(headers))
-                
-                yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-                bold_font_yellow = Font(bold=True)
-                
-                for col_num, value in enumerate(headers, 1):
-                    cell = ws3.cell(row=1, column=col_num, value=value)
-                    cell.font = bold_font_yellow
-                    cell.fill = yellow_fill
-                
-                # Данные
-                for r_idx, row in enumerate(dataframe_to_rows(df_airport, index=False, header=False), start=2):
-                    for c_idx, value in enumerate(row, start=1):
-                        ws3.cell(row=r_idx, column=c_idx, value=value)
-                
-                # Автоширина
-                max_col = ws3.max_column
-                for col_idx in range(1, max_col + 1):
-                    max_len = 0
-                    for row in ws3.iter_rows(min_col=col_idx, max_col=col_idx, min_row=1, max_row=ws3.max_row):
-                        cell = row[0]
-                        if hasattr(cell, 'value') and cell.value is not None:
-                            try:
-                                max_len = max(max_len, len(str(cell.value)))
-                            except:
-                                pass
-                    adjusted_width = min(max_len + 2, 50)
-                    ws3.column_dimensions[get_column_letter(col_idx)].width = adjusted_width
-        
-        # === ЛИСТ 4: AIRPORT MAPS (последняя страница основного файла) ===
-        ws4 = wb.create_sheet(title="Airport_Maps")
-        ws4.page_margins = PageMargins(left=0.25, right=0.25, top=0.25, bottom=0.25, header=0.1, footer=0.1)
-        
-        last_page = doc_main[-1]
-        text_blocks = last_page.get_text("dict")
+            ws3.column_dimensions[get_column_letter(col_idx)].width = adjusted_width
+    
+    # === ЛИСТ 4: AIRPORT MAPS (последняя страница основного файла) ===
+    ws4 = wb.create_sheet(title="Airport_Maps")
+    ws4.page_margins = PageMargins(left=0.25, right=0.25, top=0.25, bottom=0.25, header=0.1, footer=0.1)
+    
+    ws4['A1'] = maps["dep_title"]
+    ws4['A1'].font = Font(bold=True)
+    
+    images = maps["images"]
+    if images:
+        ws4.add_image(XLImage(io.BytesIO(encode_image(images[0]))), 'A2')
+        if len(images) >= 2:
+            ws4.add_image(XLImage(io.BytesIO(encode_image(images[1]))), 'A29')
+    
+    ws4['A28'] = maps["dest_title"]
+    ws4['A28'].font = Font(bold=True)
+    ws4.column_dimensions['A'].width = 70
+    
+    # === ЛИСТ 5: ForeFlight (из файла Takeoff) ===
+    # Колонки ВПП: Left_Column, Right_Column, Column_3, ...; затем пары
+    # Variable_Name_k / Variable_Value_k по колонкам
+    columns = takeoff.get("columns") or [takeoff["left"], takeoff["right"]]
+    variables = log["variables"]
+    
+    order_of_vars = ["Runway0", "Runway", "Length", "Surface", "Wind0", "Wind", "Altimeter", "Distance", "BestRunway"]
+    
+    var_columns = {}
+    for k, side in enumerate(variables, start=1):
+        names = [f"{name}{k}" for name in order_of_vars]
+        var_columns[f"Variable_Name_{k}"] = [name if name in side else "" for name in names]
+        var_columns[f"Variable_Value_{k}"] = [side.get(name, "") for name in names]
+    df_vars = pd.DataFrame(var_columns)
+    
+    column_titles = ["Left_Column", "Right_Column"] + [f"Column_{k}" for k in range(3, len(columns) + 1)]
+    max_len_arrays = max(len(lines) for lines in columns)
+    df_arrays = pd.DataFrame({
+        title: lines + [""] * (max_len_arrays - len(lines))
+        for title, lines in zip(column_titles, columns)
+    })
+    
+    df_combined = pd.concat([df_arrays, df_vars], axis=1, sort=False).fillna("")
+    ws5 = wb.create_sheet(title="ForeFlight")
+    
+    for r_idx, row in enumerate(dataframe_to_rows(df_combined, index=False, header=True), 1):
+        for c_idx, value in enumerate(row, 1):
+            ws5.cell(row=r_idx, column=c_idx, value=value)
+    
+    for col in range(1, df_combined.shape[1] + 1):
+        ws5.column_dimensions[get_column_letter(col)].width = 25
+    
+    # === ЛИСТ 6: Generated_Sheet (по листу на участок) ===
+    for k, leg_log in enumerate(leg_flight_logs(main, takeoff)):
+        write_generated_sheet(wb, leg_sheet_title("Generated_Sheet", k), leg_log, encode_image)
+    
+    return wb
+
+
+# Ширины колонок Generated_Sheet (в символах Excel) - пропорции колонок PDF
+FLIGHT_LOG_COLUMN_WIDTHS = (5, 22, 8, 8, 8, 8, 8, 31)
+
+
+def flight_log_cells(log):
+    """
+    Разметка Generated_Sheet в виде ячеек для PDF: те же строки и объединения
+    
+    Returns:
+        tuple: (cells, row_heights) - cells: dict с r0, r1, c0, c1 (с 1, включительно),
+               text, size, bold, align, valign, border, fill;
+               row_heights: {строка: высота в пунктах}
+    """
+    cells = []
+    
+    def cell(r0, c0, text=None, r1=None, c1=None, size=11, bold=False,
+             align="left", valign="center", border=True, fill=False):
+        cells.append({
+            "r0": r0, "r1": r1 or r0, "c0": c0, "c1": c1 or c0,
+            "text": "" if text is None else str(text), "size": size, "bold": bold,
+            "align": align, "valign": valign, "border": border, "fill": fill,
+        })
+    
+    waypoints = log["waypoints"]
+    offset_rows = 7
+    y0 = 5 + offset_rows
+    x = len(waypoints) - 1
+    
+    # Информационная строка и заголовки
+    cell(offset_rows, 1, FLIGHT_LOG_INFO_LINE, c1=8, size=9, border=False)
+    header = {"bold": True, "fill": True}
+    cell(8, 1, "No", r1=9, align="center", valign="top", **header)
+    cell(8, 2, "Waypoint", r1=9, valign="top", **header)
+    cell(8, 3, "ALT", r1=9, align="center", **header)
+    for col, (top, bottom) in enumerate((("HDG", "CRS"), ("Dist.", "Time"),
+                                          ("EFOB", "AFOB"), ("ETA", "ATA")), start=4):
+        cell(8, col, top, **header)
+        cell(9, col, bottom, align="right", **header)
+    cell(8, 8, "Radio", r1=9, valign="top", **header)
+    
+    # Первый блок (вылет)
+    start_a = 3 + offset_rows
+    cell(start_a, 1, "01", r1=start_a + 4, align="center", valign="top")
+    cell(start_a, 2, waypoints[0]["name"] if waypoints else None, r1=start_a + 4, valign="top")
+    cell(start_a, 3, airport_briefing("Departure", log["departure"]),
+         r1=start_a + 3, c1=8, size=9, valign="top")
+    
+    # Блоки точек: участок к точке i (строки row_offset-1, row_offset) и сама точка
+    for i in range(1, x + 1):
+        row_offset = y0 + i * 3
+        last = i == x
+        block_end = row_offset + (4 if last else 2)
+        waypoint = waypoints[i]
+        
+        cell(row_offset, 1, f"{i + 1:02d}", r1=block_end, align="center", valign="top")
+        cell(row_offset, 2, waypoint["name"], r1=block_end, valign="top")
+        cell(row_offset - 1, 3, waypoint["alt"], r1=row_offset - 1 if last else row_offset, align="center")
+        if last:
+            cell(row_offset, 3)
+        cell(row_offset - 1, 4, waypoint["hdg"])
+        cell(row_offset, 4, waypoint["crs"], align="right")
+        cell(row_offset - 1, 5, waypoint["dist"])
+        cell(row_offset, 5, waypoint["time"], align="right")
+        cell(row_offset - 1, 6, waypoint["efob"])
+        cell(row_offset, 6)
+        cell(row_offset - 1, 7)
+        cell(row_offset, 7)
+        cell(row_offset - 1, 8, r1=row_offset)
+        if not last:
+            cell(row_offset + 1, 3, c1=8)
+    
+    # Последний блок (прибытие)
+    final_start_row = y0 + x * 3 + 1
+    final_end_row = final_start_row + 3
+    cell(final_start_row, 3, airport_briefing("Destination", log["destination"]),
+         r1=final_end_row, c1=8, size=9, valign="top")
+    
+    last_output_row = y0 + x * 3 + 4
+    final_info_row = final_end_row + 2
+    cell(final_info_row, 1, FLIGHT_LOG_FOOTER, c1=8, size=8, valign="top", border=False)
+    
+    row_heights = {}
+    for row_num in range(offset_rows, final_info_row + 1):
+        if (start_a <= row_num <= start_a + 3) or (final_start_row <= row_num <= final_end_row):
+            row_heights[row_num] = 15
+        elif row_num == final_info_row:
+            row_heights[row_num] = 70
+        else:
+            row_heights[row_num] = 14
+    
+    # Одиночные ячейки таблицы без текста - только рамка
+    covered = set()
+    for c in cells:
+        for r in range(c["r0"], c["r1"] + 1):
+            for col in range(c["c0"], c["c1"] + 1):
+                covered.add((r, col))
+    for r in range(offset_rows + 1, last_output_row + 1):
+        for col in range(1, 9):
+            if (r, col) not in covered:
+                cell(r, col)
+    
+    return cells, row_heights
+
+
+def render_flight_log_pdf(log, output=None, encode_image=None):
+    """
+    Печатный PDF бортового журнала (A4) с разметкой листа Generated_Sheet
+    
+    Рисуется напрямую PyMuPDF, без Excel. Заголовки таблицы повторяются на
+    каждой странице; объединённые ячейки на границе страницы разрезаются,
+    текст остаётся в первой части. Журнал каждого участка начинается с
+    новой страницы.
+    
+    Args:
+        log: dict - результат flight_log_data или список (leg_flight_logs)
+        output: путь или файловый объект; без него возвращаются bytes
+        encode_image: функция перекодирования снимка шапки (профиль compact)
+    
+    Returns:
+        bytes: PDF; с output - сам output
+    """
+    import fitz
+    
+    page_width, page_height = fitz.paper_size("a4")
+    margin_x, margin_y = 0.2 * 72, 0.3 * 72
+    bottom = page_height - margin_y
+    gray = (0.827, 0.827, 0.827)
+    
+    total_chars = sum(FLIGHT_LOG_COLUMN_WIDTHS)
+    col_x = [margin_x]
+    for width in FLIGHT_LOG_COLUMN_WIDTHS:
+        col_x.append(col_x[-1] + width * (page_width - 2 * margin_x) / total_chars)
+    
+    logs = log if isinstance(log, list) else [log]
+    header_rows = (8, 9)
+    
+    fonts = {False: fitz.Font("helv"), True: fitz.Font("hebo")}
+    advances = {False: {}, True: {}}
+    
+    def text_width(bold, text, size):
+        """Ширина строки по кэшу ширин глифов (Font.text_length медленный)"""
+        cache = advances[bold]
+        total = 0.0
+        for char in text:
+            advance = cache.get(char)
+            if advance is None:
+                advance = cache[char] = fonts[bold].glyph_advance(ord(char))
+            total += advance
+        return total * size
+    
+    # Страницы создаются после раскладки: сначала копятся рамки и текст
+    page_rect = fitz.Rect(0, 0, page_width, page_height)
+    pages = []
+    
+    def new_page():
+        pages.append({"rects": [], "text": fitz.TextWriter(page_rect)})
+        return len(pages) - 1
+    
+    def wrap_lines(bold, text, size, width):
+        """Перенос по словам, как wrap_text в Excel"""
         lines = []
-        for block in text_blocks["blocks"]:
-            if "lines" in block:
-                for line in block["lines"]:
-                    line_text = "".join(span["text"] for span in line["spans"])
-                    stripped = line_text.strip()
-                    if stripped:
-                        lines.append(stripped)
-        
-        text_A1 = "DEP LFMQ" if len(lines) < 2 else lines[1]
-        text_A28 = "DEST LFMV" if len(lines) < 4 else lines[3]
-        
-        ws4['A1'] = text_A1
-        ws4['A1'].font = Font(bold=True)
-        
-        # Извлечение изображений
-        image_list = last_page.get_images(full=True)
-        img_buffers = []
-        for idx, img in enumerate(image_list):
-            xref = img[0]
-            base_image = doc_main.extract_image(xref)
-            image_bytes = base_image["image"]
-            pil_img = PILImage.open(io.BytesIO(image_bytes))
-            pil_img = pil_img.resize((500, 500), PILImage.LANCZOS)
-            
-            img_buffer = io.BytesIO()
-            pil_img.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
-            img_buffers.append(img_buffer)
-        
-        if img_buffers:
-            ws4.add_image(XLImage(img_buffers[0]), 'A2')
-            if len(img_buffers) >= 2:
-                ws4.add_image(XLImage(img_buffers[1]), 'A29')
-        
-        ws4['A28'] = text_A28
-        ws4['A28'].font = Font(bold=True)
-        ws4.column_dimensions['A'].width = 70
-        
-        # === ЛИСТ 5: ForeFlight (из файла Takeoff) ===
-        page_ff = doc_takeoff[0]
-        left_lines, right_lines = parse_document_with_simple_split(page_ff, "All Engines Operating")
-        
-        variables_1 = extract_variables(left_lines, "1")
-        variables_2 = extract_variables(right_lines, "2")
-        
-        if "Runway1" in variables_1:
-            runway01, new_runway1 = process_runway_variable(variables_1["Runway1"], "1")
-            variables_1["Runway01"] = runway01
-            variables_1["Runway1"] = new_runway1
-        
-        if "Runway2" in variables_2:
-            runway02, new_runway2 = process_runway_variable(variables_2["Runway2"], "2")
-            variables_2["Runway02"] = runway02
-            variables_2["Runway2"] = new_runway2
-        
-        if "Wind1" in variables_1 and "Runway01" in variables_1:
-            wind01, new_wind1 = process_wind_variable(variables_1["Wind1"], variables_1["Runway01"], "1")
-            variables_1["Wind01"] = wind01
-            variables_1["Wind1"] = new_wind1
-        
-        if "Wind2" in variables_2 and "Runway02" in variables_2:
-            wind02, new_wind2 = process_wind_variable(variables_2["Wind2"], variables_2["Runway02"], "2")
-            variables_2["Wind02"] = wind02
-            variables_2["Wind2"] = new_wind2
-        
-        order_of_vars = [
-            "Runway01", "Runway1", "Length1", "Surface1", "Wind01", "Wind1", "Altimeter1", "Distance1",
-            "Runway02", "Runway2", "Length2", "Surface2", "Wind02", "Wind2", "Altimeter2", "Distance2"
-        ]
-        
-        var_names_col3 = []
-        var_values_col4 = []
-        var_names_col5 = []
-        var_values_col6 = []
-        
-        for var_name in order_of_vars:
-            if any(var_name.endswith(suff) for suff in ["1", "01"]):
-                if var_name in variables_1:
-                    var_names_col3.append(var_name)
-                    var_values_col4.append(variables_1[var_name])
-                else:
-                    var_names_col3.append("")
-                    var_values_col4.append("")
-            elif any(var_name.endswith(suff) for suff in ["2", "02"]):
-                if var_name in variables_2:
-                    var_names_col5.append(var_name)
-                    var_values_col6.append(variables_2[var_name])
+        for paragraph in text.split("\n"):
+            line = ""
+            for word in paragraph.split(" "):
+                candidate = line + " " + word if line else word
+                if line and text_width(bold, candidate, size) > width:
+                    lines.append(line)
+                    line = word
                 else:
-                    var_names_col5.append("")
-                    var_values_col6.append("")
-        
-        max_var_len = max(len(var_names_col3), len(var_names_col5))
-        var_names_col3 += [""] * (max_var_len - len(var_names_col3))
-        var_values_col4 += [""] * (max_var_len - len(var_values_col4))
-        var_names_col5 += [""] * (max_var_len - len(var_names_col5))
-        var_values_col6 += [""] * (max_var_len - len(var_values_col6))
-        
-        df_vars = pd.DataFrame({
-            'Variable_Name_1': var_names_col3,
-            'Variable_Value_1': var_values_col4,
-            'Variable_Name_2': var_names_col5,
-            'Variable_Value_2': var_values_col6
-        })
-        
-        max_len_arrays = max(len(left_lines), len(right_lines))
-        left_extended = left_lines + [""] * (max_len_arrays - len(left_lines))
-        right_extended = right_lines + [""] * (max_len_arrays - len(right_lines))
-        
-        df_arrays = pd.DataFrame({
-            'Left_Column': left_extended,
-            'Right_Column': right_extended
-        })
-        
-        df_combined = pd.concat([df_arrays, df_vars], axis=1, sort=False).fillna("")
-        ws5 = wb.create_sheet(title="ForeFlight")
-        
-        for r_idx, row in enumerate(dataframe_to_rows(df_combined, index=False, header=True), 1):
-            for c_idx, value in enumerate(row, 1):
-                ws5.cell(row=r_idx, column=c_idx, value=value)
-        
-        for col in range(1, 7):
-            ws5.column_dimensions[get_column_letter(col)].width = 25
-        
-        # === ЛИСТ 6: Generated_Sheet ===
-        new_sheet_name = "Generated_Sheet"
-        if new_sheet_name in wb.sheetnames:
-            wb.remove(wb[new_sheet_name])
-        ws = wb.create_sheet(title=new_sheet_name)
-        
-        default_font = Font(name='Helvetica Neue', size=11)
-        col_widths = {'A': 5, 'B': 22, 'C': 8, 'D': 8, 'E': 8, 'F': 8, 'G': 8, 'H': 31}
-        for col, width in col_widths.items():
-            ws.column_dimensions[col].width = width
-        
-        bold_gray_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-        bold_font = Font(name='Helvetica Neue', size=11, bold=True)
-        header_font = Font(name='Helvetica Neue', size=11, bold=True)
-        
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        offset_rows = 7
-        
-        # Убираем границы у первых 7 строк
-        for row in range(1, offset_rows + 1):
-            for col in range(1, 9):
-                cell = ws.cell(row=row, column=col)
-                cell.border = Border()
-        
-        # Информационная строка
-        info_row = offset_rows
-        ws.merge_cells(start_row=info_row, start_column=1, end_row=info_row, end_column=8)
-        info_cell = ws.cell(row=info_row, column=1)
-        info_cell.value = "Tacho start: ______ Off Block: ______ Take Off: ______ Tacho end: ______ Landing: ______ On Block: ______"
-        info_cell.font = Font(name='Helvetica Neue', size=9)
-        info_cell.alignment = Alignment(horizontal='left', vertical='center')
-        
-        # Заголовки
-        header_row_1 = 8
-        header_row_2 = 9
-        headers = {
-            f'A{header_row_1}': ('№', 'center', 'top', True, 2),
-            f'B{header_row_1}': ('Waypoint', 'left', 'top', True, 2),
-            f'C{header_row_1}': ('ALT', 'center', 'center', True, 2),
-            f'D{header_row_1}': ('HDG', 'left', 'center', False, 1),
-            f'E{header_row_1}': ('Dist.', 'left', 'center', False, 1),
-            f'F{header_row_1}': ('EFOB', 'left', 'center', False, 1),
-            f'G{header_row_1}': ('ETA', 'left', 'center', False, 1),
-            f'H{header_row_1}': ('Radio', 'left', 'top', True, 2),
-            f'D{header_row_2}': ('CRS', 'right', 'center', False, 1),
-            f'E{header_row_2}': ('Time', 'right', 'center', False, 1),
-            f'F{header_row_2}': ('AFOB', 'right', 'center', False, 1),
-            f'G{header_row_2}': ('ATA', 'right', 'center', False, 1),
-        }
-        
-        for cell_ref, (value, h_align, v_align, merge, rows) in headers.items():
-            cell = ws[cell_ref]
-            cell.value = value
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal=h_align, vertical=v_align, wrap_text=False)
-            if merge:
-                col_letter = cell_ref[0]
-                start_row = int(cell_ref[1:])
-                end_row = start_row + rows - 1
-                col_idx = ord(col_letter.upper()) - ord('A') + 1
-                ws.merge_cells(start_row=start_row, start_column=col_idx, end_row=end_row, end_column=col_idx)
-        
-        for row in range(header_row_1, header_row_1 + 2):
-            for col in range(1, 9):
-                cell = ws.cell(row=row, column=col)
-                cell.fill = bold_gray_fill
-                cell.font = bold_font
-                cell.border = thin_border
-        
-        # Обработка строк маршрута
-        y0 = 5 + offset_rows
-        last_row_main = ws2.max_row
-        x = last_row_main - 3
-        
-        for i in range(1, x + 1):
-            row_offset = y0 + i * 3
-            
-            # A: номер
-            num_val = i + 1
-            a_val = f"{num_val:02d}"
-            a_cell = ws.cell(row=row_offset, column=1, value=a_val)
-            a_cell.font = default_font
-            a_cell.alignment = Alignment(horizontal='center', vertical='top')
-            
-            if i == x:
-                ws.merge_cells(start_row=row_offset, start_column=1, end_row=row_offset+4, end_column=1)
-            else:
-                ws.merge_cells(start_row=row_offset, start_column=1, end_row=row_offset+2, end_column=1)
-            
-            # B: Waypoint
-            b_val = ws2.cell(row=i+3, column=1).value
-            b_cell = ws.cell(row=row_offset, column=2, value=b_val)
-            b_cell.font = default_font
-            b_cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-            
-            if i == x:
-                ws.merge_cells(start_row=row_offset, start_column=2, end_row=row_offset+4, end_column=2)
-            else:
-                ws.merge_cells(start_row=row_offset, start_column=2, end_row=row_offset+2, end_column=2)
-            
-            # C: ALT
-            c_val = ws2.cell(row=i+3, column=5).value
-            c_cell = ws.cell(row=row_offset - 1, column=3, value=c_val)
-            c_cell.font = default_font
-            c_cell.alignment = Alignment(horizontal='center', vertical='center')
-            
-            if i < x:
-                ws.merge_cells(start_row=row_offset - 1, start_column=3, end_row=row_offset, end_column=3)
-            
-            # D: HDG/CRS
-            d1_val = ws2.cell(row=i+3, column=3).value
-            d1_cell = ws.cell(row=row_offset - 1, column=4, value=d1_val)
-            d1_cell.font = default_font
-            d1_cell.alignment = Alignment(horizontal='left', vertical='center')
-            
-            d2_val = ws2.cell(row=i+3, column=4).value
-            d2_cell = ws.cell(row=row_offset, column=4, value=d2_val)
-            d2_cell.font = default_font
-            d2_cell.alignment = Alignment(horizontal='right', vertical='center')
-            
-            # E: Dist/Time
-            e1_val = ws2.cell(row=i+3, column=11).value
-            e1_cell = ws.cell(row=row_offset - 1, column=5, value=e1_val)
-            e1_cell.font = default_font
-            e1_cell.alignment = Alignment(horizontal='left', vertical='center')
-            
-            e2_val = ws2.cell(row=i+3, column=16).value
-            e2_cell = ws.cell(row=row_offset, column=5, value=e2_val)
-            e2_cell.font = default_font
-            e2_cell.alignment = Alignment(horizontal='right', vertical='center')
-            
-            # F: EFOB/AFOB
-            f_val = ws2.cell(row=i+3, column=14).value
-            f_cell = ws.cell(row=row_offset - 1, column=6, value=f_val)
-            f_cell.font = default_font
-            f_cell.alignment = Alignment(horizontal='left', vertical='center')
-            
-            # G: ETA/ATA — оставляем пустым
-            
-            # H: Radio
-            h_start = row_offset - 1
-            h_end = row_offset
-            ws.merge_cells(start_row=h_start, start_column=8, end_row=h_end, end_column=8)
-            h_cell = ws.cell(row=h_start, column=8)
-            h_cell.font = default_font
-            h_cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-            
-            # Последняя строка блока
-            if i < x:
-                ws.merge_cells(start_row=row_offset + 1, start_column=3, end_row=row_offset + 1, end_column=8)
-                merged_cell = ws.cell(row=row_offset + 1, column=3)
-                merged_cell.font = default_font
-                merged_cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-        
-        # Первый блок (вылет)
-        start_a = 3 + offset_rows
-        start_b = 3 + offset_rows
-        
-        ws.merge_cells(start_row=start_a, start_column=1, end_row=start_a+4, end_column=1)
-        a3 = ws.cell(row=start_a, column=1)
-        a3.value = "01"
-        a3.font = default_font
-        a3.alignment = Alignment(horizontal='center', vertical='top')
-        
-        b3_val = ws2.cell(row=3, column=1).value
-        ws.merge_cells(start_row=start_b, start_column=2, end_row=start_b+4, end_column=2)
-        b3 = ws.cell(row=start_b, column=2)
-        b3.value = b3_val
-        b3.font = default_font
-        b3.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-        
-        # Большой блок информации о вылете
-        ws.merge_cells(start_row=start_a, start_column=3, end_row=start_a+3, end_column=8)
-        c3 = ws.cell(row=start_a, column=3)
-        
-        h2_val_raw = ws3['H2'].value
-        try:
-            h2_val = round(float(h2_val_raw)) if h2_val_raw else 0
-        except (ValueError, TypeError):
-            h2_val = 0
-        h2_plus_300 = ((h2_val + 300) // 10 + (1 if (h2_val + 300) % 10 != 0 else 0)) * 10
-        
-        atis_val = ws3['D2'].value or "_____"
-        gnd_val = ws3['G2'].value or "_____"
-        twr_val = ws3['E2'].value or "_____"
-        exp_rwy = ws5['D2'].value or "_____"
-        rwy = ws5['D3'].value or "_____"
-        length = ws5['D4'].value or "_____"
-        req_dist = ws5['D9'].value or "_____"
-        surface = ws5['D5'].value or "_____"
-        exp_wind = ws5['D7'].value or "_____"
-        exp_qnh = ws5['D8'].value or "_____"
-        
-        text_c3 = (
-            f"Departure ({ws4['A1'].value}, ______,{h2_val}, {h2_plus_300}, _____ , Exp. RWY: {exp_rwy}\n"
-            f"ATIS: {atis_val}; GND: {gnd_val}; TWR: {twr_val};\n"
-            f"RWY: {rwy}; Length: {length}; Req. Dist.: {req_dist}; Surface: {surface};\n"
-            f"Exp. Wind: {exp_wind}; Exp. QNH: {exp_qnh}; Exp. TWY:_____\n"
-            f"RWY: ____ ; Wind: ________; QNH: _______; Squak: ________"
-        )
-        c3.value = text_c3
-        c3.font = Font(name='Helvetica Neue', size=9)
-        c3.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-        
-        # Последний блок (прибытие)
-        final_start_row = y0 + x * 3 + 1
-        final_end_row = final_start_row + 3
-        ws.merge_cells(start_row=final_start_row, start_column=3, end_row=final_end_row, end_column=8)
-        final_cell = ws.cell(row=final_start_row, column=3)
-        
-        h3_val_raw = ws3['H3'].value
-        try:
-            h3_val = round(float(h3_val_raw)) if h3_val_raw else 0
-        except (ValueError, TypeError):
-            h3_val = 0
-        h3_plus_300 = ((h3_val + 300) // 10 + (1 if (h3_val + 300) % 10 != 0 else 0)) * 10
-        
-        atis_val_f = ws3['D3'].value or "_____"
-        gnd_val_f = ws3['G3'].value or "_____"
-        twr_val_f = ws3['E3'].value or "_____"
-        exp_rwy_f = ws5['F2'].value or "_____"
-        rwy_f = ws5['F3'].value or "_____"
-        length_f = ws5['F4'].value or "_____"
-        req_dist_f = ws5['F9'].value or "_____"
-        surface_f = ws5['F5'].value or "_____"
-        exp_wind_f = ws5['F7'].value or "_____"
-        exp_qnh_f = ws5['F8'].value or "_____"
-        
-        text_final = (
-            f"Destination ({ws4['A28'].value}, ______,{h3_val}, {h3_plus_300}, _____ , Exp. RWY: {exp_rwy_f}\n"
-            f"ATIS: {atis_val_f}; GND: {gnd_val_f}; TWR: {twr_val_f};\n"
-            f"RWY: {rwy_f}; Length: {length_f}; Req. Dist.: {req_dist_f}; Surface: {surface_f};\n"
-            f"Exp. Wind: {exp_wind_f}; Exp. QNH: {exp_qnh_f}; Exp. TWY:_____\n"
-            f"RWY: ____ ; Wind: ________; QNH: _______; Squak: ________"
-        )
-        final_cell.value = text_final
-        final_cell.font = Font(name='Helvetica Neue', size=9)
-        final_cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+                    line = candidate
+            lines.append(line)
+        return lines
+    
+    def write_text(writer, rect, c):
+        """Текст ячейки с переносом; не помещается - шрифт уменьшается"""
+        bold = c["bold"]
+        width = rect.width - 4
+        size = c["size"]
+        while True:
+            lines = wrap_lines(bold, c["text"], size, width)
+            line_height = size * 1.15
+            fits = (len(lines) * line_height <= rect.height - 1
+                    and max(text_width(bold, line, size) for line in lines) <= width)
+            if fits or size <= 4:
+                break
+            size -= 0.5
         
-        # Высота строк
-        last_output_row = y0 + x * 3 + 4
-        for row_num in range(1, last_output_row + 1):
-            if (start_a <= row_num <= start_a+3) or (final_start_row <= row_num <= final_end_row):
-                ws.row_dimensions[row_num].height = 15
+        if c["valign"] == "center":
+            top = rect.y0 + (rect.height - len(lines) * line_height) / 2
+        else:
+            top = rect.y0 + 1
+        for n, line in enumerate(lines):
+            length = text_width(bold, line, size)
+            if c["align"] == "center":
+                x_pos = rect.x0 + (rect.width - length) / 2
+            elif c["align"] == "right":
+                x_pos = rect.x1 - 2 - length
             else:
-                ws.row_dimensions[row_num].height = 14
-        
-        # Применение границ
-        for row in ws.iter_rows(min_row=1, max_row=last_output_row, min_col=1, max_col=8):
-            for cell in row:
-                if cell.font.size != 9:
-                    cell.font = default_font
-                if cell.row <= offset_rows:
-                    continue
-                cell.border = thin_border
-        
-        # Дополнительная информация внизу
-        final_info_row = final_end_row + 2
-        info_text = (
-            "TEM (Threats error management), CANWE (Crew, Aircraft, Notam, Weather, Environment)\n"
-            "After T/O: Flaps, Lights, Engine        Approach: QNH, Mixture, Fuel, Flaps\n"
-            "Landing: Mixture, Flaps, Lights         After Landing: Heat, Light, Flaps\n"
-            "Waypoint: Top, Track, Altitude, Radio, Engine, Estimates, Area\n"
-            "Diversion: Aircraft Endurance, Terrain, Infrastructure, Weather, Airport\n"
-            "Arrival Briefing (Treats, RWY, Top Of Descent, Integration, Missed Aproach, Holding time, Landing configuration and speed, Taxiway, Apron)"
-        )
-        ws.cell(row=final_info_row, column=1, value=info_text)
-        ws.cell(row=final_info_row, column=1).font = Font(name='Helvetica Neue', size=8)
-        ws.cell(row=final_info_row, column=1).alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-        ws.merge_cells(start_row=final_info_row, start_column=1, end_row=final_info_row, end_column=8)
-        ws.row_dimensions[final_info_row].height = 70
-        
-        # Настройка полей страницы
-        ws.page_margins = PageMargins(left=0.2, right=0.2, top=0.3, bottom=0.3, header=0.1, footer=0.1)
-        
-        # === ВСТАВКА ИЗОБРАЖЕНИЯ В ЛИСТ Generated_Sheet ===
-        page = doc_main[0]
-        blocks = page.get_text("dict")["blocks"]
-        spans = []
-        for block in blocks:
-            if "lines" in block:
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        text = span["text"].strip()
-                        if text:
-                            bbox = span["bbox"]
-                            spans.append({
-                                "text": text,
-                                "x0": bbox[0],
-                                "y0": bbox[1],
-                                "x1": bbox[2],
-                                "y1": bbox[3]
-                            })
-        
-        spans.sort(key=lambda s: (s["y0"], s["x0"]))
-        
-        if spans:
-            first_span = spans[0]
-            x01 = first_span["x0"]
-            y01 = first_span["y0"]
-            
-            y02 = None
-            for span in spans:
-                if re.search(r'\bRoute\b', span["text"], re.IGNORECASE):
-                    y02 = span["y0"]
-                    break
-            
-            x02 = None
-            for i, span in enumerate(spans):
-                if re.search(r'\bLanding\s+Fuel\b', span["text"], re.IGNORECASE):
-                    x02 = span["x1"]
-                    break
-                elif re.search(r'\bLanding\b', span["text"], re.IGNORECASE):
-                    for next_span in spans[i+1:min(i+5, len(spans))]:
-                        if abs(next_span["y0"] - span["y0"]) < 5 and re.search(r'\bFuel\b', next_span["text"], re.IGNORECASE):
-                            x02 = next_span["x1"]
-                            break
-                    if x02:
-                        break
-            
-            if y02 is not None and x02 is not None:
-                clip_rect = fitz.Rect(
-                    x01 - 5,
-                    y01 - 3,
-                    x02 + 30,
-                    y02 - 15
-                )
-                
-                if clip_rect.x0 < 0: clip_rect.x0 = 0
-                if clip_rect.y0 < 0: clip_rect.y0 = 0
-                if clip_rect.x1 > page.rect.width: clip_rect.x1 = page.rect.width
-                if clip_rect.y1 > page.rect.height: clip_rect.y1 = page.rect.height
-                
-                if not clip_rect.is_empty and clip_rect.get_area() >= 1:
-                    pix = page.get_pixmap(dpi=150, clip=clip_rect)
-                    img_data = pix.tobytes("png")
-                    image = PILImage.open(io.BytesIO(img_data))
-                    
-                    img_buffer = io.BytesIO()
-                    image.save(img_buffer, format='PNG')
-                    img_buffer.seek(0)
-                    
-                    xl_img = XLImage(img_buffer)
-                    scale_factor = 1.8
-                    xl_img.width = int(image.size[0] / scale_factor)
-                    xl_img.height = int(image.size[1] / scale_factor)
-                    xl_img.anchor = 'A1'
-                    ws.add_image(xl_img)
-        
-        # === СОХРАНЕНИЕ В БАЙТЫ ===
-        output_buffer = io.BytesIO()
-        wb.save(output_buffer)
-        output_buffer.seek(0)
-        
-        return output_buffer.getvalue()
+                x_pos = rect.x0 + 2
+            baseline = top + n * line_height + size * 0.9
+            writer.append((x_pos, baseline), line, font=fonts[bold], fontsize=size)
+    
+    def draw(c, positions):
+        """Рамка, заливка и текст ячейки по частям на страницах"""
+        parts = {}
+        for row in range(c["r0"], c["r1"] + 1):
+            idx, top, bot = positions[row]
+            part = parts.setdefault(idx, [top, bot])
+            part[0], part[1] = min(part[0], top), max(part[1], bot)
+        
+        for n, (idx, (top, bot)) in enumerate(sorted(parts.items())):
+            rect = fitz.Rect(col_x[c["c0"] - 1], top, col_x[c["c1"]], bot)
+            if c["fill"] or c["border"]:
+                pages[idx]["rects"].append((rect, c["border"], c["fill"]))
+            if n == 0 and c["text"]:
+                write_text(pages[idx]["text"], rect, c)
+    
+    for log in logs:
+        cells, row_heights = flight_log_cells(log)
+        header_cells = [c for c in cells if c["r0"] in header_rows]
+        
+        # Шапка плана над таблицей: размеры как у картинки листа (масштаб 1/1.8 при 96 dpi)
+        first_page = page_idx = new_page()
+        y = margin_y
+        header_image = log["header_image"]
+        if header_image is not None:
+            width = header_image["size"][0] / 1.8 * 0.75
+            height = header_image["size"][1] / 1.8 * 0.75
+            scale = min(1.0, (page_width - 2 * margin_x) / width)
+            header_rect = fitz.Rect(margin_x, y, margin_x + width * scale, y + height * scale)
+            pages[page_idx]["image"] = (header_rect, header_image["png"])
+            y = header_rect.y1
+        y = max(y, margin_y + 6 * 14)
+        
+        # Раскладка строк по страницам: строка -> (страница, верх, низ)
+        row_pos = {}
+        for row in sorted(row_heights):
+            height = row_heights[row]
+            if y + height > bottom:
+                page_idx = new_page()
+                y = margin_y
+                if row > header_rows[-1]:
+                    repeat = {}
+                    for header_row in header_rows:
+                        repeat[header_row] = (page_idx, y, y + row_heights[header_row])
+                        y += row_heights[header_row]
+                    pages[page_idx]["header"] = repeat
+            row_pos[row] = (page_idx, y, y + height)
+            y += height
+        
+        for c in cells:
+            draw(c, row_pos)
+        for page in pages[first_page:]:
+            if "header" in page:
+                for c in header_cells:
+                    draw(c, page["header"])
+    doc = fitz.open()
+    for content in pages:
+        page = doc.new_page(width=page_width, height=page_height)
+        shape = page.new_shape()
+        for rect, border, fill in content["rects"]:
+            shape.draw_rect(rect)
+            shape.finish(width=0.5, color=(0, 0, 0) if border else None,
+                         fill=gray if fill else None)
+        shape.commit()
+        content["text"].write_text(page)
+        if "image" in content:
+            header_rect, png = content["image"]
+            page.insert_image(header_rect, stream=encode_image(png) if encode_image else png)
+    
+    # Встроенные шрифты TextWriter - только использованные глифы
+    doc.subset_fonts()
+    try:
+        if isinstance(output, (str, os.PathLike)):
+            doc.save(output, garbage=3, deflate=True)
+            return output
+        data = doc.tobytes(garbage=3, deflate=True)
+        if output is None:
+            return data
+        output.write(data)
+        return output
+    finally:
+        doc.close()
+
+
+# === ПРЕДПРОСМОТР ===
+# Группы колонок Main_Route_Grid (строка 1 листа): номер колонки с 0 -> группа
+ROUTE_GRID_GROUPS = {
+    2: "MAG", 3: "MAG", 5: "WIND", 6: "WIND", 8: "SPD KT", 9: "SPD KT",
+    10: "DIST NM", 11: "DIST NM", 12: "FUEL G", 13: "FUEL G", 15: "TIME", 16: "TIME", 17: "TIME",
+}
+
+
+def route_grid_preview(df, numbers):
+    """
+    Таблица листа Main_Route_Grid без книги: колонки разбора и справа
+    вычисленные колонки ROUTE_CHECK_SHEET_COLUMNS
+    
+    Имена колонок - подписи двух строк заголовка листа ("DIST NM LEG",
+    "CUMULATIVE TIME MIN"); повторяющиеся (ACT) получают номер.
+    
+    Returns:
+        pd.DataFrame: по строке на точку маршрута
+    """
+    import pandas as pd
+    
+    columns = {}
+    
+    def add(label, values):
+        name, n = label, 1
+        while name in columns:
+            n += 1
+            name = f"{label} {n}"
+        columns[name] = values
+    
+    for idx, name in enumerate(df.columns):
+        add(" ".join(filter(None, (ROUTE_GRID_GROUPS.get(idx), name))), df.iloc[:, idx].tolist())
+    
+    group = None
+    for group_label, header, name in ROUTE_CHECK_SHEET_COLUMNS:
+        group = group_label or group
+        values = numbers[name].tolist()
+        if name.endswith("_MISMATCH"):
+            values = ["MISMATCH" if value else "OK" for value in values]
+        add(f"{group} {header}", values)
+    return pd.DataFrame(columns)
+
+
+def flight_log_html(log):
+    """
+    Generated_Sheet в виде HTML-таблицы по разметке flight_log_cells: те же
+    объединения, выравнивание, заливка и относительные ширины колонок
+    
+    Returns:
+        str: <table> без внешних стилей (для st.markdown с unsafe_allow_html)
+    """
+    import html
+    
+    cells, row_heights = flight_log_cells(log)
+    rows = {}
+    for c in sorted(cells, key=lambda c: (c["r0"], c["c0"])):
+        rows.setdefault(c["r0"], []).append(c)
+    
+    total = sum(FLIGHT_LOG_COLUMN_WIDTHS)
+    parts = ['<table style="border-collapse: collapse; width: 100%; table-layout: fixed; color: black;">',
+             "<colgroup>"]
+    parts += [f'<col style="width: {100 * width / total:.1f}%">' for width in FLIGHT_LOG_COLUMN_WIDTHS]
+    parts.append("</colgroup>")
+    for row in sorted(row_heights):
+        parts.append(f'<tr style="height: {row_heights[row]}pt;">')
+        for c in rows.get(row, ()):
+            style = [
+                f"font-size: {c['size']}pt",
+                f"text-align: {c['align']}",
+                f"vertical-align: {'middle' if c['valign'] == 'center' else c['valign']}",
+                "padding: 1px 3px",
+                "border: 0.5px solid black" if c["border"] else "border: none",
+            ]
+            if c["bold"]:
+                style.append("font-weight: bold")
+            if c["fill"]:
+                style.append("background-color: #D3D3D3")
+            span = ""
+            if c["r1"] > c["r0"]:
+                span += f' rowspan="{c["r1"] - c["r0"] + 1}"'
+            if c["c1"] > c["c0"]:
+                span += f' colspan="{c["c1"] - c["c0"] + 1}"'
+            text = html.escape(c["text"]).replace("\n", "<br>")
+            parts.append(f'<td{span} style="{"; ".join(style)}">{text}</td>')
+        parts.append("</tr>")
+    parts.append("</table>")
+    return "".join(parts)
+
+
+def report_preview(main, takeoff, numbers=None):
+    """
+    Предпросмотр листов Main_Route_Grid и Generated_Sheet из разобранных
+    данных - без сборки книги, изображений и PDF
+    
+    Args:
+        numbers: route_numbers по участкам (по умолчанию считаются заново)
+    
+    Returns:
+        list[dict]: по участку - title (суффикс листов участка: "", "_2", ...),
+                    route_grid (DataFrame, route_grid_preview) и
+                    generated_sheet (HTML, flight_log_html)
+    """
+    legs = main.get("legs") or [main]
+    numbers = numbers or [route_numbers(leg["route"]) for leg in legs]
+    return [
+        {
+            "title": leg_sheet_title("", k),
+            "route_grid": route_grid_preview(leg["route"], leg_numbers),
+            "generated_sheet": flight_log_html(log),
+        }
+        for k, (leg, leg_numbers, log) in enumerate(zip(legs, numbers, leg_flight_logs(main, takeoff)))
+    ]
+
+
+def process_two_pdfs(file1, file2, name1, name2, metrics=None, store=None, output=None,
+                     profile="full", output_format="xlsx", pdf_output=None,
+                     memory_budget_mb=None, trace_memory=None, on_stage=None, record_metrics=True,
+                     on_parsed=None, page_workers=None):
+    """
+    Обрабатывает два PDF файла и возвращает байты Excel-файла (или PDF-журнала)
+    
+    Результаты разбора каждого документа кэшируются по хэшу его содержимого:
+    если изменился только файл Takeoff, основной документ повторно не разбирается.
+    
+    С output книга пишется сразу в файл (путь или двоичный файловый объект с
+    seek, например SpooledTemporaryFile) без копии всего отчёта в памяти.
+    
+    output_format="pdf" вместо книги рисует печатный журнал Generated_Sheet
+    (render_flight_log_pdf) и пропускает сборку xlsx; pdf_output - куда
+    записать такой журнал вместе с xlsx.
+    
+    Память процесса замеряется по этапам (metrics["stages"][этап]["rss_mb"],
+    "rss_peak_mb"). С memory_budget_mb этап, вышедший за бюджет, прерывает
+    обработку исключением MemoryBudgetExceeded; бюджет проверяется на границах
+    этапов и перед декодированием схем аэродромов.
+    
+    Каждый запуск, в том числе с ошибкой, учитывается в метриках процесса
+    (metrics.observe_run): число запусков и ошибок, время этапов, размеры
+    входных PDF (metrics["input_bytes"]) и отчётов.
+    
+    Многоучастковый план (таблица маршрута на нескольких страницах) даёт по
+    листам Main_Route_Grid и Generated_Sheet на участок; участки разбираются
+    параллельно в page_workers процессах, их время - в metrics["legs"].
+    
+    Args:
+        file1: первый PDF - путь, bytes, memoryview или файловый объект
+        file2: второй PDF - в тех же форматах
+        name1: str - имя первого файла
+        name2: str - имя второго файла
+        metrics: dict - если передан, заполняется метриками запуска
+                 (время этапов, попадания в кэши, итоги и расхождения
+                 маршрута в metrics["route_check"]); при попадании в кэш
+                 разбора legs заполняет cached_parse_metrics
+        store: FlightStore - если передан, разобранный план сохраняется в историю
+        output: путь или файловый объект для записи xlsx
+        profile: str - "full" или "compact" (сжатые изображения, ZIP уровня 9);
+                 размер по листам попадает в metrics["size_breakdown"]
+        output_format: str - "xlsx" или "pdf"
+        pdf_output: путь или файловый объект для PDF-журнала вместе с xlsx
+        memory_budget_mb: float - бюджет RSS, МБ; по умолчанию MEMORY_BUDGET_MB
+                          (FLIGHTLOG_MEMORY_BUDGET_MB), 0 - без ограничения
+        trace_memory: bool - добавить пики tracemalloc по этапам (py_peak_mb);
+                      по умолчанию TRACE_MEMORY (FLIGHTLOG_TRACEMALLOC=1)
+        on_stage: callable - вызывается с именем этапа в начале каждого этапа
+                  (isolation передаёт так этап родительскому процессу)
+        record_metrics: bool - учесть запуск в metrics.REGISTRY; isolation
+                        учитывает запуск в родительском процессе
+        on_parsed: callable - вызывается с report_preview после разбора и
+                   сверки маршрута, до обработки схем аэродромов, сборки
+                   книги и PDF (этап "preview")
+        page_workers: int - процессов разбора участков и страниц Takeoff;
+                      по умолчанию default_page_workers
+    
+    Returns:
+        bytes: содержимое отчёта в формате output_format; с output - сам output
+    """
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Неизвестный профиль вывода: {profile}")
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Неизвестный формат вывода: {output_format}")
+    
+    metrics = {} if metrics is None else metrics
+    timer = StageTimer(
+        metrics,
+        budget_mb=MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb,
+        trace_memory=TRACE_MEMORY if trace_memory is None else trace_memory,
+        on_stage=on_stage,
+    )
+    metrics["output_format"] = output_format
+    started = time.perf_counter()
+    error = None
+    try:
+        return _process_two_pdfs(file1, file2, name1, name2, metrics, store, output,
+                                 profile, output_format, pdf_output, timer, on_parsed, page_workers)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        timer.close()
+        if record_metrics:
+            from metrics import observe_run
+            observe_run(metrics, time.perf_counter() - started, error)
+
+
+def _process_two_pdfs(file1, file2, name1, name2, metrics, store, output,
+                      profile, output_format, pdf_output, timer, on_parsed=None, page_workers=None):
+    """Этапы process_two_pdfs с уже созданным StageTimer"""
+    # === ОТКРЫТИЕ ДОКУМЕНТОВ ===
+    timer.start("open")
+    file1, digest1 = source_digest(file1)
+    file2, digest2 = source_digest(file2)
+    doc_1 = open_pdf(file1)
+    try:
+        doc_2 = open_pdf(file2)
+    except Exception:
+        doc_1.close()
+        raise
     
+    try:
+        # === ОПРЕДЕЛЕНИЕ ФАЙЛОВ ===
+        timer.start("detect")
+        is_takeoff_1 = is_takeoff_document(doc_1)
+        is_takeoff_2 = is_takeoff_document(doc_2)
+        
+        if is_takeoff_1 == is_takeoff_2:
+            raise ValueError(
+                "Один файл должен содержать 'Takeoff' в начале, другой — нет. "
+                "Проверьте корректность загруженных файлов."
+            )
+        
+        if is_takeoff_1:
+            doc_takeoff, takeoff_name, takeoff_digest = doc_1, name1, digest1
+            doc_main, main_name, main_digest = doc_2, name2, digest2
+        else:
+            doc_takeoff, takeoff_name, takeoff_digest = doc_2, name2, digest2
+            doc_main, main_name, main_digest = doc_1, name1, digest1
+        metrics["input_bytes"] = {
+            "main": source_size(file2 if is_takeoff_1 else file1),
+            "takeoff": source_size(file1 if is_takeoff_1 else file2),
+        }
+        
+        # === РАЗБОР ДОКУМЕНТОВ (с кэшем по хэшу файла) ===
+        cache = get_document_cache()
+        cache_stats = metrics.setdefault("document_cache", {})
+        
+        timer.start("parse_main")
+        main = cached_parse(cache, f"main-{main_digest}", cache_stats, "main",
+                            lambda: parse_main_document(doc_main, timer, metrics,
+                                                        file2 if is_takeoff_1 else file1, page_workers))
+        
+        if cache_stats["main"] == "hit":
+            cached_parse_metrics(main, metrics)
+        
+        timer.start("foreflight")
+        takeoff = cached_parse(cache, f"takeoff-{takeoff_digest}", cache_stats, "takeoff",
+                               lambda: parse_takeoff_document(doc_takeoff,
+                                                              file1 if is_takeoff_1 else file2,
+                                                              page_workers))
+        
+        # === СВЕРКА МАРШРУТА ===
+        timer.start("route_check")
+        legs = main.get("legs") or [main]
+        numbers = [route_numbers(leg["route"]) for leg in legs]
+        metrics["route_check"] = route_check_summary(numbers[0])
+        if len(legs) > 1:
+            metrics["route_check"]["legs"] = [route_check_summary(leg_numbers) for leg_numbers in numbers]
+        
+        # === ПРЕДПРОСМОТР (до обработки схем и сборки книги) ===
+        if on_parsed is not None:
+            timer.start("preview")
+            on_parsed(report_preview(main, takeoff, numbers))
+        
+        # === СХЕМЫ АЭРОДРОМОВ (лист Airport_Maps; документ ещё открыт) ===
+        if output_format == "xlsx":
+            timer.start("diagrams")
+            main["maps"]["images"] = airport_diagrams(doc_main, metrics, timer)
     finally:
         # Закрываем документы
-        doc_main.close()
-        doc_takeoff.close()
+        doc_1.close()
+        doc_2.close()
+    
+    output_buffer = io.BytesIO() if output is None else None
+    target = output_buffer if output is None else output
+    
+    # === СБОРКА И СОХРАНЕНИЕ КНИГИ ===
+    if output_format == "xlsx":
+        timer.start("workbook")
+        wb = build_workbook(main, takeoff, profile, numbers)
+        
+        timer.start("save")
+        metrics["output_bytes"], metrics["size_breakdown"] = save_workbook(wb, target, profile)
+        del wb
+    
+    # === PDF-ЖУРНАЛ ===
+    if output_format == "pdf" or pdf_output is not None:
+        timer.start("pdf")
+        pdf_target = target if output_format == "pdf" else pdf_output
+        is_path = isinstance(pdf_target, (str, os.PathLike))
+        start = 0 if is_path else pdf_target.tell()
+        render_flight_log_pdf(
+            leg_flight_logs(main, takeoff),
+            pdf_target,
+            encode_image=compact_image if profile == "compact" else None,
+        )
+        metrics["pdf_bytes"] = os.path.getsize(pdf_target) if is_path else pdf_target.tell() - start
+        if output_format == "pdf":
+            metrics["output_bytes"] = metrics["pdf_bytes"]
+    
+    # === СОХРАНЕНИЕ В ИСТОРИЮ ===
+    if store is not None:
+        timer.start("store")
+        # Участок многоучасткового плана - отдельный полёт в истории
+        for k, leg in enumerate(legs):
+            variables = {}
+            for side in leg_takeoff(takeoff, k, len(legs))["variables"]:
+                variables.update(side)
+            store.save_plan(
+                leg["route"],
+                airports=leg["airports"],
+                variables=variables,
+                main_name=main_name if len(legs) == 1 else f"{main_name} #{k + 1}",
+                takeoff_name=takeoff_name,
+                plan_date=main.get("date"),
+                numbers=numbers[k],
+            )
+    timer.stop()
+    
+    if output is not None:
+        return output
+    return output_buffer.getvalue()